@@ -2,7 +2,9 @@
 
 import os
 import shutil
-import csv
+import hashlib
+import json
+import warnings
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -19,6 +21,10 @@ from cc3d.player5 import Configuration
 from cc3d.player5.Simulation.CMLResultReader import CMLResultReader
 from cc3d.player5.Utilities.utils import extract_address_int_from_vtk_object
 
+from nCoVToolkit import nCoVSnapshot
+from ResultsIndexCoV2VTM import ResultsIndex
+from Simulation.ViralInfectionVTMLib import sim_data_return_key
+
 export_data_desc = {'ir_data': ['ImmuneResp'],
                     'med_diff_data': ['MedViral',
                                       'MedCyt',
@@ -85,90 +91,352 @@ def convert_files_2_dat(file_names: list) -> None:
         os.rename(name, name_csv)
 
 
-def convert_sim_data(_loc):
+def convert_sim_data(_loc, results_index=None):
+    """
+    Convert data files of a run directory to csv
+    :param _loc: run directory
+    :param results_index: results index of the parent directory of the run directory; the run directory is walked if None
+    :return: None
+    """
+    if results_index is None:
+        for _name in [x + '.dat' for x in export_data_desc.keys()]:
+            convert_files_2_csv(find_named_files(_name, _loc))
+        return
+
+    run_name = os.path.basename(os.path.normpath(_loc))
+    results_index.refresh([run_name])
     for _name in [x + '.dat' for x in export_data_desc.keys()]:
-        convert_files_2_csv(find_named_files(_name, _loc))
+        convert_files_2_csv(results_index.find_data_files(run_name, _name, refresh=False))
 
 
-def collect_trial_data(_export_name, _trial_dirs):
-    trial_data = dict()
-    param_names = export_data_desc[_export_name]
+# Results indices by results directory
+_results_indices = dict()
+
+
+def get_results_index(cov2_vtm_sim_run) -> ResultsIndex:
+    """
+    Get the results index of a batch run; the index is created once per results directory and process
+    :param cov2_vtm_sim_run: batch run
+    :return: results index
+    """
+    loc = os.path.abspath(cov2_vtm_sim_run.output_dir_root)
+    if loc not in _results_indices.keys():
+        _results_indices[loc] = ResultsIndex(loc)
+    return _results_indices[loc]
+
+
+def get_trial_run_name(cov2_vtm_sim_run, trial_idx):
+    return os.path.basename(os.path.normpath(cov2_vtm_sim_run.get_run_output_dir(trial_idx)))
+
+
+def get_sim_output_data(sim_output):
+    """
+    Get recorded simulation data from the return object of a callable simulation
+    :param sim_output: return object of a callable simulation
+    :return: dictionary of data arrays by data description; None if not available
+    """
+    if isinstance(sim_output, dict):
+        return sim_output.get(sim_data_return_key, None)
+    return None
+
+
+# Name of directory of cached parsed data files in a trial directory
+data_cache_dir_name = 'DataCache'
+
+# Extensions of data files, in order of precedence
+data_file_exts = ['.dat', '.csv']
+
+
+def parse_data_file(file_name):
+    """
+    Parse a data file written by SimDataSteppable; rows are comma-separated values of the same length
+    A trailing incomplete row, as left by an interrupted simulation, is ignored
+    :param file_name: path to data file
+    :return: data array; rows are steps, the first column is the step
+    """
+    with open(file_name, 'r') as fin:
+        lines = fin.read().splitlines()
+    lines = [x for x in lines if x.strip()]
+    if not lines:
+        return np.zeros((0, 0))
+    num_cols = lines[0].count(',') + 1
+    if lines[-1].count(',') + 1 != num_cols:
+        lines = lines[:-1]
+    # Vectorized conversion of all values at once
+    values = np.array(' '.join(lines).replace(',', ' ').split(), dtype=float)
+    if values.shape[0] != len(lines) * num_cols:
+        return np.loadtxt(lines, delimiter=',', ndmin=2)
+    return values.reshape((len(lines), num_cols))
+
+
+def read_data_file_cached(file_name, cache_dir):
+    """
+    Read a data file through a cache of its parsed data
+    Parsed data is cached as a NumPy array with the size and modification time of the data file, and is returned as a
+    read-only memory map while the data file is unchanged
+    :param file_name: path to data file
+    :param cache_dir: directory of cache
+    :return: data array; rows are steps, the first column is the step
+    """
+    file_stat = os.stat(file_name)
+    source_info = {'source': os.path.basename(file_name), 'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns}
+    cache_file = os.path.join(cache_dir, os.path.basename(file_name) + '.npy')
+    cache_info_file = cache_file + '.json'
+    try:
+        with open(cache_info_file, 'r') as fin:
+            if json.load(fin) == source_info:
+                return np.load(cache_file, mmap_mode='r')
+    except (OSError, ValueError):
+        pass
+
+    data_array = parse_data_file(file_name)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Writes of concurrent readers use their own temporary files; the cache entry is valid once its info is written
+        tmp_suffix = f'.{os.getpid()}.tmp'
+        with open(cache_file + tmp_suffix, 'wb') as fout:
+            np.save(fout, data_array)
+        os.replace(cache_file + tmp_suffix, cache_file)
+        with open(cache_info_file + tmp_suffix, 'w') as fout:
+            json.dump(source_info, fout)
+        os.replace(cache_info_file + tmp_suffix, cache_info_file)
+    except OSError:
+        pass
+    return data_array
+
+
+def read_trial_data_file(_export_name, _trial_dir):
+    """
+    Read data of a trial from file, in place and regardless of whether it was converted to csv
+    :param _export_name: data description
+    :param _trial_dir: trial directory
+    :return: data array; rows are steps, the first column is the step; None if not found
+    """
+    for ext in data_file_exts:
+        trial_file = os.path.join(_trial_dir, _export_name + ext)
+        if os.path.isfile(trial_file):
+            return read_data_file_cached(trial_file, os.path.join(_trial_dir, data_cache_dir_name))
+    return None
+
+
+def collect_trial_data(_export_name, _trial_dirs, _trial_outputs=None):
+    """
+    Collect data of trials into a dense array, from simulation outputs when available and otherwise from files in
+    trial directories
+    Steps are the union of the steps of all trials; values of missing trials and steps are NaN
+    :param _export_name: data description
+    :param _trial_dirs: trial directories
+    :param _trial_outputs: recorded simulation data of trials; see *get_sim_output_data*
+    :return: steps, and data array shaped (trial, step, variable); None if not found for any trial
+    """
     num_trials = len(_trial_dirs)
+    trial_arrays = [None] * num_trials
     for trial_idx in range(num_trials):
-        trial_data[trial_idx] = dict()
-        trial_file = os.path.join(_trial_dirs[trial_idx], _export_name + '.csv')
-        if not os.path.isfile(trial_file):
-            trial_data[trial_idx] = None
-            continue
-        with open(trial_file) as csvfile:
-            csv_reader = csv.reader(csvfile, delimiter=',')
-            for row_data in csv_reader:
-                this_mcs = int(row_data.pop(0))
-                trial_data[trial_idx][this_mcs] = dict()
-                for col_idx in range(len(row_data)):
-                    trial_data[trial_idx][this_mcs][param_names[col_idx]] = float(row_data[col_idx])
+        if _trial_outputs is not None and _trial_outputs[trial_idx] is not None:
+            trial_arrays[trial_idx] = _trial_outputs[trial_idx].get(_export_name, None)
+        else:
+            trial_arrays[trial_idx] = read_trial_data_file(_export_name, _trial_dirs[trial_idx])
+
+    trial_arrays_found = [x for x in trial_arrays if x is not None and x.shape[0] > 0]
+    if not trial_arrays_found:
+        return None, None
+
+    num_vars = len(export_data_desc[_export_name])
+    sim_mcs = np.unique(np.concatenate([x[:, 0] for x in trial_arrays_found])).astype(int)
+    trial_data = np.full((num_trials, sim_mcs.shape[0], num_vars), np.nan)
+    for trial_idx, trial_array in enumerate(trial_arrays):
+        if trial_array is not None and trial_array.shape[0] > 0:
+            trial_data[trial_idx, np.searchsorted(sim_mcs, trial_array[:, 0].astype(int)), :] = \
+                trial_array[:, 1:num_vars + 1]
 
-    return trial_data
+    return sim_mcs, trial_data
 
 
 def calculate_batch_data_stats(batch_data_summary):
+    """
+    Calculate mean and standard deviation over trials of all data in a batch data summary; missing values are ignored
+    :param batch_data_summary: batch data summary
+    :return: None
+    """
     for data_desc, data_dict in batch_data_summary.items():
-        param_names = export_data_desc[data_desc]
-        if data_dict[list(data_dict.keys())[0]] is None:
-            continue
-        sim_mcs = list(data_dict[list(data_dict.keys())[0]].keys())
-        mean_data = dict()
-        stdev_data = dict()
-        for this_mcs in sim_mcs:
-            mean_data[this_mcs] = dict()
-            stdev_data[this_mcs] = dict()
-            for param in param_names:
-                this_data = []
-                for trial_data in data_dict.values():
-                    if trial_data is not None:
-                        this_data.append(trial_data[this_mcs][param])
-
-                if this_data:
-                    mean_data[this_mcs][param] = float(np.average(this_data))
-                    stdev_data[this_mcs][param] = float(np.std(this_data))
-
-        data_dict['batchMean'] = mean_data
-        data_dict['batchStDev'] = stdev_data
+        with warnings.catch_warnings():
+            # Steps without data of any trial are NaN
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            data_dict['batchMean'] = np.nanmean(data_dict['data'], axis=0)
+            data_dict['batchStDev'] = np.nanstd(data_dict['data'], axis=0)
 
 
 def generate_batch_data_summary(cov2_vtm_sim_run, step_list=None):
+    """
+    Generate a batch data summary of a batch run
+    The summary is a dictionary by data description. Each entry is a dictionary with keys
+        'mcs': array of steps
+        'var_names': list of variable names
+        'data': data array shaped (trial, step, variable); values of missing trials and steps are NaN
+        'trial_mask': boolean array of whether data was found for each trial
+        'batchMean': mean over trials shaped (step, variable)
+        'batchStDev': standard deviation over trials shaped (step, variable)
+    :param cov2_vtm_sim_run: batch run
+    :param step_list: steps of data to include; default is all steps
+    :return: batch data summary
+    """
     trial_dirs = [cov2_vtm_sim_run.get_run_output_dir(x) for x in range(cov2_vtm_sim_run.num_runs)]
-    [convert_sim_data(trial_dir) for trial_dir in trial_dirs]
-    batch_data_summary = {data_desc: collect_trial_data(data_desc, trial_dirs) for data_desc in export_data_desc.keys()}
-    # Filter data that wasn't found at all
-    data_desc_found = {k: False for k in batch_data_summary.keys()}
-    for data_desc, data_dict in batch_data_summary.items():
-        for trial_dict in data_dict.values():
-            if trial_dict is not None:
-                data_desc_found[data_desc] = True
-                continue
-    batch_data_summary = {k: v for k, v in batch_data_summary.items() if data_desc_found[k]}
-    # Apply step filter
-    if step_list is not None:
-        for data_desc, data_dict in batch_data_summary.items():
-            for trial_idx, trial_dict in data_dict.items():
-                if trial_dict is not None:
-                    batch_data_summary[data_desc][trial_idx] = {k: v for k, v in trial_dict.items() if k in step_list}
+    # Data returned by simulations is used in memory; files are only read for trials without returned data
+    trial_outputs = [get_sim_output_data(x) for x in cov2_vtm_sim_run.sim_output]
+    batch_data_summary = dict()
+    for data_desc in export_data_desc.keys():
+        sim_mcs, trial_data = collect_trial_data(data_desc, trial_dirs, trial_outputs)
+        # Filter data that wasn't found at all
+        if sim_mcs is None:
+            continue
+        # Apply step filter
+        if step_list is not None:
+            step_mask = np.isin(sim_mcs, step_list)
+            sim_mcs = sim_mcs[step_mask]
+            trial_data = trial_data[:, step_mask, :]
+        batch_data_summary[data_desc] = {'mcs': sim_mcs,
+                                         'var_names': list(export_data_desc[data_desc]),
+                                         'data': trial_data,
+                                         'trial_mask': np.any(~np.isnan(trial_data), axis=(1, 2))}
     calculate_batch_data_stats(batch_data_summary)
     return batch_data_summary
 
 
+def find_data_desc(var_name):
+    """
+    Find the data description of a data variable
+    :param var_name: name of data variable
+    :return: data description containing the variable; None if not found
+    """
+    for k, v in export_data_desc.items():
+        if var_name in v:
+            return k
+    return None
+
+
+def get_var_data(batch_data_summary, var_name):
+    """
+    Get the data of a data variable from a batch data summary
+    :param batch_data_summary: batch data summary
+    :param var_name: name of data variable
+    :return: steps, and data array shaped (trial, step); None if not available
+    """
+    data_desc = find_data_desc(var_name)
+    assert data_desc is not None, '{} is not a recognzied data variable'.format(var_name)
+    if data_desc not in batch_data_summary.keys():
+        return None, None
+    data_dict = batch_data_summary[data_desc]
+    return data_dict['mcs'], data_dict['data'][:, :, data_dict['var_names'].index(var_name)]
+
+
+def calculate_batch_data_quantiles(batch_data_summary, var_name, quantiles):
+    """
+    Calculate quantiles over trials of a data variable; missing values are ignored
+    :param batch_data_summary: batch data summary
+    :param var_name: name of data variable
+    :param quantiles: quantiles to calculate, in [0, 1]
+    :return: array of quantiles shaped (quantile, step)
+    """
+    _, var_data = get_var_data(batch_data_summary, var_name)
+    return np.nanquantile(var_data, quantiles, axis=0)
+
+
+def calculate_batch_data_bootstrap_ci(batch_data_summary, var_name, num_samples=1000, ci_level=0.95, rng_seed=None):
+    """
+    Calculate bootstrap percentile confidence intervals of the mean over trials of a data variable
+    At each step, samples are drawn only from trials with data at the step, so that the sample size is the number of
+    trials with data. Steps are grouped by the set of trials with data (e.g., when trials end at different steps), and
+    all bootstrap samples of a group are calculated at once as weighted means, where weights are the number of times
+    each trial is drawn
+    :param batch_data_summary: batch data summary
+    :param var_name: name of data variable
+    :param num_samples: number of bootstrap samples
+    :param ci_level: confidence level
+    :param rng_seed: seed of bootstrap resampling
+    :return: lower and upper bounds of confidence intervals, each shaped (step,); NaN at steps without data
+    """
+    _, var_data = get_var_data(batch_data_summary, var_name)
+    rng = np.random.default_rng(rng_seed)
+    var_mask = ~np.isnan(var_data)
+    alpha = (1.0 - ci_level) / 2.0
+    ci_lower = np.full(shape=(var_data.shape[1],), fill_value=np.nan)
+    ci_upper = np.full(shape=(var_data.shape[1],), fill_value=np.nan)
+    masks, mask_idx = np.unique(var_mask.T, axis=0, return_inverse=True)
+    for group_idx, group_mask in enumerate(masks):
+        idx_trials = np.flatnonzero(group_mask)
+        num_trials = idx_trials.shape[0]
+        if num_trials == 0:
+            continue
+        idx_steps = np.flatnonzero(mask_idx.ravel() == group_idx)
+        weights = rng.multinomial(num_trials, [1.0 / num_trials] * num_trials, size=num_samples).astype(float)
+        sample_means = (weights @ var_data[np.ix_(idx_trials, idx_steps)]) / num_trials
+        ci_lower[idx_steps], ci_upper[idx_steps] = np.quantile(sample_means, [alpha, 1.0 - alpha], axis=0)
+    return ci_lower, ci_upper
+
+
+def _reduce_final(x):
+    has_data = ~np.isnan(x)
+    return x[np.arange(x.shape[0]), x.shape[1] - 1 - np.argmax(has_data[:, ::-1], axis=1)]
+
+
+def _reduce_initial(x):
+    has_data = ~np.isnan(x)
+    return x[np.arange(x.shape[0]), np.argmax(has_data, axis=1)]
+
+
+# Reductions of trial time series shaped (trial, step) to scalar metrics; missing values are ignored
+trial_metric_reductions = {'final': _reduce_final,
+                           'initial': _reduce_initial,
+                           'peak': lambda x: np.nanmax(x, axis=1),
+                           'min': lambda x: np.nanmin(x, axis=1),
+                           'mean': lambda x: np.nanmean(x, axis=1)}
+
+
+def calculate_trial_metric(batch_data_summary, var_name, reduction='final'):
+    """
+    Calculate a scalar metric of a data variable for each trial of a batch data summary
+    :param batch_data_summary: batch data summary
+    :param var_name: name of data variable
+    :param reduction: name of reduction of time series to scalar; see *trial_metric_reductions*
+    :return: dictionary of metric values by trial index; trials without data are omitted
+    """
+    assert reduction in trial_metric_reductions.keys(), '{} is not a recognized reduction'.format(reduction)
+
+    _, var_data = get_var_data(batch_data_summary, var_name)
+    if var_data is None:
+        return dict()
+
+    trial_idx_data = np.nonzero(np.any(~np.isnan(var_data), axis=1))[0]
+    metric_data = trial_metric_reductions[reduction](var_data[trial_idx_data, :])
+    return {int(trial_idx): float(val) for trial_idx, val in zip(trial_idx_data, metric_data)}
+
+
+def calculate_metric_ci(metric_data, ci_z=1.96):
+    """
+    Calculate the mean and normal-approximation confidence interval width of a metric over trials
+    :param metric_data: list of metric values
+    :param ci_z: standard score of confidence level (e.g., 1.96 for 95%)
+    :return: mean and full width of confidence interval; width is infinite for fewer than two values
+    """
+    num_data = len(metric_data)
+    if num_data == 0:
+        return float('nan'), float('inf')
+    mean_val = float(np.average(metric_data))
+    if num_data < 2:
+        return mean_val, float('inf')
+    return mean_val, float(2.0 * ci_z * np.std(metric_data, ddof=1) / np.sqrt(num_data))
+
+
 def generate_transient_plot_trials(batch_data_summary, data_desc, var_name):
     fig = plt.figure()
     ax = fig.add_subplot(111)
     ax.grid()
 
     data_dict = batch_data_summary[data_desc]
-    sim_mcs = list(data_dict[list(data_dict.keys())[0]].keys())
-    for trial_idx in data_dict.keys():
-        if trial_idx in ['batchMean', 'batchStDev']:
-            continue
-        y_data = [data_dict[trial_idx][this_mcs][var_name] for this_mcs in sim_mcs]
+    sim_mcs = data_dict['mcs']
+    var_idx = data_dict['var_names'].index(var_name)
+    for trial_idx in np.nonzero(data_dict['trial_mask'])[0]:
+        y_data = data_dict['data'][trial_idx, :, var_idx]
         ax.plot(sim_mcs, y_data, label='Trial {}'.format(trial_idx), marker='.')
 
     ax.set_xlabel(x_label_str_transient)
@@ -185,17 +453,14 @@ def generate_transient_plot_stat(batch_data_summary, data_desc, var_name, plot_s
     ax.grid()
 
     data_dict = batch_data_summary[data_desc]
-    sim_mcs = list(data_dict[list(data_dict.keys())[0]].keys())
-    mean_dict = data_dict['batchMean']
-    stdev_dict = data_dict['batchStDev']
+    sim_mcs = data_dict['mcs']
+    var_idx = data_dict['var_names'].index(var_name)
 
-    y_data = [mean_dict[this_mcs][var_name] for this_mcs in sim_mcs]
+    y_data = data_dict['batchMean'][:, var_idx]
     ax.plot(sim_mcs, y_data, marker='.')
     if plot_stdev:
-        yerr_data = [stdev_dict[this_mcs][var_name] for this_mcs in sim_mcs]
-        ym_data = [y_data[i] - yerr_data[i] for i in range(len(y_data))]
-        yp_data = [y_data[i] + yerr_data[i] for i in range(len(y_data))]
-        ax.fill_between(sim_mcs, ym_data, yp_data, alpha=0.5)
+        yerr_data = data_dict['batchStDev'][:, var_idx]
+        ax.fill_between(sim_mcs, y_data - yerr_data, y_data + yerr_data, alpha=0.5)
 
     ax.set_xlabel(x_label_str_transient)
     ax.set_ylabel(y_label_str[data_desc][var_name])
@@ -210,27 +475,18 @@ def generate_2var_plot_trials(batch_data_summary, var_name_hor, var_name_ver):
     ax = fig.add_subplot(111)
     ax.grid()
 
-    data_desc_hor = None
-    data_desc_ver = None
-    for k, v in export_data_desc.items():
-        if var_name_hor in v:
-            data_desc_hor = k
-        if var_name_ver in v:
-            data_desc_ver = k
+    data_desc_hor = find_data_desc(var_name_hor)
+    data_desc_ver = find_data_desc(var_name_ver)
 
-    assert data_desc_hor is not None, '{} is not a recognzied data variable'.format(data_desc_hor)
-    assert data_desc_ver is not None, '{} is not a recognzied data variable'.format(data_desc_ver)
+    assert data_desc_hor is not None, '{} is not a recognzied data variable'.format(var_name_hor)
+    assert data_desc_ver is not None, '{} is not a recognzied data variable'.format(var_name_ver)
 
-    data_dict_hor = batch_data_summary[data_desc_hor]
-    data_dict_ver = batch_data_summary[data_desc_ver]
-    sim_mcs = list(data_dict_hor[list(data_dict_hor.keys())[0]].keys())
+    _, x_data = get_var_data(batch_data_summary, var_name_hor)
+    _, y_data = get_var_data(batch_data_summary, var_name_ver)
+    trial_mask = batch_data_summary[data_desc_hor]['trial_mask'] & batch_data_summary[data_desc_ver]['trial_mask']
 
-    for trial_idx in data_dict_hor.keys():
-        if trial_idx in ['batchMean', 'batchStDev']:
-            continue
-        x_data = [data_dict_hor[trial_idx][this_mcs][var_name_hor] for this_mcs in sim_mcs]
-        y_data = [data_dict_ver[trial_idx][this_mcs][var_name_ver] for this_mcs in sim_mcs]
-        ax.plot(x_data, y_data, label='Trial {}'.format(trial_idx), marker='.')
+    for trial_idx in np.nonzero(trial_mask)[0]:
+        ax.plot(x_data[trial_idx, :], y_data[trial_idx, :], label='Trial {}'.format(trial_idx), marker='.')
 
     ax.set_xlabel(y_label_str[data_desc_hor][var_name_hor])
     ax.set_ylabel(y_label_str[data_desc_ver][var_name_ver])
@@ -246,38 +502,27 @@ def generate_2var_plot_stat(batch_data_summary, var_name_hor, var_name_ver, plot
     ax = fig.add_subplot(111)
     ax.grid()
 
-    data_desc_hor = None
-    data_desc_ver = None
-    for k, v in export_data_desc.items():
-        if var_name_hor in v:
-            data_desc_hor = k
-        if var_name_ver in v:
-            data_desc_ver = k
+    data_desc_hor = find_data_desc(var_name_hor)
+    data_desc_ver = find_data_desc(var_name_ver)
 
-    assert data_desc_hor is not None, '{} is not a recognzied data variable'.format(data_desc_hor)
-    assert data_desc_ver is not None, '{} is not a recognzied data variable'.format(data_desc_ver)
+    assert data_desc_hor is not None, '{} is not a recognzied data variable'.format(var_name_hor)
+    assert data_desc_ver is not None, '{} is not a recognzied data variable'.format(var_name_ver)
 
     data_dict_hor = batch_data_summary[data_desc_hor]
     data_dict_ver = batch_data_summary[data_desc_ver]
+    var_idx_hor = data_dict_hor['var_names'].index(var_name_hor)
+    var_idx_ver = data_dict_ver['var_names'].index(var_name_ver)
 
-    x_data = [data_dict_hor['batchMean'][k][var_name_hor]
-              for k in batch_data_summary[data_desc_hor]['batchMean'].keys()]
-    y_data = [data_dict_ver['batchMean'][k][var_name_ver]
-              for k in batch_data_summary[data_desc_ver]['batchMean'].keys()]
+    x_data = data_dict_hor['batchMean'][:, var_idx_hor]
+    y_data = data_dict_ver['batchMean'][:, var_idx_ver]
 
     ax.plot(x_data, y_data, marker='.')
     if plot_stdev:
-        xerr_data = [data_dict_hor['batchMean'][k][var_name_hor]
-                     for k in batch_data_summary[data_desc_hor]['batchStDev'].keys()]
-        yerr_data = [data_dict_ver['batchMean'][k][var_name_ver]
-                     for k in batch_data_summary[data_desc_ver]['batchStDev'].keys()]
-
-        xm_data = [x_data[i] - xerr_data[i] for i in range(len(xerr_data))]
-        xp_data = [x_data[i] + xerr_data[i] for i in range(len(xerr_data))]
-        ym_data = [y_data[i] - yerr_data[i] for i in range(len(yerr_data))]
-        yp_data = [y_data[i] + yerr_data[i] for i in range(len(yerr_data))]
-        ax.fill_between(x_data, ym_data, yp_data, alpha=0.5)
-        ax.fill_betweenx(y_data, xm_data, xp_data, alpha=0.5, color='green')
+        xerr_data = data_dict_hor['batchStDev'][:, var_idx_hor]
+        yerr_data = data_dict_ver['batchStDev'][:, var_idx_ver]
+
+        ax.fill_between(x_data, y_data - yerr_data, y_data + yerr_data, alpha=0.5)
+        ax.fill_betweenx(y_data, x_data - xerr_data, x_data + xerr_data, alpha=0.5, color='green')
 
     ax.set_xlabel(y_label_str[data_desc_hor][var_name_hor])
     ax.set_ylabel(y_label_str[data_desc_ver][var_name_ver])
@@ -286,6 +531,213 @@ def generate_2var_plot_stat(batch_data_summary, var_name_hor, var_name_ver, plot
     return fig, ax
 
 
+# Batch data summary of a figure export worker process; set once per worker by the pool initializer
+_export_batch_data_summary = None
+
+
+def _init_export_worker(batch_data_summary):
+    global _export_batch_data_summary
+    plt.switch_backend('Agg')
+    _export_batch_data_summary = batch_data_summary
+
+
+def _export_plot(plot_task, batch_data_summary=None):
+    """
+    Generate and save a figure
+    :param plot_task: tuple of plot function, plot function arguments after the batch data summary, and file name
+    :param batch_data_summary: batch data summary; default is the summary of the export worker process
+    :return: file name
+    """
+    if batch_data_summary is None:
+        batch_data_summary = _export_batch_data_summary
+    plot_fnc, plot_args, fig_name = plot_task
+    fig, _ = plot_fnc(batch_data_summary, *plot_args)
+    fig.savefig(fig_name)
+    plt.close(fig)
+    return fig_name
+
+
+def export_plots(batch_data_summary, plot_tasks: list, num_workers=1) -> None:
+    """
+    Generate and save figures, optionally in parallel
+    In parallel, figures are rendered by a pool of processes with the Agg backend, and the batch data summary is
+    passed once to each process rather than with every figure
+    :param batch_data_summary: batch data summary
+    :param plot_tasks: list of tuples of plot function, plot function arguments after the batch data summary, and
+    file name
+    :param num_workers: number of processes; figures are rendered in this process if 1
+    :return: None
+    """
+    if num_workers <= 1 or len(plot_tasks) <= 1:
+        [_export_plot(plot_task, batch_data_summary) for plot_task in plot_tasks]
+        return
+    import multiprocessing
+    with multiprocessing.Pool(processes=min(num_workers, len(plot_tasks)),
+                              initializer=_init_export_worker,
+                              initargs=(batch_data_summary,)) as pool:
+        pool.map(_export_plot, plot_tasks, chunksize=1)
+
+
+class OnlineBatchStats:
+    """
+    Streaming statistics of simulation data over trials, updated as trials complete
+    Mean and variance are updated with Welford's algorithm, and quantiles are estimated from a fixed-size reservoir
+    sample of trials, so that memory does not grow with the number of trials
+    Summaries have the same structure as a batch data summary (see generate_batch_data_summary), where trial data is
+    the reservoir sample, and can be passed to the plot functions at any time
+    """
+    def __init__(self, step_list=None, quantiles=(0.05, 0.5, 0.95), reservoir_size=100, rng_seed=None):
+        """
+        :param step_list: steps of data to include; default is all steps
+        :param quantiles: quantiles to estimate, in [0, 1]
+        :param reservoir_size: number of trials kept for quantile estimation and trial plots
+        :param rng_seed: seed of reservoir sampling
+        """
+        assert reservoir_size > 0
+
+        self.step_list = step_list
+        self.quantiles = list(quantiles)
+        self.reservoir_size = reservoir_size
+        self.num_trials = 0
+        self.__rng = np.random.default_rng(rng_seed)
+
+        # Statistics by data description; each is a dictionary of steps, counts, means, sums of squared differences,
+        # reservoir of trial data, trial indices of reservoir and number of trials seen
+        self.__stats = dict()
+
+    def __align(self, data_desc, sim_mcs):
+        # Add new steps to statistics of a data description
+        stats = self.__stats[data_desc]
+        mcs_new = np.union1d(stats['mcs'], sim_mcs)
+        if mcs_new.shape[0] == stats['mcs'].shape[0]:
+            return
+        idx = np.searchsorted(mcs_new, stats['mcs'])
+        num_vars = stats['mean'].shape[1]
+        for k, fill_val in [('count', 0), ('mean', 0.0), ('m2', 0.0)]:
+            arr = np.full((mcs_new.shape[0], num_vars), fill_val, dtype=stats[k].dtype)
+            arr[idx, :] = stats[k]
+            stats[k] = arr
+        reservoir = np.full((stats['reservoir'].shape[0], mcs_new.shape[0], num_vars), np.nan)
+        reservoir[:, idx, :] = stats['reservoir']
+        stats['reservoir'] = reservoir
+        stats['mcs'] = mcs_new
+
+    def ingest_array(self, data_desc, trial_idx, data_array):
+        """
+        Update statistics with data of a trial
+        :param data_desc: data description
+        :param trial_idx: index of trial
+        :param data_array: data array; rows are steps, the first column is the step
+        :return: None
+        """
+        num_vars = len(export_data_desc[data_desc])
+        sim_mcs = data_array[:, 0].astype(int)
+        if self.step_list is not None:
+            step_mask = np.isin(sim_mcs, self.step_list)
+            sim_mcs = sim_mcs[step_mask]
+            data_array = data_array[step_mask, :]
+        if sim_mcs.shape[0] == 0:
+            return
+
+        if data_desc not in self.__stats.keys():
+            self.__stats[data_desc] = {'mcs': np.zeros(0, dtype=int),
+                                       'count': np.zeros((0, num_vars), dtype=int),
+                                       'mean': np.zeros((0, num_vars)),
+                                       'm2': np.zeros((0, num_vars)),
+                                       'reservoir': np.zeros((0, 0, num_vars)),
+                                       'reservoir_trials': list(),
+                                       'num_seen': 0}
+        self.__align(data_desc, sim_mcs)
+        stats = self.__stats[data_desc]
+
+        x = np.full(stats['mean'].shape, np.nan)
+        x[np.searchsorted(stats['mcs'], sim_mcs), :] = data_array[:, 1:num_vars + 1]
+        has_data = ~np.isnan(x)
+
+        # Welford update
+        stats['count'] += has_data
+        delta = np.where(has_data, x - stats['mean'], 0.0)
+        stats['mean'] += np.where(has_data, delta / np.maximum(stats['count'], 1), 0.0)
+        stats['m2'] += np.where(has_data, delta * (np.where(has_data, x, 0.0) - stats['mean']), 0.0)
+
+        # Reservoir sampling of trials
+        if stats['reservoir'].shape[0] < self.reservoir_size:
+            stats['reservoir'] = np.concatenate([stats['reservoir'], x[np.newaxis, :, :]], axis=0)
+            stats['reservoir_trials'].append(trial_idx)
+        else:
+            j = self.__rng.integers(0, stats['num_seen'] + 1)
+            if j < self.reservoir_size:
+                stats['reservoir'][j, :, :] = x
+                stats['reservoir_trials'][j] = trial_idx
+        stats['num_seen'] += 1
+
+    def ingest(self, trial_idx, sim_output=None, trial_dir=None):
+        """
+        Update statistics with data of a trial, from its simulation output when available and otherwise from files
+        :param trial_idx: index of trial
+        :param sim_output: return object of trial simulation
+        :param trial_dir: trial directory
+        :return: None
+        """
+        trial_output = get_sim_output_data(sim_output)
+        for data_desc in export_data_desc.keys():
+            if trial_output is not None:
+                data_array = trial_output.get(data_desc, None)
+            elif trial_dir is not None:
+                data_array = read_trial_data_file(data_desc, trial_dir)
+            else:
+                data_array = None
+            if data_array is not None and data_array.shape[0] > 0:
+                self.ingest_array(data_desc, trial_idx, data_array)
+        self.num_trials += 1
+
+    def get_summary(self) -> dict:
+        """
+        Get a summary of current statistics
+        In addition to the entries of a batch data summary, each data description has entries
+            'trial_indices': trial indices of trial data (reservoir sample)
+            'count': number of trials with data shaped (step, variable)
+            'batchQuantiles': quantile estimates shaped (quantile, step, variable)
+        :return: summary of current statistics
+        """
+        summary = dict()
+        for data_desc, stats in self.__stats.items():
+            count = stats['count']
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    batch_mean = np.where(count > 0, stats['mean'], np.nan)
+                    batch_stdev = np.where(count > 0, np.sqrt(stats['m2'] / count), np.nan)
+                    batch_quantiles = np.nanquantile(stats['reservoir'], self.quantiles, axis=0)
+            summary[data_desc] = {'mcs': stats['mcs'].copy(),
+                                  'var_names': list(export_data_desc[data_desc]),
+                                  'data': stats['reservoir'].copy(),
+                                  'trial_mask': np.any(~np.isnan(stats['reservoir']), axis=(1, 2)),
+                                  'trial_indices': list(stats['reservoir_trials']),
+                                  'count': count.copy(),
+                                  'batchMean': batch_mean,
+                                  'batchStDev': batch_stdev,
+                                  'batchQuantiles': batch_quantiles}
+        return summary
+
+    def export_transient_plot_stat(self, fig_dir, plot_stdev=True, fig_suffix='.png', num_workers=1):
+        """
+        Export transient plots of current statistics
+        :param fig_dir: directory of figures
+        :param plot_stdev: plot standard deviation
+        :param fig_suffix: figure file suffix
+        :param num_workers: number of processes
+        :return: None
+        """
+        if not os.path.isdir(fig_dir):
+            os.makedirs(fig_dir)
+        summary = self.get_summary()
+        plot_tasks = [(generate_transient_plot_stat, (data_desc, var_name, plot_stdev),
+                       os.path.join(fig_dir, fig_save_names[data_desc][var_name] + fig_suffix_stat + fig_suffix))
+                      for data_desc, data_dict in summary.items() for var_name in data_dict['var_names']]
+        export_plots(summary, plot_tasks, num_workers)
+
+
 class CoV2VTMSimRunPost:
     """
     Renders simulation metrics data generated from executing a CallableCoV2VTM simulation batch
@@ -293,9 +745,8 @@ class CoV2VTMSimRunPost:
     def __init__(self, cov2_vtm_sim_run, step_list=None):
         self.cov2_vtm_sim_run = cov2_vtm_sim_run
 
-        # Structure is batch_data_summary[data_desc][trial_idx][this_mcs][param_name]
+        # See generate_batch_data_summary for structure
         self.batch_data_summary = generate_batch_data_summary(cov2_vtm_sim_run, step_list)
-        self.__mcs_i = list(self.batch_data_summary[list(self.batch_data_summary.keys())[0]][0].keys())[0]
 
         self.__fig_suffix = '.png'
 
@@ -306,7 +757,13 @@ class CoV2VTMSimRunPost:
         return list(self.batch_data_summary.keys())
 
     def return_param_names(self, data_desc):
-        return list(self.batch_data_summary[data_desc][0][self.__mcs_i].keys())
+        return list(self.batch_data_summary[data_desc]['var_names'])
+
+    def calculate_quantiles(self, var_name, quantiles):
+        return calculate_batch_data_quantiles(self.batch_data_summary, var_name, quantiles)
+
+    def calculate_bootstrap_ci(self, var_name, num_samples=1000, ci_level=0.95, rng_seed=None):
+        return calculate_batch_data_bootstrap_ci(self.batch_data_summary, var_name, num_samples, ci_level, rng_seed)
 
     def get_fig_root_dir(self, _loc=None, auto_make_dir=False):
         if _loc is None:
@@ -380,57 +837,67 @@ class CoV2VTMSimRunPost:
         fig_save_name_rel = 'metric_' + var_name_hor + '_and_' + var_name_ver + fig_suffix_stat + fig_suffix
         return os.path.join(fig_dir, fig_save_name_rel)
 
-    def export_transient_plot_trials(self, loc=None):
-        if loc is None:
-            loc = self.cov2_vtm_sim_run.output_dir_root
+    def get_transient_plot_trials_tasks(self, fig_dir):
+        return [(generate_transient_plot_trials, (data_desc, param_name),
+                 self.generate_transient_plot_trials_filename(data_desc, param_name, fig_dir=fig_dir))
+                for data_desc in self.get_data_descs() for param_name in self.return_param_names(data_desc)]
 
-        assert os.path.isdir(loc), "Results directory must be defined before rendering dump."
+    def get_transient_plot_stat_tasks(self, fig_dir, plot_stdev=True):
+        return [(generate_transient_plot_stat, (data_desc, param_name, plot_stdev),
+                 self.generate_transient_plot_stat_filename(data_desc, param_name, fig_dir=fig_dir))
+                for data_desc in self.get_data_descs() for param_name in self.return_param_names(data_desc)]
 
-        fig_dir = self.get_fig_root_dir(loc, auto_make_dir=True)
+    def get_2var_plot_trials_task(self, var_name_hor, var_name_ver, fig_dir):
+        return (generate_2var_plot_trials, (var_name_hor, var_name_ver),
+                self.generate_2var_plot_trials_filename(var_name_hor, var_name_ver, fig_dir=fig_dir))
 
-        for data_desc in self.get_data_descs():
-            for param_name in self.return_param_names(data_desc):
-                fig, _ = self.generate_transient_plot_trials(data_desc, param_name)
-                fig.savefig(self.generate_transient_plot_trials_filename(data_desc, param_name, fig_dir=fig_dir))
-                plt.close(fig)
+    def get_2var_plot_stat_task(self, var_name_hor, var_name_ver, fig_dir, plot_stdev=True):
+        return (generate_2var_plot_stat, (var_name_hor, var_name_ver, plot_stdev),
+                self.generate_2var_plot_stat_filename(var_name_hor, var_name_ver, fig_dir=fig_dir))
 
-    def export_transient_plot_stat(self, loc=None, plot_stdev=True):
+    def __get_export_dir(self, loc):
         if loc is None:
             loc = self.cov2_vtm_sim_run.output_dir_root
 
         assert os.path.isdir(loc), "Results directory must be defined before rendering dump."
 
-        fig_dir = self.get_fig_root_dir(loc, auto_make_dir=True)
+        return self.get_fig_root_dir(loc, auto_make_dir=True)
 
-        for data_desc in self.get_data_descs():
-            for param_name in self.return_param_names(data_desc):
-                fig, _ = self.generate_transient_plot_stat(data_desc, param_name, plot_stdev)
-                fig.savefig(self.generate_transient_plot_stat_filename(data_desc, param_name, fig_dir=fig_dir))
-                plt.close(fig)
+    def export_transient_plot_trials(self, loc=None, num_workers=1):
+        fig_dir = self.__get_export_dir(loc)
+        export_plots(self.batch_data_summary, self.get_transient_plot_trials_tasks(fig_dir), num_workers)
 
-    def export_2var_plot_trials(self, var_name_hor, var_name_ver, loc=None):
-        if loc is None:
-            loc = self.cov2_vtm_sim_run.output_dir_root
-
-        assert os.path.isdir(loc), "Results directory must be defined before rendering dump."
+    def export_transient_plot_stat(self, loc=None, plot_stdev=True, num_workers=1):
+        fig_dir = self.__get_export_dir(loc)
+        export_plots(self.batch_data_summary, self.get_transient_plot_stat_tasks(fig_dir, plot_stdev), num_workers)
 
-        fig_dir = self.get_fig_root_dir(loc, auto_make_dir=True)
-
-        fig, _ = self.generate_2var_plot_trials(var_name_hor, var_name_ver)
-        fig.savefig(self.generate_2var_plot_trials_filename(var_name_hor, var_name_ver, fig_dir=fig_dir))
-        plt.close(fig)
+    def export_2var_plot_trials(self, var_name_hor, var_name_ver, loc=None):
+        fig_dir = self.__get_export_dir(loc)
+        export_plots(self.batch_data_summary, [self.get_2var_plot_trials_task(var_name_hor, var_name_ver, fig_dir)])
 
     def export_2var_plot_stat(self, var_name_hor, var_name_ver, loc=None, plot_stdev=True):
-        if loc is None:
-            loc = self.cov2_vtm_sim_run.output_dir_root
-
-        assert os.path.isdir(loc), "Results directory must be defined before rendering dump."
-
-        fig_dir = self.get_fig_root_dir(loc, auto_make_dir=True)
+        fig_dir = self.__get_export_dir(loc)
+        export_plots(self.batch_data_summary,
+                     [self.get_2var_plot_stat_task(var_name_hor, var_name_ver, fig_dir, plot_stdev)])
 
-        fig, _ = self.generate_2var_plot_stat(var_name_hor, var_name_ver, plot_stdev)
-        fig.savefig(self.generate_2var_plot_stat_filename(var_name_hor, var_name_ver, fig_dir=fig_dir))
-        plt.close(fig)
+    def export_all_plots(self, var_pairs=None, loc=None, plot_stdev=True, num_workers=1):
+        """
+        Export transient plots of all variables and 2-variable plots of requested variable pairs in one pass
+        :param var_pairs: list of (horizontal, vertical) variable name pairs of 2-variable plots
+        :param loc: output directory
+        :param plot_stdev: plot standard deviation in statistics plots
+        :param num_workers: number of processes
+        :return: None
+        """
+        fig_dir = self.__get_export_dir(loc)
+        if var_pairs is None:
+            var_pairs = []
+        plot_tasks = self.get_transient_plot_trials_tasks(fig_dir) + \
+            self.get_transient_plot_stat_tasks(fig_dir, plot_stdev)
+        for var_name_hor, var_name_ver in var_pairs:
+            plot_tasks.append(self.get_2var_plot_trials_task(var_name_hor, var_name_ver, fig_dir))
+            plot_tasks.append(self.get_2var_plot_stat_task(var_name_hor, var_name_ver, fig_dir, plot_stdev))
+        export_plots(self.batch_data_summary, plot_tasks, num_workers)
 
 
 class CC3DUIDummy(QObject):
@@ -488,9 +955,27 @@ def get_trial_vtk_dir(cov2_vtm_sim_run, trial_idx):
     return os.path.join(cov2_vtm_sim_run.get_run_output_dir(trial_idx), f'LatticeData')
 
 
+def get_trial_snapshot_dir(cov2_vtm_sim_run, trial_idx):
+    return os.path.join(cov2_vtm_sim_run.get_run_output_dir(trial_idx), f'Snapshots')
+
+
+def render_trial_snapshots(cov2_vtm_sim_run, trial_idx, specs=None, mcs_list=None):
+    """
+    Render snapshots of a trial without VTK, Qt or Player
+    Snapshots must be enabled with the model input write_snapshot_freq
+    :param cov2_vtm_sim_run: batch run
+    :param trial_idx: index of trial
+    :param specs: rendering specifications; default is nCoVSnapshot.standard_snapshot_specs
+    :param mcs_list: simulation steps of frames to render; default is all frames
+    :return: None
+    """
+    out_dir = os.path.join(get_fig_spatial_dir(cov2_vtm_sim_run), f'run_{trial_idx}')
+    nCoVSnapshot.render_snapshots(get_trial_snapshot_dir(cov2_vtm_sim_run, trial_idx), out_dir, specs, mcs_list)
+
+
 def get_trial_vtk_mcs_list(cov2_vtm_sim_run, trial_idx):
-    vtk_files = [x for x in os.listdir(get_trial_vtk_dir(cov2_vtm_sim_run, trial_idx)) if x.endswith('.vtk')]
-    return [int(x.rstrip('.vtk').split('_')[-1]) for x in vtk_files]
+    vtk_files = get_results_index(cov2_vtm_sim_run).get_vtk_files(get_trial_run_name(cov2_vtm_sim_run, trial_idx))
+    return list(vtk_files.keys())
 
 
 class GenericDrawerFree(GenericDrawer):
@@ -516,22 +1001,164 @@ class GenericDrawerFree(GenericDrawer):
         return model, view
 
 
-# todo - add parallel rendering
+# Prefix of render manifest files in screenshot directories
+# Each rendering process writes its own manifest file, so that processes rendering frames of the same trial do not
+# overwrite each other's records; the manifest of a trial is the merge of all of its manifest files
+render_manifest_prefix = 'render_manifest_'
+
+
+def get_screenshot_spec_hashes(ss_desc_file) -> dict:
+    """
+    Get hashes of screenshot specifications of a screenshot description file
+    :param ss_desc_file: path to screenshot description file
+    :return: dictionary of hashes by screenshot name
+    """
+    with open(ss_desc_file, 'r') as fin:
+        ss_desc = json.load(fin)
+    ss_data = ss_desc.get('ScreenshotData', None) if isinstance(ss_desc, dict) else None
+    if not isinstance(ss_data, dict):
+        # Unrecognized layout; treat the description as a single specification
+        ss_data = {'*': ss_desc}
+    return {k: hashlib.sha1(json.dumps(v, sort_keys=True).encode()).hexdigest() for k, v in ss_data.items()}
+
+
+def get_rendering_manipulator_hash(gd_manipulators: list) -> str:
+    """
+    Get hash of a sequence of applied rendering manipulators
+    :param gd_manipulators: list of (trial index, step, manipulator) in order of application
+    :return: hash
+    """
+    h = hashlib.sha1()
+    for trial_idx, mcs, gd_manipulator in gd_manipulators:
+        h.update(f'{trial_idx},{mcs},{getattr(gd_manipulator, "__module__", "")},'
+                 f'{getattr(gd_manipulator, "__qualname__", repr(gd_manipulator))};'.encode())
+        code = getattr(gd_manipulator, '__code__', None)
+        if code is not None:
+            h.update(code.co_code)
+    return h.hexdigest()
+
+
+def read_render_manifest(ss_dir) -> dict:
+    """
+    Read the render manifest of a screenshot directory
+    :param ss_dir: screenshot directory
+    :return: dictionary by step of dictionaries by screenshot name of (specification hash, manipulator hash)
+    """
+    if not os.path.isdir(ss_dir):
+        return dict()
+    manifest_files = [os.path.join(ss_dir, x) for x in os.listdir(ss_dir)
+                      if x.startswith(render_manifest_prefix) and x.endswith('.json')]
+    manifest = dict()
+    # Later records take precedence
+    for manifest_file in sorted(manifest_files, key=os.path.getmtime):
+        try:
+            manifest_entries = read_render_manifest_file(manifest_file)
+        except (OSError, ValueError):
+            continue
+        for mcs, mcs_entries in manifest_entries.items():
+            manifest.setdefault(mcs, dict()).update(mcs_entries)
+    return manifest
+
+
+def read_render_manifest_file(manifest_file) -> dict:
+    """
+    Read a render manifest file
+    :param manifest_file: path to manifest file
+    :return: manifest; see *read_render_manifest*
+    """
+    if not os.path.isfile(manifest_file):
+        return dict()
+    with open(manifest_file, 'r') as fin:
+        return {int(k): {kk: tuple(vv) for kk, vv in v.items()} for k, v in json.load(fin).items()}
+
+
+def write_render_manifest(manifest_file, manifest: dict) -> None:
+    """
+    Write a render manifest file
+    :param manifest_file: path to manifest file
+    :param manifest: manifest; see *read_render_manifest*
+    :return: None
+    """
+    manifest_file_tmp = manifest_file + '.tmp'
+    with open(manifest_file_tmp, 'w') as fout:
+        json.dump({str(k): {kk: list(vv) for kk, vv in v.items()} for k, v in manifest.items()}, fout)
+    os.replace(manifest_file_tmp, manifest_file)
+
+
+def get_rendered_screenshot_steps(ss_dir) -> dict:
+    """
+    Get simulation steps of screenshot files in a screenshot directory
+    Screenshot files are expected in a subdirectory per screenshot name, and named by screenshot name and step
+    :param ss_dir: screenshot directory
+    :return: dictionary by screenshot name of sets of steps
+    """
+    if not os.path.isdir(ss_dir):
+        return dict()
+    ss_steps = dict()
+    for ss_name in os.listdir(ss_dir):
+        ss_name_dir = os.path.join(ss_dir, ss_name)
+        if not os.path.isdir(ss_name_dir):
+            continue
+        mcs_set = set()
+        for fname in os.listdir(ss_name_dir):
+            mcs_str = os.path.splitext(fname)[0][len(ss_name) + 1:]
+            if fname.startswith(ss_name + '_') and mcs_str.isdigit():
+                mcs_set.add(int(mcs_str))
+        ss_steps[ss_name] = mcs_set
+    return ss_steps
+
+
+# Renderer of a rendering worker process; created once per worker by the pool initializer
+_render_worker = None
+
+
+def _init_render_worker(cov2_vtm_sim_run, gd_manipulators):
+    global _render_worker
+    _render_worker = CallableCC3DRenderer(cov2_vtm_sim_run)
+    for trial_idx, trial_manipulators in gd_manipulators.items():
+        for mcs, gd_manipulator in trial_manipulators.items():
+            _render_worker.load_rendering_manipulator(gd_manipulator, trial_idx, mcs)
+
+
+def _render_work_unit(work_unit):
+    trial_idx, mcs_list, force = work_unit
+    num_rendered = _render_worker.render_trial_frames(trial_idx, mcs_list, force)
+    return trial_idx, num_rendered
+
+
 class CallableCC3DRenderer:
     """
     Performs CC3D rendering of data generated from executing a CallableCoV2VTM simulation batch without launching Player
+    Rendering can be distributed over multiple processes, where each process renders ranges of frames of trials with
+    its own drawer and screenshot manager
+    Rendered screenshots are recorded in a render manifest of each trial by step, screenshot specification and applied
+    manipulators, so that only missing or invalidated screenshots are rendered when rendering again
     """
     def __init__(self, cov2_vtm_sim_run):
         self.cov2_vtm_sim_run = cov2_vtm_sim_run
 
+        self.gd = None
+        self.scm = None
+        self.cml_results_reader = None
+        # Index of trial of loaded results
+        self.__trial_loaded = None
+        # Hashes of screenshot specifications of loaded results
+        self.__ss_spec_hashes = dict()
+        # Keys (trial_idx, mcs) of manipulators applied to current GenericDrawer, in order of application
+        self.__gd_manipulators_applied = []
+        self.__init_drawer()
+
+        # Methods for modifying specification of GenericDrawer
+        self.__gd_manipulators = {}
+
+    def __init_drawer(self):
         self.gd = GenericDrawerFree()
         self.scm = ScreenshotManagerCore()
         self.scm.gd = self.gd
 
         self.cml_results_reader = None
-
-        # Methods for modifying specification of GenericDrawer
-        self.__gd_manipulators = {}
+        self.__trial_loaded = None
+        self.__gd_manipulators_applied = []
 
     def get_trial_vtk_dir(self, trial_idx):
         """
@@ -569,9 +1196,12 @@ class CallableCC3DRenderer:
         :return: None
         """
 
-        lds_loc = self.get_trial_vtk_dir(trial_idx)
+        self.__trial_loaded = None
+
+        results_index = get_results_index(self.cov2_vtm_sim_run)
+        run_name = get_trial_run_name(self.cov2_vtm_sim_run, trial_idx)
 
-        lds_file = get_lattice_description_file(lds_loc)
+        lds_file = results_index.get_lds_file(run_name)
 
         if lds_file is None:
             return
@@ -584,12 +1214,7 @@ class CallableCC3DRenderer:
         self.gd.set_field_extractor(ui_dummy.fieldExtractor)
         self.cml_results_reader.extract_lattice_description_info(lds_file)
 
-        ss_desc_file = None
-        for root, dirs, names in os.walk(lds_loc):
-            for name in names:
-                if name == 'screenshots.json':
-                    ss_desc_file = os.path.join(root, name)
-                    break
+        ss_desc_file = results_index.get_screenshot_desc_file(run_name, refresh=False)
 
         if ss_desc_file is None:
             print('No screenshot description found.')
@@ -607,6 +1232,8 @@ class CallableCC3DRenderer:
 
         self.scm.get_screenshot_dir_name = get_screenshot_dir_name
         self.scm.read_screenshot_description_file(ss_desc_file)
+        self.__trial_loaded = trial_idx
+        self.__ss_spec_hashes = get_screenshot_spec_hashes(ss_desc_file)
 
     def output_screenshots(self, mcs: int) -> None:
         """
@@ -646,54 +1273,206 @@ class CallableCC3DRenderer:
 
         self.__gd_manipulators[trial_idx][mcs] = gd_manipulator
 
+    def get_rendering_manipulators(self) -> dict:
+        """
+        Get loaded rendering manipulators
+        :return: dictionary of manipulators by step by trial
+        """
+        return {k: dict(v) for k, v in self.__gd_manipulators.items()}
+
     def __get_rendering_manipulator(self, trial_idx, mcs):
         if trial_idx not in self.__gd_manipulators.keys() or mcs not in self.__gd_manipulators[trial_idx].keys():
             return None
         else:
             return self.__gd_manipulators[trial_idx][mcs]
 
-    def __render_trial(self, trial_idx):
+    def __get_rendering_manipulator_keys_before(self, trial_idx, mcs):
+        # Keys of manipulators that serial rendering applies before a frame, in order of application
+        # Manipulators only apply at steps with a frame
+        keys = []
+        for t_idx in sorted([k for k in self.__gd_manipulators.keys() if k <= trial_idx]):
+            t_mcs_list = set(get_trial_vtk_mcs_list(self.cov2_vtm_sim_run, t_idx))
+            keys.extend([(t_idx, m) for m in sorted(self.__gd_manipulators[t_idx].keys())
+                         if m in t_mcs_list and (t_idx < trial_idx or m < mcs)])
+        return keys
+
+    def __apply_rendering_manipulator(self, trial_idx, mcs):
+        gd_manipulator = self.__get_rendering_manipulator(trial_idx, mcs)
+        if gd_manipulator is not None:
+            gd_manipulator(self.gd)
+            self.__gd_manipulators_applied.append((trial_idx, mcs))
+
+    def get_trial_frames(self, trial_idx) -> list:
         """
-        Main routine to perform rendering for a trial from batch run
+        Get simulation steps of frames of a trial, in order of rendering
         :param trial_idx: index of trial
-        :return: None
+        :return: list of simulation steps
         """
-        print('CallableCC3DRenderer rendering trial {}'.format(trial_idx))
-        self.load_trial_results(trial_idx)
+        return sorted(get_trial_vtk_mcs_list(self.cov2_vtm_sim_run, trial_idx))
 
-        if self.cml_results_reader is None:
+    def __get_loaded_frames(self):
+        # Simulation steps of frames of loaded results
+        return {self.cml_results_reader.extract_mcs_number_from_file_name(x)
+                for x in self.cml_results_reader.ldsFileList}
+
+    def __get_applied_manipulator_hash(self):
+        return get_rendering_manipulator_hash([(t, m, self.__gd_manipulators[t][m])
+                                               for t, m in self.__gd_manipulators_applied])
+
+    def render_trial_frames(self, trial_idx, mcs_list=None, force=False):
+        """
+        Render frames of a trial from batch run
+        Manipulators are applied as in serial rendering of all trials in order: manipulators of previous trials and
+        previous frames are applied before the first frame, replacing the drawer when it was already manipulated
+        beyond the first frame
+        Screenshots recorded in the render manifest of the trial with the same specification and applied manipulators
+        are skipped, unless their file is missing
+        Results of the trial are reloaded when frames are requested that were not available when they were loaded
+        :param trial_idx: index of trial
+        :param mcs_list: simulation steps of frames to render; default is all frames
+        :param force: render all screenshots, regardless of the render manifest
+        :return: number of rendered frames
+        """
+        if mcs_list is None:
+            mcs_list = self.get_trial_frames(trial_idx)
+        if not mcs_list:
+            return 0
+
+        gd_manipulators_req = self.__get_rendering_manipulator_keys_before(trial_idx, min(mcs_list))
+        num_applied = len(self.__gd_manipulators_applied)
+        if self.__gd_manipulators_applied != gd_manipulators_req[:num_applied]:
+            self.__init_drawer()
+
+        mcs_set = set(mcs_list)
+        if self.__trial_loaded != trial_idx or not mcs_set.issubset(self.__get_loaded_frames()):
+            self.load_trial_results(trial_idx)
+
+        if self.cml_results_reader is None or self.__trial_loaded != trial_idx:
             print('No results loaded.')
-            return
+            return 0
+
+        for key in gd_manipulators_req[len(self.__gd_manipulators_applied):]:
+            self.__apply_rendering_manipulator(*key)
 
         ss_dir = self.scm.get_screenshot_dir_name()
-        if not os.path.isdir(ss_dir):
-            os.mkdir(ss_dir)
+        os.makedirs(ss_dir, exist_ok=True)
+
+        manifest = read_render_manifest(ss_dir)
+        manifest_file = os.path.join(ss_dir, f'{render_manifest_prefix}{os.getpid()}.json')
+        manifest_own = read_render_manifest_file(manifest_file)
+        ss_data_all = dict(self.scm.screenshotDataDict)
+        ss_steps = get_rendered_screenshot_steps(ss_dir)
+        ss_steps['*'] = set().union(*ss_steps.values())
 
+        num_rendered = 0
         file_list = self.cml_results_reader.ldsFileList
         for file_number, file_name in enumerate(file_list):
+            mcs = self.cml_results_reader.extract_mcs_number_from_file_name(file_name)
+            if mcs not in mcs_set:
+                continue
+            self.__apply_rendering_manipulator(trial_idx, mcs)
+
+            # Select screenshots that are missing or invalidated
+            manipulator_hash = self.__get_applied_manipulator_hash()
+            mcs_entries = manifest.get(mcs, dict())
+            ss_names = [k for k, v in self.__ss_spec_hashes.items()
+                        if force or mcs_entries.get(k, None) != (v, manipulator_hash)
+                        or mcs not in ss_steps.get(k, set())]
+            if not ss_names:
+                continue
+
             self.cml_results_reader.read_simulation_data_non_blocking(file_number)
             sim_data_int_addr = extract_address_int_from_vtk_object(self.cml_results_reader.simulationData)
-            mcs = self.cml_results_reader.extract_mcs_number_from_file_name(file_name)
             self.gd.field_extractor.setSimulationData(sim_data_int_addr)
-            gd_manipulator = self.__get_rendering_manipulator(trial_idx, mcs)
-            if gd_manipulator is not None:
-                gd_manipulator(self.gd)
             print('...{}'.format(mcs))
-            self.output_screenshots(mcs)
+            if '*' not in ss_names:
+                self.scm.screenshotDataDict = {k: v for k, v in ss_data_all.items() if k in ss_names}
+            try:
+                self.output_screenshots(mcs)
+            finally:
+                self.scm.screenshotDataDict = ss_data_all
+            num_rendered += 1
+
+            manifest_own.setdefault(mcs, dict()).update({k: (self.__ss_spec_hashes[k], manipulator_hash)
+                                                          for k in ss_names})
+            write_render_manifest(manifest_file, manifest_own)
+
+        return num_rendered
+
+    def __render_trial(self, trial_idx, force=False):
+        """
+        Main routine to perform rendering for a trial from batch run
+        :param trial_idx: index of trial
+        :param force: render all screenshots, regardless of the render manifest
+        :return: None
+        """
+        print('CallableCC3DRenderer rendering trial {}'.format(trial_idx))
+        self.render_trial_frames(trial_idx, force=force)
 
-    def render_results(self):
+    def generate_work_units(self, num_workers, frames_per_unit=None, force=False) -> list:
+        """
+        Generate work units of parallel rendering
+        :param num_workers: number of workers
+        :param frames_per_unit: number of frames per work unit; default distributes about four units per worker
+        :param force: render all screenshots, regardless of render manifests
+        :return: list of (trial index, list of simulation steps, force)
+        """
+        trial_frames = {trial_idx: self.get_trial_frames(trial_idx)
+                        for trial_idx in range(len(self.cov2_vtm_sim_run.get_trial_dirs()))
+                        if os.path.isdir(self.get_trial_vtk_dir(trial_idx))}
+        if frames_per_unit is None:
+            num_frames = sum([len(v) for v in trial_frames.values()])
+            frames_per_unit = max(1, -(-num_frames // (4 * num_workers)))
+        work_units = []
+        for trial_idx, mcs_list in trial_frames.items():
+            work_units.extend([(trial_idx, mcs_list[i:i + frames_per_unit], force)
+                               for i in range(0, len(mcs_list), frames_per_unit)])
+        return work_units
+
+    def render_results_parallel(self, num_workers, frames_per_unit=None, force=False):
+        """
+        Render all trials from batch run with multiple processes
+        Rendering manipulators must be picklable (e.g., module-level functions)
+        :param num_workers: number of processes
+        :param frames_per_unit: number of frames per work unit; see *generate_work_units*
+        :param force: render all screenshots, regardless of render manifests
+        :return: None
+        """
+        import multiprocessing
+        self.prep_output_dir()
+        work_units = self.generate_work_units(num_workers, frames_per_unit, force)
+        if not work_units:
+            return
+        # Workers are spawned, so that they do not inherit rendering state of this process
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(processes=min(num_workers, len(work_units)),
+                      initializer=_init_render_worker,
+                      initargs=(self.cov2_vtm_sim_run, self.get_rendering_manipulators())) as pool:
+            for trial_idx, num_frames in pool.imap_unordered(_render_work_unit, work_units):
+                print('CallableCC3DRenderer rendered {} frames of trial {}'.format(num_frames, trial_idx))
+
+    def render_results(self, num_workers=1, frames_per_unit=None, force=False):
         """
         Render all trials from batch run
+        Only screenshots that are missing or invalidated in render manifests are rendered, so that rendering can be
+        repeated while a batch is running
+        :param num_workers: number of processes; see *render_results_parallel*
+        :param frames_per_unit: number of frames per work unit of parallel rendering
+        :param force: render all screenshots, regardless of render manifests
         :return: None
         """
+        if num_workers > 1:
+            self.render_results_parallel(num_workers, frames_per_unit, force)
+            return
         self.prep_output_dir()
-        [self.__render_trial(trial_idx) for trial_idx in range(len(self.cov2_vtm_sim_run.get_trial_dirs()))]
+        [self.__render_trial(trial_idx, force) for trial_idx in range(len(self.cov2_vtm_sim_run.get_trial_dirs()))]
 
-    def render_trial_results(self, trial_idx):
+    def render_trial_results(self, trial_idx, force=False):
         """
         Render a trial from batch run
         :param trial_idx: index of trial
+        :param force: render all screenshots, regardless of the render manifest
         :return: None
         """
         self.prep_output_dir()
-        self.__render_trial(trial_idx)
+        self.__render_trial(trial_idx, force)
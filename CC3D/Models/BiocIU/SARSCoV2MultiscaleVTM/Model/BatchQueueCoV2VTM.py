@@ -0,0 +1,413 @@
+# Shared job queue for executing a CoV2VTMSimRun on multiple hosts
+# Jobs are stored in a SQLite database on a filesystem shared by all hosts. Each host launches workers that claim
+# jobs with a lease, renew the lease with heartbeats while a simulation runs, and store the result in the database.
+# Leases of workers that stop sending heartbeats (e.g., because their host failed) expire and their jobs are
+# reclaimed by other workers, resuming from the latest checkpoint of the run when available.
+#
+# Typical usage, where each host constructs the same CoV2VTMSimRun (e.g., by running the same script over SSH):
+#   Coordinating host:  init_cov2_vtm_sim_queue(sim_run, queue_fname)
+#   Every host:         run_cov2_vtm_sims_queue(sim_run, queue_fname)
+#   Coordinating host:  wait_cov2_vtm_sim_queue(queue_fname); collect_cov2_vtm_sim_queue(sim_run, queue_fname)
+#
+# Lease expiration is measured with wall-clock time, so host clocks should be synchronized to well within the lease
+# duration. SQLite requires working file locks on the shared filesystem.
+# A worker that loses the lease of a job (e.g., because its heartbeats could not reach the database) terminates its
+# simulation before the lease expires, and does not store a result or mark the run as complete, so that only the
+# worker holding the lease writes into the output directory of a run.
+
+import multiprocessing
+import os
+import pickle
+import queue
+import socket
+import sqlite3
+import threading
+import time
+
+from cc3d.CompuCellSetup.CC3DCaller import CC3DCallerWorker
+
+from CallableCoV2VTM import CoV2VTMSimRun
+
+# Job states
+job_pending = 'pending'
+job_leased = 'leased'
+job_complete = 'complete'
+job_failed = 'failed'
+
+
+class CoV2VTMJobQueue:
+    """
+    SQLite-backed job table with leases, heartbeats and reclaiming of expired leases
+    Every method opens its own connection, so that a queue can be used from multiple threads and processes
+    """
+    def __init__(self, db_fname, lease_duration=300.0, max_attempts=3, timeout=60.0):
+        """
+        :param db_fname: path to database file; should be on a filesystem shared by all hosts
+        :param lease_duration: duration of a lease (s); a job is reclaimed when its lease is not renewed in this time
+        :param max_attempts: maximum number of attempts of a job before it is marked as failed
+        :param timeout: time to wait for a database lock (s)
+        """
+        assert lease_duration > 0
+        assert max_attempts > 0
+
+        self.db_fname = db_fname
+        self.lease_duration = lease_duration
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+        with self.__connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                         'run_idx INTEGER PRIMARY KEY, '
+                         'status TEXT NOT NULL, '
+                         'worker TEXT, '
+                         'lease_expiry REAL, '
+                         'attempts INTEGER NOT NULL DEFAULT 0, '
+                         'result BLOB)')
+
+    def __connect(self):
+        conn = sqlite3.connect(self.db_fname, timeout=self.timeout, isolation_level=None)
+        return _ConnectionContext(conn)
+
+    def enqueue(self, run_list):
+        """
+        Add jobs to the queue; jobs already in the queue are not modified
+        :param run_list: list of run indices
+        :return: None
+        """
+        with self.__connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('INSERT OR IGNORE INTO jobs (run_idx, status) VALUES (?, ?)',
+                             [(int(run_idx), job_pending) for run_idx in run_list])
+            conn.execute('COMMIT')
+
+    def reclaim_expired(self, conn=None):
+        """
+        Return jobs with expired leases to the queue, or mark them as failed after the maximum number of attempts
+        :param conn: open connection in a transaction; a new transaction is used if None
+        :return: number of reclaimed jobs
+        """
+        if conn is None:
+            with self.__connect() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                num_reclaimed = self.reclaim_expired(conn)
+                conn.execute('COMMIT')
+            return num_reclaimed
+
+        now = time.time()
+        conn.execute('UPDATE jobs SET status = ?, worker = NULL, lease_expiry = NULL '
+                     'WHERE status = ? AND lease_expiry < ? AND attempts >= ?',
+                     (job_failed, job_leased, now, self.max_attempts))
+        cur = conn.execute('UPDATE jobs SET status = ?, worker = NULL, lease_expiry = NULL '
+                           'WHERE status = ? AND lease_expiry < ?',
+                           (job_pending, job_leased, now))
+        return cur.rowcount
+
+    def claim(self, worker_id):
+        """
+        Claim the next available job, reclaiming expired leases first
+        :param worker_id: identifier of claiming worker
+        :return: tuple of (run index, attempt number) of claimed job; None if no job is available
+        """
+        with self.__connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self.reclaim_expired(conn)
+            row = conn.execute('SELECT run_idx, attempts FROM jobs WHERE status = ? ORDER BY attempts, run_idx LIMIT 1',
+                               (job_pending,)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            run_idx, attempts = row
+            conn.execute('UPDATE jobs SET status = ?, worker = ?, lease_expiry = ?, attempts = ? WHERE run_idx = ?',
+                         (job_leased, worker_id, time.time() + self.lease_duration, attempts + 1, run_idx))
+            conn.execute('COMMIT')
+        return run_idx, attempts + 1
+
+    def heartbeat(self, run_idx, worker_id):
+        """
+        Renew the lease of a job
+        :param run_idx: run index of job
+        :param worker_id: identifier of worker holding the lease
+        :return: True if the lease is still held by the worker
+        """
+        with self.__connect() as conn:
+            cur = conn.execute('UPDATE jobs SET lease_expiry = ? WHERE run_idx = ? AND status = ? AND worker = ?',
+                               (time.time() + self.lease_duration, run_idx, job_leased, worker_id))
+        return cur.rowcount > 0
+
+    def complete(self, run_idx, worker_id, result):
+        """
+        Store the result of a job and mark it as complete
+        A result is only accepted from the worker holding the lease of the job
+        :param run_idx: run index of job
+        :param worker_id: identifier of worker holding the lease
+        :param result: picklable result of job
+        :return: True if the result was stored
+        """
+        with self.__connect() as conn:
+            cur = conn.execute('UPDATE jobs SET status = ?, lease_expiry = NULL, result = ? '
+                               'WHERE run_idx = ? AND status = ? AND worker = ?',
+                               (job_complete, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL),
+                                run_idx, job_leased, worker_id))
+        return cur.rowcount > 0
+
+    def fail(self, run_idx, worker_id):
+        """
+        Release a job after a failed attempt; the job is marked as failed after the maximum number of attempts
+        :param run_idx: run index of job
+        :param worker_id: identifier of worker holding the lease
+        :return: None
+        """
+        with self.__connect() as conn:
+            conn.execute('UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+                         'worker = NULL, lease_expiry = NULL '
+                         'WHERE run_idx = ? AND status = ? AND worker = ?',
+                         (self.max_attempts, job_failed, job_pending, run_idx, job_leased, worker_id))
+
+    def get_status(self) -> dict:
+        """
+        Get the number of jobs in each state
+        :return: dictionary of number of jobs by state
+        """
+        status = {k: 0 for k in [job_pending, job_leased, job_complete, job_failed]}
+        with self.__connect() as conn:
+            for k, v in conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall():
+                status[k] = v
+        return status
+
+    def num_remaining(self):
+        """
+        Get the number of jobs that are pending or leased
+        :return: number of remaining jobs
+        """
+        status = self.get_status()
+        return status[job_pending] + status[job_leased]
+
+    def get_results(self) -> dict:
+        """
+        Get the results of completed jobs
+        :return: dictionary of results by run index
+        """
+        with self.__connect() as conn:
+            rows = conn.execute('SELECT run_idx, result FROM jobs WHERE status = ?', (job_complete,)).fetchall()
+        return {run_idx: pickle.loads(result) for run_idx, result in rows}
+
+
+class _ConnectionContext:
+    """
+    Closes a connection on exit; sqlite3 connections used as context managers only commit or roll back
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and self.conn.in_transaction:
+            self.conn.execute('ROLLBACK')
+        self.conn.close()
+
+
+class _HeartbeatThread(threading.Thread):
+    """
+    Renews the lease of a job until stopped or until the lease is lost
+    The lease is considered lost when it is held by another worker, or when it was not renewed for so long that it
+    may expire before the next heartbeat; *lease_lost* is then set and heartbeats stop
+    """
+    def __init__(self, job_queue: CoV2VTMJobQueue, run_idx, worker_id, heartbeat_interval):
+        super().__init__(daemon=True)
+        self.job_queue = job_queue
+        self.run_idx = run_idx
+        self.worker_id = worker_id
+        self.heartbeat_interval = heartbeat_interval
+        self.stop_event = threading.Event()
+        self.lease_lost = threading.Event()
+
+    def run(self):
+        last_renewal = time.time()
+        while not self.stop_event.wait(self.heartbeat_interval):
+            try:
+                renewed = self.job_queue.heartbeat(self.run_idx, self.worker_id)
+            except sqlite3.OperationalError as e:
+                print(f'CoV2VTMJobQueue worker {self.worker_id} heartbeat failed: {e}')
+                renewed = None
+            if renewed:
+                last_renewal = time.time()
+            elif renewed is False or \
+                    time.time() - last_renewal > self.job_queue.lease_duration - 2 * self.heartbeat_interval:
+                print(f'CoV2VTMJobQueue worker {self.worker_id} lost lease of job {self.run_idx}')
+                self.lease_lost.set()
+                return
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def get_worker_id(worker_idx=0):
+    return f'{socket.gethostname()}_{os.getpid()}_{worker_idx}'
+
+
+def init_cov2_vtm_sim_queue(cov2_vtm_sim_run: CoV2VTMSimRun, queue_fname, run_list=None, **kwargs) -> CoV2VTMJobQueue:
+    """
+    Create a job queue of a batch run
+    :param cov2_vtm_sim_run: batch run
+    :param queue_fname: path to database file
+    :param run_list: list of run indices; default is all runs
+    :param kwargs: keyword arguments passed to CoV2VTMJobQueue
+    :return: job queue
+    """
+    if run_list is None:
+        run_list = [run_idx for run_idx in range(cov2_vtm_sim_run.num_runs)]
+    job_queue = CoV2VTMJobQueue(queue_fname, **kwargs)
+    job_queue.enqueue(run_list)
+    return job_queue
+
+
+def run_cov2_vtm_sims_queue_job(cov2_vtm_sim_run: CoV2VTMSimRun, run_idx, resume,
+                                heartbeat_thread: _HeartbeatThread, monitor_rate=1.0):
+    """
+    Execute a job in a separate process while its lease is held
+    The simulation is terminated when the lease is lost, so that it stops writing into the output directory of the
+    run before another worker reclaims the job
+    :param cov2_vtm_sim_run: batch run
+    :param run_idx: run index of job
+    :param resume: resume from the latest checkpoint of the run, if any
+    :param heartbeat_thread: running heartbeat thread of the job
+    :param monitor_rate: interval of checking for a result and the lease (s)
+    :return: result of simulation; None if the simulation failed or the lease was lost
+    """
+    tasks = multiprocessing.JoinableQueue()
+    results = multiprocessing.Queue()
+    sim_worker = CC3DCallerWorker(tasks, results)
+    sim_worker.start()
+    tasks.put(cov2_vtm_sim_run.generate_callable(run_idx, resume))
+    tasks.put(None)
+
+    result = None
+    while result is None and not heartbeat_thread.lease_lost.is_set():
+        try:
+            result = results.get(timeout=monitor_rate)
+        except queue.Empty:
+            if not sim_worker.is_alive():
+                try:
+                    result = results.get(timeout=monitor_rate)
+                except queue.Empty:
+                    pass
+                break
+
+    if heartbeat_thread.lease_lost.is_set():
+        result = None
+    if sim_worker.is_alive():
+        sim_worker.terminate()
+    sim_worker.join()
+    return result
+
+
+def run_cov2_vtm_sims_queue_worker(cov2_vtm_sim_run: CoV2VTMSimRun, queue_fname, worker_idx=0,
+                                   heartbeat_interval=None, **kwargs):
+    """
+    Execute jobs of a batch run from a job queue until the queue is drained
+    Retried jobs are resumed from the latest checkpoint of their run when available
+    Jobs of which the lease is lost are abandoned without storing results or outputs; see CoV2VTMJobQueue.complete
+    :param cov2_vtm_sim_run: batch run
+    :param queue_fname: path to database file
+    :param worker_idx: index of worker on its host
+    :param heartbeat_interval: interval of lease renewal (s); must be less than half of the lease duration; default is
+    a quarter of the lease duration
+    :param kwargs: keyword arguments passed to CoV2VTMJobQueue
+    :return: number of jobs completed by this worker
+    """
+    job_queue = CoV2VTMJobQueue(queue_fname, **kwargs)
+    if heartbeat_interval is None:
+        heartbeat_interval = job_queue.lease_duration / 4
+    assert 0 < heartbeat_interval < job_queue.lease_duration / 2
+    worker_id = get_worker_id(worker_idx)
+
+    num_complete = 0
+    while True:
+        job = job_queue.claim(worker_id)
+        if job is None:
+            if job_queue.num_remaining() == 0:
+                break
+            # Wait for leased jobs to either complete or expire
+            time.sleep(heartbeat_interval)
+            continue
+
+        run_idx, attempt = job
+        print(f'CoV2VTMJobQueue worker {worker_id} running job {run_idx} (attempt {attempt})')
+        heartbeat_thread = _HeartbeatThread(job_queue, run_idx, worker_id, heartbeat_interval)
+        heartbeat_thread.start()
+        result = run_cov2_vtm_sims_queue_job(cov2_vtm_sim_run, run_idx, attempt > 1, heartbeat_thread)
+        heartbeat_thread.stop()
+
+        if heartbeat_thread.lease_lost.is_set():
+            print(f'CoV2VTMJobQueue worker {worker_id} abandoned job {run_idx}')
+            continue
+        if result is None:
+            print(f'CoV2VTMJobQueue worker {worker_id} failed job {run_idx}')
+            job_queue.fail(run_idx, worker_id)
+            continue
+
+        if job_queue.complete(run_idx, worker_id, result['result']):
+            cov2_vtm_sim_run.write_sim_inputs(run_idx)
+            cov2_vtm_sim_run.set_run_complete(run_idx)
+            num_complete += 1
+
+    print(f'CoV2VTMJobQueue worker {worker_id} finished with {num_complete} completed jobs')
+    return num_complete
+
+
+def run_cov2_vtm_sims_queue(cov2_vtm_sim_run: CoV2VTMSimRun, queue_fname, num_workers=None, **kwargs):
+    """
+    Execute jobs of a batch run from a job queue on this host until the queue is drained
+    Each worker is a separate process, so that a failed simulation does not stop the other workers on this host
+    :param cov2_vtm_sim_run: batch run
+    :param queue_fname: path to database file
+    :param num_workers: number of workers on this host; default is the number of workers of the batch run
+    :param kwargs: keyword arguments passed to run_cov2_vtm_sims_queue_worker
+    :return: None
+    """
+    if num_workers is None:
+        num_workers = cov2_vtm_sim_run.num_workers
+    workers = [multiprocessing.Process(target=run_cov2_vtm_sims_queue_worker,
+                                       args=(cov2_vtm_sim_run, queue_fname, worker_idx),
+                                       kwargs=kwargs)
+               for worker_idx in range(num_workers)]
+    [w.start() for w in workers]
+    [w.join() for w in workers]
+    [print('CoV2VTMJobQueue worker process {} finished with exit code {}'.format(w.name, w.exitcode)) for w in workers]
+
+
+def wait_cov2_vtm_sim_queue(queue_fname, monitor_rate=10.0, **kwargs) -> dict:
+    """
+    Wait until all jobs of a job queue are complete or failed
+    :param queue_fname: path to database file
+    :param monitor_rate: interval of status checks (s)
+    :param kwargs: keyword arguments passed to CoV2VTMJobQueue
+    :return: dictionary of number of jobs by state
+    """
+    job_queue = CoV2VTMJobQueue(queue_fname, **kwargs)
+    while True:
+        job_queue.reclaim_expired()
+        status = job_queue.get_status()
+        if status[job_pending] + status[job_leased] == 0:
+            return status
+        time.sleep(monitor_rate)
+
+
+def collect_cov2_vtm_sim_queue(cov2_vtm_sim_run: CoV2VTMSimRun, queue_fname, **kwargs) -> CoV2VTMSimRun:
+    """
+    Collect results of completed jobs of a job queue into a batch run
+    :param cov2_vtm_sim_run: batch run
+    :param queue_fname: path to database file
+    :param kwargs: keyword arguments passed to CoV2VTMJobQueue
+    :return: batch run
+    """
+    job_queue = CoV2VTMJobQueue(queue_fname, **kwargs)
+    for run_idx, sim_output in job_queue.get_results().items():
+        cov2_vtm_sim_run.sim_output[run_idx] = sim_output
+    status = job_queue.get_status()
+    print('CoV2VTMJobQueue collected {} results; {} jobs failed, {} jobs remaining'.format(
+        status[job_complete], status[job_failed], status[job_pending] + status[job_leased]))
+    return cov2_vtm_sim_run
@@ -1,21 +1,32 @@
+import math
 import multiprocessing
 import os
-import time
+import queue
 
 from cc3d.CompuCellSetup.CC3DCaller import CC3DCaller, CC3DCallerWorker
 
 from nCoVToolkit import nCoVUtils
 from BatchPostCoV2VTM import CallableCC3DRenderer, CoV2VTMSimRunPost
+from BatchPostCoV2VTM import generate_batch_data_summary, calculate_trial_metric, calculate_metric_ci, \
+    find_data_desc, trial_metric_reductions
+from Simulation.ViralInfectionVTMLib import rng_seed_key, checkpoint_load_key, checkpoint_restore_rng_key, \
+    checkpoint_save_steps_key, checkpoint_stop_key, checkpoint_frequency_key
+from Simulation.ViralInfectionVTMCheckpoint import get_checkpoint_file, find_latest_checkpoint, \
+    summarize_checkpoint_cost
 
 simulation_fname = os.path.join(os.path.dirname(__file__), 'ViralInfectionVTM.cc3d')
 generic_root_output_folder = os.path.abspath(os.path.join(os.path.splitdrive(os.getcwd())[0], '/CallableCoV2VTM'))
 
+# Name of file that marks a completed run in its output directory
+run_complete_fname = 'run_complete'
+
 
 class CoV2VTMSimRun:
     def __init__(self, root_output_folder=generic_root_output_folder, output_frequency=0, screenshot_output_frequency=0,
-                 num_workers=1, num_runs=1, sim_input=None):
+                 num_workers=1, num_runs=1, sim_input=None, rng_seed=None, checkpoint_frequency=0):
 
         assert output_frequency >= 0
+        assert checkpoint_frequency >= 0
         assert screenshot_output_frequency >= 0
         assert num_runs > 0
         assert num_workers > 0
@@ -26,16 +37,28 @@ class CoV2VTMSimRun:
         self.num_workers = num_workers
         self.num_runs = num_runs
 
+        # Frequency of periodic checkpoints, from which interrupted runs are resumed; disabled when 0
+        self.checkpoint_frequency = checkpoint_frequency
+
         # Do version check; simulation inputs via CallableCC3D is an experimental feature as of CompuCell3D v 4.1.0
         def check_callable_cc3d_compat():
             from cc3d.CompuCellSetup import persistent_globals as pg
             assert 'return_object' in dir(pg), "Support for simulation inputs via CallableCC3D not found!"
 
-        if sim_input is not None:
+        if sim_input is not None or rng_seed is not None or checkpoint_frequency > 0:
             check_callable_cc3d_compat()
 
         self.__sim_input = sim_input
 
+        # Seed of batch; each run is seeded from this seed and its random number stream index
+        # Runs with the same batch seed and stream index draw the same random numbers in every subsystem, which can be
+        # used for common random numbers when comparing parameter sets
+        # The Potts (Metropolis) generator of each run is seeded from the same run seed; see
+        # ViralInfectionVTMLib.get_potts_seed. Runs resumed from a checkpoint reseed Potts, so they are reproducible
+        # but do not reproduce the Potts draws of an uninterrupted run
+        self.rng_seed = rng_seed
+        self.__rng_streams = [run_idx for run_idx in range(self.num_runs)]
+
         # Project convention:   all callable simulation inputs are passed in a dictionary
         #                       key is name of simulation input
         #                       value is value of simulation input
@@ -51,6 +74,69 @@ class CoV2VTMSimRun:
         assert isinstance(sim_inputs, dict)
         self.__sim_input[run_idx] = sim_inputs
 
+    def add_runs(self, num_runs, sim_input=None):
+        """
+        Adds runs to the batch
+        :param num_runs: number of runs to add
+        :param sim_input: simulation inputs of added runs; defaults to the inputs of the last run
+        :return: list of indices of added runs
+        """
+        assert num_runs > 0
+        run_list = [self.num_runs + x for x in range(num_runs)]
+        if self.__sim_input is not None:
+            if sim_input is None:
+                sim_input = self.__sim_input[-1]
+            self.__sim_input = list(self.__sim_input) + [sim_input] * num_runs
+        else:
+            assert sim_input is None, "Cannot add simulation inputs to a batch without simulation inputs"
+        self.__rng_streams.extend(run_list)
+        self.sim_output.extend([None] * num_runs)
+        self.num_runs += num_runs
+        return run_list
+
+    def set_run_rng_stream(self, run_idx, stream_idx):
+        """
+        Sets the random number stream index of a run; runs with the same stream index use common random numbers
+        :param run_idx: index of run
+        :param stream_idx: index of random number stream
+        :return: None
+        """
+        self.__rng_streams[run_idx] = stream_idx
+
+    def get_run_rng_seed(self, run_idx):
+        """
+        Gets the seed of a run
+        :param run_idx: index of run
+        :return: seed of run; None if the batch is not seeded
+        """
+        if self.rng_seed is None:
+            return None
+        return nCoVUtils.derive_seed(self.rng_seed, self.__rng_streams[run_idx])
+
+    def get_run_inputs(self, run_idx):
+        """
+        Gets the simulation inputs of a run, including its seed and checkpoint frequency
+        :param run_idx: index of run
+        :return: dictionary of simulation inputs; None if no inputs are specified
+        """
+        if self.__sim_input is None:
+            sim_input = None
+        else:
+            sim_input = dict(self.__sim_input[run_idx])
+
+        run_rng_seed = self.get_run_rng_seed(run_idx)
+        if run_rng_seed is not None:
+            if sim_input is None:
+                sim_input = dict()
+            sim_input[rng_seed_key] = run_rng_seed
+
+        if self.checkpoint_frequency > 0:
+            if sim_input is None:
+                sim_input = dict()
+            sim_input[checkpoint_frequency_key] = self.checkpoint_frequency
+
+        return sim_input
+
     def get_run_output_dir(self, run_idx):
         return os.path.join(self.output_dir_root, f'run_{run_idx}')
 
@@ -58,64 +144,231 @@ class CoV2VTMSimRun:
         return [self.get_run_output_dir(x) for x in range(self.num_runs)]
 
     def write_sim_inputs(self, run_idx):
-        if self.__sim_input is None:
+        sim_inputs = self.get_run_inputs(run_idx)
+        if sim_inputs is None:
             return
-        sim_inputs = self.__sim_input[run_idx]
         nCoVUtils.export_parameters(sim_inputs, os.path.join(self.get_run_output_dir(run_idx), 'CallableSimInputs.csv'))
 
-    def generate_callable(self, run_idx=0):
-        if self.__sim_input is not None:
-            sim_input = self.__sim_input[run_idx]
-        else:
-            sim_input = None
+    def is_run_complete(self, run_idx):
+        return os.path.isfile(os.path.join(self.get_run_output_dir(run_idx), run_complete_fname))
+
+    def set_run_complete(self, run_idx):
+        run_output_dir = self.get_run_output_dir(run_idx)
+        if not os.path.isdir(run_output_dir):
+            os.makedirs(run_output_dir)
+        with open(os.path.join(run_output_dir, run_complete_fname), 'w'):
+            pass
+
+    def get_run_resume_checkpoint(self, run_idx):
+        """
+        Gets the checkpoint from which to resume an interrupted run
+        :param run_idx: index of run
+        :return: path to latest checkpoint of run; None if the run has no checkpoint
+        """
+        return find_latest_checkpoint(self.get_run_output_dir(run_idx))
+
+    def generate_callable(self, run_idx=0, resume=False, tag=None):
+        """
+        Generate the callable of a run
+        :param run_idx: index of run
+        :param resume: resume from the latest checkpoint of the run, if any
+        :param tag: result identifier tag; default is the run index
+        :return: callable of run
+        """
+        sim_input = self.get_run_inputs(run_idx)
+
+        # Resume from latest checkpoint of run, if any, continuing its random number streams
+        if resume:
+            checkpoint_file = self.get_run_resume_checkpoint(run_idx)
+            if checkpoint_file is not None:
+                print(f'Resuming CoV2VTMSimRun run {run_idx} from checkpoint {checkpoint_file}')
+                if sim_input is None:
+                    sim_input = dict()
+                sim_input[checkpoint_load_key] = checkpoint_file
+                sim_input[checkpoint_restore_rng_key] = True
 
         cc3d_caller = CC3DCaller(cc3d_sim_fname=simulation_fname,
                                  output_frequency=self.output_frequency,
                                  screenshot_output_frequency=self.screenshot_output_frequency,
                                  output_dir=self.get_run_output_dir(run_idx),
-                                 result_identifier_tag=run_idx,
+                                 result_identifier_tag=run_idx if tag is None else tag,
                                  sim_input=sim_input)
         return cc3d_caller
 
 
-def run_cov2_vtm_sims(cov2_vtm_sim_run: CoV2VTMSimRun) -> CoV2VTMSimRun:
-    # Make complete list of jobs
-    run_list = [run_idx for run_idx in range(cov2_vtm_sim_run.num_runs)]
+def generate_crn_sim_run(param_sets: list, num_replicates: int, rng_seed, common_random_numbers=True,
+                         **kwargs) -> CoV2VTMSimRun:
+    """
+    Generates a batch run of a parameter sweep with replicates
+    Runs are ordered by parameter set, then by replicate; the index of replicate *j* of parameter set *i* is
+    i * num_replicates + j
+    :param param_sets: list of simulation inputs, one per parameter set
+    :param num_replicates: number of replicates per parameter set
+    :param rng_seed: seed of batch
+    :param common_random_numbers: when True, replicate *j* of every parameter set uses the same random numbers
+    :param kwargs: keyword arguments passed to CoV2VTMSimRun
+    :return: batch run
+    """
+    sim_input = [param_set for param_set in param_sets for _ in range(num_replicates)]
+    cov2_vtm_sim_run = CoV2VTMSimRun(num_runs=len(sim_input), sim_input=sim_input, rng_seed=rng_seed, **kwargs)
+    if common_random_numbers:
+        [cov2_vtm_sim_run.set_run_rng_stream(run_idx, run_idx % num_replicates) for run_idx in range(len(sim_input))]
+    return cov2_vtm_sim_run
 
-    while True:
+
+def generate_checkpoint_sim_run(checkpoint_mcs: int, sim_input=None, **kwargs) -> CoV2VTMSimRun:
+    """
+    Generates a run that simulates a shared prefix and stops after writing a checkpoint
+    Use *get_sim_run_checkpoint_file* to get the checkpoint file after execution
+    :param checkpoint_mcs: simulation step of checkpoint
+    :param sim_input: simulation inputs of prefix
+    :param kwargs: keyword arguments passed to CoV2VTMSimRun
+    :return: batch run
+    """
+    if sim_input is None:
+        sim_input = dict()
+    sim_input = dict(sim_input)
+    sim_input[checkpoint_save_steps_key] = [checkpoint_mcs]
+    sim_input[checkpoint_stop_key] = True
+    return CoV2VTMSimRun(num_runs=1, sim_input=[sim_input], **kwargs)
+
+
+def get_sim_run_checkpoint_file(cov2_vtm_sim_run: CoV2VTMSimRun, checkpoint_mcs: int, run_idx=0):
+    """
+    Gets the path to a checkpoint file written by a run
+    :param cov2_vtm_sim_run: batch run
+    :param checkpoint_mcs: simulation step of checkpoint
+    :param run_idx: index of run
+    :return: path to checkpoint file
+    """
+    return get_checkpoint_file(cov2_vtm_sim_run.get_run_output_dir(run_idx), checkpoint_mcs)
+
+
+def generate_branch_sim_run(checkpoint_file, param_sets: list, num_replicates=1, rng_seed=None,
+                            common_random_numbers=True, **kwargs) -> CoV2VTMSimRun:
+    """
+    Generates a batch run of a parameter sweep that starts from a checkpoint
+    When *rng_seed* is None, every run continues the random number streams of the checkpoint; otherwise, runs are
+    seeded as in *generate_crn_sim_run*. Continued streams are identical in every run, so *rng_seed* is required for
+    more than one replicate
+    :param checkpoint_file: path to checkpoint file
+    :param param_sets: list of simulation inputs, one per parameter set
+    :param num_replicates: number of replicates per parameter set
+    :param rng_seed: seed of batch
+    :param common_random_numbers: when True, replicate *j* of every parameter set uses the same random numbers
+    :param kwargs: keyword arguments passed to CoV2VTMSimRun
+    :return: batch run
+    """
+    assert os.path.isfile(checkpoint_file), f'Checkpoint not found: {checkpoint_file}'
+    assert rng_seed is not None or num_replicates == 1, \
+        'Replicates of a branch require a seed; replicates that continue the streams of a checkpoint are identical'
+    branch_param_sets = list()
+    for param_set in param_sets:
+        branch_param_set = dict(param_set) if param_set is not None else dict()
+        branch_param_set[checkpoint_load_key] = os.path.abspath(checkpoint_file)
+        branch_param_set[checkpoint_restore_rng_key] = rng_seed is None
+        branch_param_sets.append(branch_param_set)
+    return generate_crn_sim_run(branch_param_sets, num_replicates, rng_seed, common_random_numbers, **kwargs)
+
+
+def run_cov2_vtm_sims(cov2_vtm_sim_run: CoV2VTMSimRun, run_list=None, resume=False, online_stats=None,
+                      result_callback=None, keep_output=True) -> CoV2VTMSimRun:
+    """
+    Execute a batch run
+    Results are processed as they arrive, so that online statistics and partial summaries are available while the
+    batch is running
+    :param cov2_vtm_sim_run: batch run
+    :param run_list: indices of runs to execute; default is all runs
+    :param resume: skip completed runs and resume interrupted runs from their latest checkpoint
+    :param online_stats: OnlineBatchStats instance updated with each result
+    :param result_callback: function called with the batch run and run index after each result is processed
+    :param keep_output: store simulation outputs in the batch run; disable to bound memory with online statistics
+    :return: batch run
+    """
+    def process_result(_sim_run, run_idx, sim_output):
+        if online_stats is not None:
+            online_stats.ingest(run_idx, sim_output, _sim_run.get_run_output_dir(run_idx))
+        if result_callback is not None:
+            result_callback(_sim_run, run_idx)
+
+    run_cov2_vtm_sims_pooled([(cov2_vtm_sim_run, run_list)], cov2_vtm_sim_run.num_workers, resume, process_result,
+                             keep_output)
+    return cov2_vtm_sim_run
+
+
+def run_cov2_vtm_sims_pooled(jobs: list, num_workers: int, resume=False, result_callback=None, keep_output=True):
+    """
+    Execute runs of one or more batch runs with one pool of workers
+    Runs of all batch runs are enqueued together, so that no worker is idle while runs of any batch run remain
+    :param jobs: list of (batch run, indices of runs to execute); indices default to all runs when None
+    :param num_workers: number of workers
+    :param resume: skip completed runs and resume interrupted runs from their latest checkpoint
+    :param result_callback: function called with the batch run, run index and simulation output after each result is
+        processed
+    :param keep_output: store simulation outputs in the batch runs
+    :return: None
+    """
+    # Make complete list of jobs; jobs are identified by (batch index, run index)
+    run_list = list()
+    for batch_idx, (cov2_vtm_sim_run, batch_run_list) in enumerate(jobs):
+        if batch_run_list is None:
+            batch_run_list = range(cov2_vtm_sim_run.num_runs)
+        run_list.extend([(batch_idx, run_idx) for run_idx in batch_run_list])
+
+    # When resuming, skip completed runs and resume interrupted runs from their latest checkpoint
+    if resume:
+        run_list_complete = [(b, r) for b, r in run_list if jobs[b][0].is_run_complete(r)]
+        if run_list_complete:
+            print('Skipping {} completed CoV2VTMSimRun jobs.'.format(len(run_list_complete)))
+        run_list = [x for x in run_list if x not in run_list_complete]
+    run_list_all = list(run_list)
+
+    while run_list:
         num_jobs_curr = len(run_list)
         print('Doing CoV2VTMSimRun batch iteration with {} remaining jobs.'.format(num_jobs_curr))
 
         # Start workers
         tasks = multiprocessing.JoinableQueue()
         results = multiprocessing.Queue()
-        workers = [CC3DCallerWorker(tasks, results) for i in range(cov2_vtm_sim_run.num_workers)]
+        workers = [CC3DCallerWorker(tasks, results) for i in range(num_workers)]
         [w.start() for w in workers]
 
-        # Enqueue jobs
-        [tasks.put(cov2_vtm_sim_run.generate_callable(run_idx)) for run_idx in run_list]
+        # Enqueue jobs; failed jobs are retried from their latest checkpoint
+        resume_jobs = resume or num_jobs_curr < len(run_list_all)
+        [tasks.put(jobs[b][0].generate_callable(r, resume_jobs, tag=(b, r))) for b, r in run_list]
 
         # Add a stop task for each of worker
         [tasks.put(None) for w in workers]
 
-        # Monitor worker state
-        monitor_rate = 1
-        while [w for w in workers if w.is_alive()]:
-            time.sleep(monitor_rate)
-
-        # Fetch available results
-        while True:
-            result = results.get()
-            run_idx = result['tag']
-            sim_output = result['result']
+        def process_result(_result):
+            batch_idx, run_idx = _result['tag']
+            cov2_vtm_sim_run = jobs[batch_idx][0]
+            sim_output = _result['result']
 
             print('Got CoV2VTMSimRun batch result {}'.format(run_idx))
 
-            cov2_vtm_sim_run.sim_output[run_idx] = sim_output
+            if keep_output:
+                cov2_vtm_sim_run.sim_output[run_idx] = sim_output
             cov2_vtm_sim_run.write_sim_inputs(run_idx)
-            run_list.remove(run_idx)
+            cov2_vtm_sim_run.set_run_complete(run_idx)
+            run_list.remove((batch_idx, run_idx))
+
+            if result_callback is not None:
+                result_callback(cov2_vtm_sim_run, run_idx, sim_output)
 
-            if results.empty():
+        # Monitor worker state and process results as they arrive
+        monitor_rate = 1
+        while [w for w in workers if w.is_alive()]:
+            try:
+                process_result(results.get(timeout=monitor_rate))
+            except queue.Empty:
+                pass
+
+        # Fetch remaining results
+        while True:
+            try:
+                process_result(results.get(timeout=monitor_rate))
+            except queue.Empty:
                 break
 
         num_jobs_next = len(run_list)
@@ -129,7 +382,152 @@ def run_cov2_vtm_sims(cov2_vtm_sim_run: CoV2VTMSimRun) -> CoV2VTMSimRun:
             print('CoV2VTMSimRun batch run failed! Terminating early.')
             break
 
-    return cov2_vtm_sim_run
+    # Report checkpoint cost
+    checkpoint_cost = summarize_checkpoint_cost([jobs[b][0].get_run_output_dir(r) for b, r in run_list_all])
+    if checkpoint_cost['num_checkpoints'] > 0:
+        print('CoV2VTMSimRun wrote {} checkpoints in {:.3f} s (mean {:.3f} s, {:.0f} bytes per checkpoint).'.format(
+            checkpoint_cost['num_checkpoints'], checkpoint_cost['total_time'], checkpoint_cost['mean_time'],
+            checkpoint_cost['mean_size']))
+
+
+class CoV2VTMSimRunAdaptive:
+    """
+    Sequential replicate allocation over a set of parameter points
+    Each parameter point is run as a CoV2VTMSimRun in its own subdirectory of the root output folder. Replicates are
+    added to a point until the confidence interval width of every requested metric is below its target, or until the
+    maximum number of replicates is reached. The number of replicates added to a point is estimated from its current
+    interval widths, so that noisy points receive more replicates.
+    Metrics are calculated from the data recorded by SimDataSteppable; the corresponding data output must be enabled
+    in the model inputs.
+    """
+    def __init__(self, param_sets: list, metrics: list, root_output_folder=generic_root_output_folder,
+                 output_frequency=0, screenshot_output_frequency=0, num_workers=1, num_runs_init=3,
+                 num_runs_max=100, ci_z=1.96, rng_seed=None, common_random_numbers=True, step_list=None):
+        """
+        :param param_sets: list of simulation inputs, one per parameter point
+        :param metrics: list of metric specifications (var_name, reduction, ci_width); e.g., ('Uninfected', 'final', 10)
+        :param root_output_folder: root output folder
+        :param output_frequency: output frequency of runs
+        :param screenshot_output_frequency: screenshot output frequency of runs
+        :param num_workers: number of workers
+        :param num_runs_init: initial number of replicates per parameter point
+        :param num_runs_max: maximum number of replicates per parameter point
+        :param ci_z: standard score of confidence level of metric confidence intervals
+        :param rng_seed: seed of batch
+        :param common_random_numbers: when True, replicate *j* of every parameter point uses the same random numbers
+        :param step_list: steps of data to consider in metric calculations; default is all steps
+        """
+        assert num_runs_init > 1, "At least two initial replicates are required to estimate confidence intervals"
+        assert num_runs_max >= num_runs_init
+        for var_name, reduction, ci_width in metrics:
+            assert find_data_desc(var_name) is not None, '{} is not a recognized data variable'.format(var_name)
+            assert reduction in trial_metric_reductions.keys(), '{} is not a recognized reduction'.format(reduction)
+            assert ci_width > 0
+
+        self.metrics = metrics
+        self.num_workers = num_workers
+        self.num_runs_max = num_runs_max
+        self.ci_z = ci_z
+        self.step_list = step_list
+        self.output_dir_root = root_output_folder
+
+        self.sim_runs = list()
+        for point_idx, param_set in enumerate(param_sets):
+            if rng_seed is None or common_random_numbers:
+                point_rng_seed = rng_seed
+            else:
+                point_rng_seed = nCoVUtils.derive_seed(rng_seed, point_idx)
+            self.sim_runs.append(CoV2VTMSimRun(root_output_folder=self.get_point_output_dir(point_idx),
+                                               output_frequency=output_frequency,
+                                               screenshot_output_frequency=screenshot_output_frequency,
+                                               num_workers=num_workers,
+                                               num_runs=num_runs_init,
+                                               sim_input=param_set,
+                                               rng_seed=point_rng_seed))
+
+        # Metric statistics of each point; list of dictionaries by metric index of (mean, ci width, num. trials)
+        self.point_stats = [None] * len(self.sim_runs)
+
+    @property
+    def num_points(self):
+        return len(self.sim_runs)
+
+    def get_point_output_dir(self, point_idx):
+        return os.path.join(self.output_dir_root, f'point_{point_idx}')
+
+    def calculate_point_stats(self, point_idx):
+        """
+        Calculate metric statistics of a parameter point from available results
+        :param point_idx: index of parameter point
+        :return: dictionary of (mean, ci width, num. trials) by metric index
+        """
+        batch_data_summary = generate_batch_data_summary(self.sim_runs[point_idx], self.step_list)
+        point_stats = dict()
+        for metric_idx, (var_name, reduction, _) in enumerate(self.metrics):
+            metric_data = list(calculate_trial_metric(batch_data_summary, var_name, reduction).values())
+            mean_val, ci_width = calculate_metric_ci(metric_data, self.ci_z)
+            point_stats[metric_idx] = (mean_val, ci_width, len(metric_data))
+        self.point_stats[point_idx] = point_stats
+        return point_stats
+
+    def get_num_runs_request(self, point_idx):
+        """
+        Estimate the number of replicates to add to a parameter point to meet all confidence interval targets
+        The estimate assumes interval width scales with the inverse square root of the number of replicates, and is
+        limited to doubling the current number of replicates per iteration
+        Metrics must have data; a metric without data usually means that its data output is not enabled
+        :param point_idx: index of parameter point
+        :return: number of replicates to add
+        """
+        num_runs = self.sim_runs[point_idx].num_runs
+        num_runs_req = num_runs
+        for metric_idx, (var_name, _, ci_width_target) in enumerate(self.metrics):
+            _, ci_width, num_data = self.point_stats[point_idx][metric_idx]
+            assert num_data > 0, \
+                'No data of {} for point {}; check that its data output is enabled'.format(var_name, point_idx)
+            if ci_width <= ci_width_target:
+                continue
+            if math.isinf(ci_width):
+                num_runs_req = max(num_runs_req, num_runs + 1)
+            else:
+                num_runs_req = max(num_runs_req, math.ceil(num_data * (ci_width / ci_width_target) ** 2))
+
+        num_runs_req = min(num_runs_req, 2 * num_runs, self.num_runs_max)
+        return max(num_runs_req - num_runs, 0)
+
+
+def run_cov2_vtm_sims_adaptive(cov2_vtm_sim_run_adaptive: CoV2VTMSimRunAdaptive) -> CoV2VTMSimRunAdaptive:
+    """
+    Execute an adaptive batch until all parameter points meet their confidence interval targets or reach their
+    maximum number of replicates
+    :param cov2_vtm_sim_run_adaptive: adaptive batch
+    :return: adaptive batch
+    """
+    run_lists = [None] * cov2_vtm_sim_run_adaptive.num_points
+    while True:
+        # New runs of all points that have not converged share one pool of workers
+        jobs = [(sim_run, run_lists[point_idx]) for point_idx, sim_run in enumerate(cov2_vtm_sim_run_adaptive.sim_runs)
+                if run_lists[point_idx] is None or run_lists[point_idx]]
+        print('CoV2VTMSimRunAdaptive running {} points'.format(len(jobs)))
+        run_cov2_vtm_sims_pooled(jobs, cov2_vtm_sim_run_adaptive.num_workers)
+
+        for point_idx in range(cov2_vtm_sim_run_adaptive.num_points):
+            if run_lists[point_idx] is None or run_lists[point_idx]:
+                cov2_vtm_sim_run_adaptive.calculate_point_stats(point_idx)
+            num_runs_add = cov2_vtm_sim_run_adaptive.get_num_runs_request(point_idx)
+            if num_runs_add > 0:
+                run_lists[point_idx] = cov2_vtm_sim_run_adaptive.sim_runs[point_idx].add_runs(num_runs_add)
+            else:
+                run_lists[point_idx] = []
+
+            print('CoV2VTMSimRunAdaptive point {} with {} runs: {} runs added'.format(
+                point_idx, cov2_vtm_sim_run_adaptive.sim_runs[point_idx].num_runs - num_runs_add, num_runs_add))
+
+        if not any(run_lists):
+            print('CoV2VTMSimRunAdaptive batch complete!')
+            break
+
+    return cov2_vtm_sim_run_adaptive
 
 
 # Example of usage / convenience sequence to do intended overall workflow
@@ -11,11 +11,11 @@
 #           CompuCellSetup.register_steppable(steppable=RandomSusceptibilitySteppable(frequency=1))
 
 import os
-from random import randint
 import sys
 sys.path.append(os.path.join(os.environ["ViralInfectionVTM"], "Simulation"))
 
 from ViralInfectionVTMSteppableBasePy import ViralInfectionVTMSteppableBasePy
+import ViralInfectionVTMLib
 
 from .SusceptibilityModelInputs import *
 
@@ -38,9 +38,10 @@ class RandomSusceptibilitySteppable(ViralInfectionVTMSteppableBasePy):
         if track_susc:
             for cell in ec_list:
                 cell.dict[vs_state_key] = True
+        rng = self.get_rng(ViralInfectionVTMLib.rng_susceptibility)
         num_changed = 0
         while num_changed < int(len(ec_list) * frac_not_susc):
-            if self.make_unsusceptible(self.cell_field[randint(0, self.dim.x - 1), randint(0, self.dim.y - 1), 0]):
+            if self.make_unsusceptible(self.cell_field[rng.integers(0, self.dim.x), rng.integers(0, self.dim.y), 0]):
                 num_changed += 1
 
     def make_unsusceptible(self, _cell) -> bool:
@@ -20,13 +20,13 @@
 #           from Models.RecoveryNeighbor.RecoverySteppables import NeighborRecoveryDataSteppable
 #           CompuCellSetup.register_steppable(steppable=NeighborRecoveryDataSteppable(frequency=1))
 
-import random
 import sys
 import os
 from cc3d.core.PySteppables import *
 
 sys.path.append(os.path.join(os.environ["ViralInfectionVTM"], "Simulation"))
 from ViralInfectionVTMModelInputs import s_to_mcs
+import ViralInfectionVTMLib
 
 from .RecoveryInputs import *
 rec_steppable_key = "nbrec_steppable"
@@ -53,7 +53,8 @@ class NeighborRecoverySteppable(SimpleRecoverySteppable):
         :return: True if cell recovers
         """
         ca = sum([a for n, a in self.get_cell_neighbor_data_list(_cell) if n is not None and n.type == self.UNINFECTED])
-        return random.random() < ca * recovery_rate * s_to_mcs
+        rng = ViralInfectionVTMLib.get_rng(ViralInfectionVTMLib.rng_recovery)
+        return rng.random() < ca * recovery_rate * s_to_mcs
 
 
 class NeighborRecoveryDataSteppable(SimpleRecoveryDataSteppable):
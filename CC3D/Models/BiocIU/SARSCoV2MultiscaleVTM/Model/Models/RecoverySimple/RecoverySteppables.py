@@ -17,7 +17,6 @@
 #           from Models.RecoverySimple.RecoverySteppables import SimpleRecoveryDataSteppable
 #           CompuCellSetup.register_steppable(steppable=SimpleRecoveryDataSteppable(frequency=1))
 
-import random
 import sys
 import os
 from cc3d.core.PySteppables import *
@@ -54,7 +53,7 @@ class SimpleRecoverySteppable(SteppableBasePy):
         :param _cell: dead cell to test for recovery
         :return: True if cell recovers
         """
-        return random.random() < recovery_rate * s_to_mcs
+        return ViralInfectionVTMLib.get_rng(ViralInfectionVTMLib.rng_recovery).random() < recovery_rate * s_to_mcs
 
     def recover_cell(self, _cell):
         """
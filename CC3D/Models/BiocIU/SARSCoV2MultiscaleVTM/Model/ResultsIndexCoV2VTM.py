@@ -0,0 +1,265 @@
+# Index of the artifacts of the runs of a CoV2VTMSimRun output directory
+# The index lists the data files, lattice data, screenshot descriptions, snapshots and checkpoints of every run, so
+# that post-processing and rendering look up artifacts instead of repeatedly walking run directories. The index is
+# built with one walk of each run directory and cached in the output directory. When refreshed, the modification times
+# of the directories of a run are compared with those recorded when the run was indexed, and only new runs and runs
+# with changed directories are walked again.
+# Directory modification times change when entries are added, removed or renamed, which covers all artifacts of this
+# index; modification of existing files is not detected.
+# This library has no dependency on CompuCell3D, so that results can be indexed outside of a simulation
+
+import json
+import os
+
+from nCoVToolkit.nCoVSnapshot import snapshot_index_name
+from Simulation.ViralInfectionVTMCheckpoint import autosave_prefix, checkpoint_prefix, get_checkpoint_mcs
+
+# Name of results index file in a results directory
+results_index_name = 'results_index.json'
+
+# Version of results index layout
+results_index_version = 1
+
+# Prefix of run directory names
+run_dir_prefix = 'run_'
+
+
+def get_vtk_file_mcs(file_name):
+    """
+    Get the simulation step of a lattice data file
+    :param file_name: name of or path to lattice data file
+    :return: simulation step; None if not a lattice data file
+    """
+    name, ext = os.path.splitext(os.path.basename(file_name))
+    if ext != '.vtk':
+        return None
+    try:
+        return int(name.split('_')[-1])
+    except ValueError:
+        return None
+
+
+def scan_run_dir(run_dir) -> dict:
+    """
+    Index the artifacts of a run directory with one walk
+    Paths are relative to the run directory
+    :param run_dir: run directory
+    :return: dictionary with keys
+        'dir_mtimes': modification time (ns) by directory
+        'data_files': paths by file name of data files (.dat and .csv), in the order found
+        'vtk_files': path by simulation step of lattice data files
+        'lds_file': path of lattice description file; None if not found
+        'screenshot_desc': path of screenshot description file; None if not found
+        'snapshot_index': path of snapshot index file; None if not found
+        'checkpoints': path by simulation step of checkpoint files
+        'autosaves': path by simulation step of periodic checkpoint files
+    """
+    run_entry = {'dir_mtimes': dict(),
+                 'data_files': dict(),
+                 'vtk_files': dict(),
+                 'lds_file': None,
+                 'screenshot_desc': None,
+                 'snapshot_index': None,
+                 'checkpoints': dict(),
+                 'autosaves': dict()}
+    for root, dirs, names in os.walk(run_dir):
+        rel_root = os.path.relpath(root, run_dir)
+        run_entry['dir_mtimes'][rel_root] = os.stat(root).st_mtime_ns
+        for name in names:
+            rel_path = os.path.normpath(os.path.join(rel_root, name))
+            ext = os.path.splitext(name)[1]
+            if ext in ['.dat', '.csv']:
+                run_entry['data_files'].setdefault(name, []).append(rel_path)
+            elif ext == '.vtk':
+                mcs = get_vtk_file_mcs(name)
+                if mcs is not None:
+                    run_entry['vtk_files'][str(mcs)] = rel_path
+            elif ext == '.dml':
+                if run_entry['lds_file'] is None:
+                    run_entry['lds_file'] = rel_path
+            elif name == 'screenshots.json':
+                if run_entry['screenshot_desc'] is None:
+                    run_entry['screenshot_desc'] = rel_path
+            elif name == snapshot_index_name:
+                if run_entry['snapshot_index'] is None:
+                    run_entry['snapshot_index'] = rel_path
+            else:
+                for prefix, key in [(checkpoint_prefix, 'checkpoints'), (autosave_prefix, 'autosaves')]:
+                    mcs = get_checkpoint_mcs(name, prefix)
+                    if mcs is not None:
+                        run_entry[key][str(mcs)] = rel_path
+    return run_entry
+
+
+def is_run_entry_current(run_dir, run_entry: dict) -> bool:
+    """
+    Test whether the index of a run directory is current
+    :param run_dir: run directory
+    :param run_entry: index of run directory; see *scan_run_dir*
+    :return: True if no directory of the run changed since the run was indexed
+    """
+    for rel_dir, mtime in run_entry['dir_mtimes'].items():
+        try:
+            if os.stat(os.path.join(run_dir, rel_dir)).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+class ResultsIndex:
+    """
+    Cached index of the artifacts of the runs of a results directory
+    Runs are subdirectories of the results directory with names that begin with *run_dir_prefix*, and are referred to
+    by their directory name (e.g., 'run_0')
+    """
+    def __init__(self, loc, index_file=None):
+        """
+        :param loc: results directory
+        :param index_file: path to cache file of index; default is *results_index_name* in the results directory
+        """
+        self.loc = loc
+        if index_file is None:
+            index_file = os.path.join(loc, results_index_name)
+        self.index_file = index_file
+
+        self.index = None
+        if os.path.isfile(index_file):
+            try:
+                with open(index_file, 'r') as fin:
+                    self.index = json.load(fin)
+            except (OSError, ValueError):
+                self.index = None
+        if self.index is None or self.index.get('version', None) != results_index_version:
+            self.index = {'version': results_index_version, 'runs': dict()}
+
+    def __write(self):
+        if not os.path.isdir(os.path.dirname(os.path.abspath(self.index_file))):
+            return
+        index_file_tmp = self.index_file + f'.{os.getpid()}.tmp'
+        with open(index_file_tmp, 'w') as fout:
+            json.dump(self.index, fout)
+        os.replace(index_file_tmp, self.index_file)
+
+    def __refresh_run(self, run_name) -> bool:
+        run_dir = os.path.join(self.loc, run_name)
+        run_entry = self.index['runs'].get(run_name, None)
+        if not os.path.isdir(run_dir):
+            if run_entry is None:
+                return False
+            self.index['runs'].pop(run_name)
+            return True
+        if run_entry is not None and is_run_entry_current(run_dir, run_entry):
+            return False
+        self.index['runs'][run_name] = scan_run_dir(run_dir)
+        return True
+
+    def refresh(self, run_names=None) -> list:
+        """
+        Refresh the index and update its cache file; only new and changed runs are walked
+        :param run_names: names of runs to refresh; default is all runs, including new runs
+        :return: names of refreshed runs
+        """
+        if run_names is None:
+            run_names = set(self.index['runs'].keys())
+            if os.path.isdir(self.loc):
+                run_names.update([x for x in os.listdir(self.loc)
+                                  if x.startswith(run_dir_prefix) and os.path.isdir(os.path.join(self.loc, x))])
+            run_names = sorted(run_names)
+        refreshed = [x for x in run_names if self.__refresh_run(x)]
+        if refreshed:
+            self.__write()
+        return refreshed
+
+    @property
+    def run_names(self) -> list:
+        return sorted(self.index['runs'].keys())
+
+    def get_run_entry(self, run_name, refresh=True) -> dict:
+        """
+        Get the index of a run
+        :param run_name: name of run directory
+        :param refresh: refresh the index of the run first
+        :return: index of run; see *scan_run_dir*; None if the run does not exist
+        """
+        if refresh:
+            self.refresh([run_name])
+        return self.index['runs'].get(run_name, None)
+
+    def __get_path(self, run_name, rel_path):
+        if rel_path is None:
+            return None
+        return os.path.join(self.loc, run_name, rel_path)
+
+    def find_data_files(self, run_name, file_name, refresh=True) -> list:
+        """
+        Find data files of a run by name
+        :param run_name: name of run directory
+        :param file_name: name of data file (e.g., 'pop_data.dat')
+        :param refresh: refresh the index of the run first
+        :return: list of paths to data files
+        """
+        run_entry = self.get_run_entry(run_name, refresh)
+        if run_entry is None:
+            return []
+        return [self.__get_path(run_name, x) for x in run_entry['data_files'].get(file_name, [])]
+
+    def get_vtk_files(self, run_name, refresh=True) -> dict:
+        """
+        Get lattice data files of a run
+        :param run_name: name of run directory
+        :param refresh: refresh the index of the run first
+        :return: dictionary of paths to lattice data files by simulation step
+        """
+        run_entry = self.get_run_entry(run_name, refresh)
+        if run_entry is None:
+            return dict()
+        return {int(k): self.__get_path(run_name, v) for k, v in run_entry['vtk_files'].items()}
+
+    def get_lds_file(self, run_name, refresh=True):
+        """
+        Get the lattice description file of a run
+        :param run_name: name of run directory
+        :param refresh: refresh the index of the run first
+        :return: path to lattice description file; None if not found
+        """
+        run_entry = self.get_run_entry(run_name, refresh)
+        return None if run_entry is None else self.__get_path(run_name, run_entry['lds_file'])
+
+    def get_screenshot_desc_file(self, run_name, refresh=True):
+        """
+        Get the screenshot description file of a run
+        :param run_name: name of run directory
+        :param refresh: refresh the index of the run first
+        :return: path to screenshot description file; None if not found
+        """
+        run_entry = self.get_run_entry(run_name, refresh)
+        return None if run_entry is None else self.__get_path(run_name, run_entry['screenshot_desc'])
+
+    def get_snapshot_dir(self, run_name, refresh=True):
+        """
+        Get the snapshot directory of a run
+        :param run_name: name of run directory
+        :param refresh: refresh the index of the run first
+        :return: path to snapshot directory; None if not found
+        """
+        run_entry = self.get_run_entry(run_name, refresh)
+        if run_entry is None or run_entry['snapshot_index'] is None:
+            return None
+        return os.path.dirname(self.__get_path(run_name, run_entry['snapshot_index']))
+
+    def get_checkpoints(self, run_name, include_autosaves=False, refresh=True) -> dict:
+        """
+        Get checkpoint files of a run
+        :param run_name: name of run directory
+        :param include_autosaves: include periodic checkpoints
+        :param refresh: refresh the index of the run first
+        :return: dictionary of paths to checkpoint files by simulation step
+        """
+        run_entry = self.get_run_entry(run_name, refresh)
+        if run_entry is None:
+            return dict()
+        checkpoints = {int(k): self.__get_path(run_name, v) for k, v in run_entry['checkpoints'].items()}
+        if include_autosaves:
+            checkpoints.update({int(k): self.__get_path(run_name, v) for k, v in run_entry['autosaves'].items()})
+        return checkpoints
@@ -59,4 +59,13 @@ from ViralInfectionVTMSteppables import oxidationAgentModelSteppable
 
 CompuCellSetup.register_steppable(steppable=oxidationAgentModelSteppable(frequency=1))
 
+from ViralInfectionVTMSteppables import SnapshotSteppable
+
+CompuCellSetup.register_steppable(steppable=SnapshotSteppable(frequency=1))
+
+# Checkpointing must be registered last
+from ViralInfectionVTMSteppables import CheckpointSteppable
+
+CompuCellSetup.register_steppable(steppable=CheckpointSteppable(frequency=1))
+
 CompuCellSetup.run()
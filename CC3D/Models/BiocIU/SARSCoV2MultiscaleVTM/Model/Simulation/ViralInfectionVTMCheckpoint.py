@@ -0,0 +1,221 @@
+# This is a library for checkpointing simulation state of the viral infection modeling project using CompuCell3D
+# by the Biocomplexity Institute at Indiana University
+# This library has no dependency on CompuCell3D, so that checkpoints can be managed outside of a simulation
+
+import csv
+import os
+import pickle
+import time
+import warnings
+
+# Prefix and suffix of checkpoint file names
+checkpoint_prefix = 'checkpoint_'
+checkpoint_suffix = '.pkl'
+
+# Prefix of periodic checkpoint file names
+autosave_prefix = 'autosave_'
+
+# Version of checkpoint data layout
+checkpoint_version = 1
+
+# Name of checkpoint cost log file
+checkpoint_log_name = 'checkpoint_log.csv'
+
+
+def get_checkpoint_file(loc, mcs, prefix=checkpoint_prefix):
+    """
+    Get the path to a checkpoint file
+    :param loc: directory of checkpoint
+    :param mcs: simulation step of checkpoint
+    :param prefix: prefix of checkpoint file name
+    :return: path to checkpoint file
+    """
+    return os.path.join(loc, f'{prefix}{mcs}{checkpoint_suffix}')
+
+
+def get_checkpoint_mcs(file_name, prefix=checkpoint_prefix):
+    """
+    Get the simulation step of a checkpoint file
+    :param file_name: name of or path to checkpoint file
+    :param prefix: prefix of checkpoint file name
+    :return: simulation step of checkpoint; None if not a checkpoint file
+    """
+    name = os.path.basename(file_name)
+    if not (name.startswith(prefix) and name.endswith(checkpoint_suffix)):
+        return None
+    try:
+        return int(name[len(prefix):-len(checkpoint_suffix)])
+    except ValueError:
+        return None
+
+
+def list_checkpoints(loc, prefix=checkpoint_prefix) -> dict:
+    """
+    List checkpoint files in a directory
+    :param loc: directory of checkpoints
+    :param prefix: prefix of checkpoint file names
+    :return: dictionary of checkpoint file paths by simulation step
+    """
+    if not os.path.isdir(loc):
+        return dict()
+    checkpoints = dict()
+    for name in os.listdir(loc):
+        mcs = get_checkpoint_mcs(name, prefix)
+        if mcs is not None:
+            checkpoints[mcs] = os.path.join(loc, name)
+    return checkpoints
+
+
+def find_latest_checkpoint(loc):
+    """
+    Find the latest checkpoint file in a directory, including periodic checkpoints
+    :param loc: directory of checkpoints
+    :return: path to latest checkpoint file; None if no checkpoint is found
+    """
+    checkpoints = list_checkpoints(loc)
+    checkpoints.update(list_checkpoints(loc, autosave_prefix))
+    if not checkpoints:
+        return None
+    return checkpoints[max(checkpoints.keys())]
+
+
+def write_checkpoint(file_name, checkpoint_data: dict) -> None:
+    """
+    Write checkpoint data to file
+    A small header with the version and simulation step of the checkpoint precedes the data, so that it can be read
+    without loading the data
+    Data is first written to a temporary file in the same directory and then moved into place, so that an
+    interrupted write never leaves a partial checkpoint
+    :param file_name: path to checkpoint file
+    :param checkpoint_data: checkpoint data; must contain the simulation step with key 'mcs'
+    :return: None
+    """
+    header = {'version': checkpoint_version,
+              'mcs': checkpoint_data['mcs']}
+    file_name_tmp = file_name + '.tmp'
+    with open(file_name_tmp, 'wb') as fout:
+        pickle.dump(header, fout, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(checkpoint_data, fout, protocol=pickle.HIGHEST_PROTOCOL)
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(file_name_tmp, file_name)
+
+
+def read_checkpoint_header(file_name) -> dict:
+    """
+    Read checkpoint header from file
+    :param file_name: path to checkpoint file
+    :return: checkpoint header
+    """
+    with open(file_name, 'rb') as fin:
+        header = pickle.load(fin)
+    assert header.get('version', None) == checkpoint_version, f'Incompatible checkpoint version in {file_name}'
+    return header
+
+
+def read_checkpoint(file_name) -> dict:
+    """
+    Read checkpoint data from file
+    :param file_name: path to checkpoint file
+    :return: checkpoint data
+    """
+    with open(file_name, 'rb') as fin:
+        header = pickle.load(fin)
+        assert header.get('version', None) == checkpoint_version, f'Incompatible checkpoint version in {file_name}'
+        checkpoint_data = pickle.load(fin)
+    return checkpoint_data
+
+
+def write_checkpoint_timed(file_name, checkpoint_data_fnc, log_file=None):
+    """
+    Generate and write checkpoint data to file, and measure the cost
+    :param file_name: path to checkpoint file
+    :param checkpoint_data_fnc: function that returns checkpoint data
+    :param log_file: path to checkpoint cost log file; cost is appended as a row (mcs, generate time, write time, size)
+    :return: generation time (s), write time (s) and size (bytes) of checkpoint
+    """
+    time_start = time.perf_counter()
+    checkpoint_data = checkpoint_data_fnc()
+    time_generate = time.perf_counter() - time_start
+    time_start = time.perf_counter()
+    write_checkpoint(file_name, checkpoint_data)
+    time_write = time.perf_counter() - time_start
+    size = os.path.getsize(file_name)
+
+    if log_file is not None:
+        with open(log_file, 'a', newline='') as fout:
+            csv.writer(fout, delimiter=',').writerow([checkpoint_data['mcs'], time_generate, time_write, size])
+
+    return time_generate, time_write, size
+
+
+def read_checkpoint_log(loc) -> list:
+    """
+    Read checkpoint cost log in a directory
+    :param loc: directory of checkpoint cost log
+    :return: list of (mcs, generate time (s), write time (s), size (bytes))
+    """
+    log_file = os.path.join(loc, checkpoint_log_name)
+    if not os.path.isfile(log_file):
+        return []
+    with open(log_file, newline='') as fin:
+        return [(int(r[0]), float(r[1]), float(r[2]), int(r[3])) for r in csv.reader(fin, delimiter=',') if r]
+
+
+def summarize_checkpoint_cost(locs: list) -> dict:
+    """
+    Summarize checkpoint cost over checkpoint directories
+    :param locs: directories of checkpoint cost logs
+    :return: dictionary of number of checkpoints, total and mean time (s), and mean size (bytes)
+    """
+    entries = [e for loc in locs for e in read_checkpoint_log(loc)]
+    num_checkpoints = len(entries)
+    if num_checkpoints == 0:
+        return {'num_checkpoints': 0, 'total_time': 0.0, 'mean_time': 0.0, 'mean_size': 0.0}
+    total_time = sum([e[1] + e[2] for e in entries])
+    return {'num_checkpoints': num_checkpoints,
+            'total_time': total_time,
+            'mean_time': total_time / num_checkpoints,
+            'mean_size': sum([e[3] for e in entries]) / num_checkpoints}
+
+
+def filter_picklable(_dict: dict, exclude=None) -> dict:
+    """
+    Filter a dictionary to its picklable items
+    Unpicklable items that are not excluded are dropped with a warning, since they are missing when state is restored
+    :param _dict: dictionary to filter
+    :param exclude: keys to exclude
+    :return: dictionary of picklable items
+    """
+    if exclude is None:
+        exclude = []
+    filtered = dict()
+    dropped = list()
+    for k, v in _dict.items():
+        if k in exclude:
+            continue
+        try:
+            pickle.dumps(v)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            dropped.append(k)
+            continue
+        filtered[k] = v
+    if dropped:
+        warnings.warn(f'Dropped unpicklable items from checkpoint: {sorted(dropped, key=str)}')
+    return filtered
+
+
+def shift_mcs_items(_dict: dict, keys, mcs_shift) -> dict:
+    """
+    Shift the simulation step values of a dictionary, e.g., between the frame of a simulation run started from a
+    checkpoint and the absolute frame of checkpoints
+    :param _dict: dictionary to shift
+    :param keys: keys of simulation step values; missing keys are ignored
+    :param mcs_shift: shift added to simulation step values
+    :return: shifted copy of dictionary
+    """
+    shifted = dict(_dict)
+    for k in keys:
+        if k in shifted.keys():
+            shifted[k] = shifted[k] + mcs_shift
+    return shifted
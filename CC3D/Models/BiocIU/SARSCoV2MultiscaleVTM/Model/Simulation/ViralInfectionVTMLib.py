@@ -1,8 +1,15 @@
 # This is a library for the viral infection modeling project using CompuCell3D
 # by the Biocomplexity Institute at Indiana University
 
+import os
+import sys
+
 from cc3d.cpp import CompuCell
 
+# Import toolkit
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from nCoVToolkit.nCoVUtils import RandomStreams
+
 # Key to mcs value when a cell was created
 new_cell_mcs_key = 'new_cell_mcs'
 
@@ -21,15 +28,92 @@ vr_cell_dict_to_sym = {'Unpacking': 'U',
 # Name of Antimony/SBML model of immune cell recruitment
 ir_model_name = 'immuneRecruitment'
 
+# Key to mcs value when removal of an immune cell began; cells with this key are being removed, and are excluded from
+# model logic until they are deleted from the lattice
+immune_removal_mcs_key = 'removal_mcs'
+
 # Key to reference of ImmuneRecruitmentSteppable instance in shared global dictionary
 ir_steppable_key = 'ir_steppable'
 
 # Key to reference of SimDataSteppable instance in shared global dictionary
 simdata_steppable_key = 'simdata_steppable'
 
+# Key to reference of ChemotaxisSteppable instance in shared global dictionary
+chemotaxis_steppable_key = 'chemotaxis_steppable'
+
 # Key to reference of ViralInternalizationSteppable instance in shared global dictionary
 vim_steppable_key = 'vim_steppable'
 
+# Key to random number streams of a simulation run in shared global dictionary
+rng_streams_key = 'rng_streams'
+
+# Key to seed of random number streams in callable simulation inputs
+rng_seed_key = 'rng_seed'
+
+# Key to reference of CheckpointSteppable instance in shared global dictionary
+checkpoint_steppable_key = 'checkpoint_steppable'
+
+# Key to occupancy of the immune cell layer in shared global dictionary
+immune_occupancy_key = 'immune_occupancy'
+
+# Key to sparse structure of the immune cell layer in shared global dictionary
+immune_layer_key = 'immune_layer'
+
+# Key to spatial hash of immune cell centers of mass in shared global dictionary
+immune_hash_key = 'immune_hash'
+
+# Key to contacts of immune cells with epithelial cells in shared global dictionary
+immune_contacts_key = 'immune_contacts'
+
+# Key to cached pixel coordinates of cells in shared global dictionary
+pixel_index_key = 'pixel_index'
+
+# Key to simulation step offset of a simulation run started from a checkpoint in shared global dictionary
+mcs_offset_key = 'mcs_offset'
+
+# Keys to checkpoint options in callable simulation inputs
+#   checkpoint_load_key: path to checkpoint file from which to start the simulation
+#   checkpoint_restore_rng_key: whether to restore random number streams from the loaded checkpoint (default True);
+#       when False, streams are seeded from the simulation input *rng_seed*
+#   checkpoint_save_steps_key: list of simulation steps at which to write a checkpoint
+#   checkpoint_dir_key: directory to write checkpoints to; defaults to the simulation output directory
+#   checkpoint_stop_key: stop the simulation after writing the last requested checkpoint
+#   checkpoint_frequency_key: frequency of periodic checkpoints, which can be used to resume an interrupted
+#       simulation; only the latest periodic checkpoint is kept (disable with 0)
+checkpoint_load_key = 'checkpoint_load'
+checkpoint_restore_rng_key = 'checkpoint_restore_rng'
+checkpoint_save_steps_key = 'checkpoint_save_steps'
+checkpoint_dir_key = 'checkpoint_dir'
+checkpoint_stop_key = 'checkpoint_stop'
+checkpoint_frequency_key = 'checkpoint_frequency'
+
+# Key to recorded simulation data in the callable simulation return object
+# Recorded data is a dictionary of arrays by data description (e.g., 'pop_data'); rows are recorded steps, the first
+# column is the simulation step and the remaining columns are data values, in the order they are written to file
+sim_data_return_key = 'sim_data'
+
+# Key to statistics of immune cell removal in the callable simulation return object; see
+# ImmuneCellSeedingSteppable.get_removal_stats
+immune_removal_return_key = 'immune_removal'
+
+# Cell dictionary keys of simulation step values; these are stored in checkpoints in the absolute frame, and shifted to
+# the frame of a simulation run started from a checkpoint when loaded
+checkpoint_mcs_dict_keys = [new_cell_mcs_key, 'time_activation', immune_removal_mcs_key]
+
+# Names of diffusive fields
+field_names = ['Virus', 'cytokine', 'oxidator']
+
+# Names of random number streams by subsystem
+rng_internalization = 'internalization'
+rng_death = 'death'
+rng_seeding = 'seeding'
+rng_bystander = 'bystander'
+rng_activation = 'activation'
+rng_recovery = 'recovery'
+rng_susceptibility = 'susceptibility'
+# Name of seed of the Potts (Metropolis) random number generator
+rng_potts = 'potts'
+
 
 # todo: Generalize Antimony model string generator for general use
 def viral_replication_model_string(_unpacking_rate, _replicating_rate, _r_half, _translating_rate, _packing_rate,
@@ -184,3 +268,82 @@ def reset_viral_replication_variables(cell):
 
 def get_assembled_viral_load_inside_cell(cell, sbml_rate):
     return sbml_rate*cell.dict['Uptake'] + cell.dict['Assembled']
+
+
+def get_sim_input(key, default=None):
+    """
+    Gets a callable simulation input by name
+    :param key: name of simulation input
+    :param default: value returned when the input is not available
+    :return: value of simulation input
+    """
+    from cc3d.CompuCellSetup import persistent_globals as pg
+    input_object = getattr(pg, 'input_object', None)
+    if isinstance(input_object, dict) and key in input_object.keys():
+        return input_object[key]
+    return default
+
+
+def set_sim_output(key, val) -> None:
+    """
+    Sets an item of the callable simulation return object
+    :param key: name of simulation output
+    :param val: value of simulation output
+    :return: None
+    """
+    from cc3d.CompuCellSetup import persistent_globals as pg
+    if not isinstance(getattr(pg, 'return_object', None), dict):
+        pg.return_object = dict()
+    pg.return_object[key] = val
+
+
+def get_potts_seed():
+    """
+    Gets the seed of the Potts (Metropolis) random number generator of the current simulation run
+    The seed is derived from the callable simulation input *rng_seed* and the simulation step offset, so that runs
+    with equal seeds share Potts draws, and a run started from a checkpoint does not replay the Potts draws of the
+    run that wrote the checkpoint. The state of the Potts generator is not stored in checkpoints, so a resumed run is
+    reproducible from its seed and checkpoint, but does not reproduce the Potts draws of an uninterrupted run
+    :return: seed; None if *rng_seed* is not available, in which case CompuCell3D seeds the generator
+    """
+    if get_sim_input(rng_seed_key) is None:
+        return None
+    return get_rng_streams().get_seed(rng_potts, get_mcs_offset())
+
+
+def get_mcs_offset() -> int:
+    """
+    Gets the simulation step offset of the current simulation run; non-zero when started from a checkpoint
+    :return: simulation step at which the current simulation run started
+    """
+    from cc3d.CompuCellSetup import persistent_globals as pg
+    if mcs_offset_key not in pg.shared_steppable_vars.keys():
+        checkpoint_file = get_sim_input(checkpoint_load_key)
+        if checkpoint_file is None:
+            mcs_offset = 0
+        else:
+            from ViralInfectionVTMCheckpoint import read_checkpoint_header
+            mcs_offset = read_checkpoint_header(checkpoint_file)['mcs'] + 1
+        pg.shared_steppable_vars[mcs_offset_key] = mcs_offset
+    return pg.shared_steppable_vars[mcs_offset_key]
+
+
+def get_rng_streams() -> RandomStreams:
+    """
+    Gets the random number streams of the current simulation run; streams are created on first request and seeded
+    with the callable simulation input *rng_seed*, if available
+    :return: random number streams of the current simulation run
+    """
+    from cc3d.CompuCellSetup import persistent_globals as pg
+    if rng_streams_key not in pg.shared_steppable_vars.keys():
+        pg.shared_steppable_vars[rng_streams_key] = RandomStreams(get_sim_input(rng_seed_key))
+    return pg.shared_steppable_vars[rng_streams_key]
+
+
+def get_rng(name: str):
+    """
+    Gets the random number generator of a subsystem for the current simulation run
+    :param name: name of subsystem stream (e.g., rng_internalization)
+    :return: numpy random number generator
+    """
+    return get_rng_streams().get_stream(name)
@@ -10,6 +10,8 @@ __param_desc__ = {}
 # Data control options
 __param_desc__['track_model_variables'] = 'Enables cell-level tracking of model variables (for rendering)'
 track_model_variables = False  # Set to true to enable cell-level tracking of model variables (for rendering)
+__param_desc__['write_data_files'] = 'Write recorded data to files in simulation directory'
+write_data_files = True  # Write recorded data to files (recorded data is also returned to callers)
 __param_desc__['plot_vrm_data_freq'] = 'Plot viral replication model data frequency'
 plot_vrm_data_freq = 0  # Plot viral replication model data frequency (disable with 0)
 __param_desc__['write_vrm_data_freq'] = 'Write viral replication model data to simulation directory frequency'
@@ -38,6 +40,12 @@ __param_desc__['plot_death_data_freq'] = 'Plot death data frequency'
 plot_death_data_freq = 0  # Plot death data frequency (disable with 0)
 __param_desc__['write_death_data_freq'] = 'Write death data to simulation directory frequency'
 write_death_data_freq = 0  # Write death data to simulation directory frequency (disable with 0)
+__param_desc__['write_snapshot_freq'] = 'Write compact lattice snapshots to simulation directory frequency'
+write_snapshot_freq = 0  # Write compact lattice snapshots to simulation directory frequency (disable with 0)
+__param_desc__['write_snapshot_keyframe_freq'] = 'Number of snapshots from one snapshot keyframe to the next'
+write_snapshot_keyframe_freq = 0  # Snapshots between keyframes store changed cell types and ids (every frame with 0)
+__param_desc__['write_snapshot_field_freq'] = 'Write field data to snapshots frequency'
+write_snapshot_field_freq = 1  # Frequency in snapshots, so that fields can be written less often than cells
 
 # Conversion Factors
 __param_desc__['s_to_mcs'] = 'Simulation step'
@@ -205,6 +213,10 @@ max_oxi_secrete = max_ck_secrete_infect
 __param_desc__['oxi_death_thr'] = 'Tissue cell Oxidation Agent threshold for death'
 oxi_death_thr = 1.5
 
+# Calculate the amount of a field seen by a cell exactly from its pixels, rather than from its center of mass
+__param_desc__['exact_seen_field'] = 'Calculate amount of field seen by cells exactly from cell pixels'
+exact_seen_field = False
+
 
 # Threshold at which cell infection is evaluated
 __param_desc__['cell_infection_threshold'] = 'Threshold of assembled viral particles above which infected become infectedSecreting'
@@ -243,6 +255,10 @@ bystander_effect = 2.0/4.0
 __param_desc__['lamda_chemotaxis'] = 'Lambda chemotaxis (chemotactic sensitivity)'
 # lamda_chemotaxis = 100.0
 lamda_chemotaxis = 100.0/100.0
+# Relative tolerance of changes in local concentration of activated immune cells, relative to one plus the
+# concentration of the last update, above which chemotaxis lambdas are updated (update on every change with 0)
+__param_desc__['chemotaxis_lambda_tol'] = 'Relative tolerance of concentration changes that update chemotaxis lambda'
+chemotaxis_lambda_tol = 0.0
 
 # Antimony/SBML model step size
 __param_desc__['vr_step_size'] = 'Antimony/SBML model step size'
@@ -290,3 +306,23 @@ ir_transmission_coeff = 5E-1
 # Scales state variable in probability functions
 __param_desc__['ir_prob_scaling_factor'] = 'Immune response probability scaling coefficient'
 ir_prob_scaling_factor = 1.0 / 100.0
+
+# Immune recruitment placement parameters
+# Number of free candidate sites scored per seeding (all free sites with 0)
+__param_desc__['ir_seeding_num_candidates'] = 'Number of free candidate sites scored per immune cell seeding'
+ir_seeding_num_candidates = 10
+# Field that scores candidate sites; the field is sampled in the immune cell layer
+__param_desc__['ir_seeding_field'] = 'Field that scores immune cell seeding sites (Virus or cytokine)'
+ir_seeding_field = 'Virus'
+# Select sites randomly with probability proportional to score, rather than by highest score
+__param_desc__['ir_seeding_weighted'] = 'Select immune cell seeding sites with probability proportional to score'
+ir_seeding_weighted = False
+# Minimum distance of seeding sites from the center of the domain
+__param_desc__['ir_seeding_min_center_dist'] = 'Minimum distance of immune cell seeding sites from the domain center'
+ir_seeding_min_center_dist = 10
+# Number of seeding trials per step; each trial seeds an immune cell with the immune cell seeding probability
+__param_desc__['ir_seeding_max_per_step'] = 'Maximum number of immune cells seeded per step'
+ir_seeding_max_per_step = 1
+# Volume below which removed immune cells are deleted from the lattice
+__param_desc__['immune_removal_volume'] = 'Volume below which removed immune cells are deleted'
+immune_removal_volume = cell_volume / 3
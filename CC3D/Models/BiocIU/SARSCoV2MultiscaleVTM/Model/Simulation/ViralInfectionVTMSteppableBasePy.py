@@ -4,6 +4,8 @@
 import os
 import sys
 
+import numpy as np
+
 # Import project libraries
 sys.path.append(os.path.dirname(__file__))
 import ViralInfectionVTMLib
@@ -11,6 +13,7 @@ import ViralInfectionVTMLib
 # Import toolkit
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from nCoVToolkit.nCoVSteppableBase import nCoVSteppableBase
+from nCoVToolkit import nCoVSpatial
 from nCoVToolkit import nCoVUtils
 
 
@@ -138,23 +141,241 @@ class ViralInfectionVTMSteppableBasePy(nCoVSteppableBase):
         cell.dict['tot_ck_upt'] = 0
         return cell
 
-    def total_seen_field(self, field, cell, estimate=True):
+    def immune_cell_list(self) -> list:
+        """
+        Gets immune cells that are not being removed; see remove_immune_cell
+        :return: list of immune cells
+        """
+        return [cell for cell in self.cell_list_by_type(self.IMMUNECELL)
+                if ViralInfectionVTMLib.immune_removal_mcs_key not in cell.dict.keys()]
+
+    def remove_immune_cell(self, cell, mcs=None):
+        """
+        Begins removal of an immune cell
+        The cell shrinks and is excluded from model logic and counts, and is deleted from the lattice when small enough;
+        see ImmuneCellSeedingSteppable
+        :param cell: immune cell to remove
+        :param mcs: step when removal begins; defaults from steppable mcs attribute
+        :return: None
+        """
+        if mcs is None:
+            mcs = max(self.mcs, 0)
+        cell.targetVolume = 0.0
+        cell.dict[ViralInfectionVTMLib.immune_removal_mcs_key] = mcs
+
+    def get_immune_layer(self, refresh=False) -> nCoVSpatial.SparseLayer:
+        """
+        Gets the occupied voxels of the immune cell layer (z = 1) as a sparse structure
+        The layer is rebuilt from the pixels of immune cells, including cells that are being removed, on the first
+        request of each step, or when requested
+        :param refresh: rebuild the layer, e.g., after cells were added or deleted in the current step
+        :return: sparse immune cell layer
+        """
+        immune_layer = self.shared_steppable_vars.get(ViralInfectionVTMLib.immune_layer_key, None)
+        if immune_layer is None:
+            immune_layer = nCoVSpatial.SparseLayer(self.dim.x, self.dim.y)
+            self.shared_steppable_vars[ViralInfectionVTMLib.immune_layer_key] = immune_layer
+        if refresh or immune_layer.step != self.mcs:
+            coords, cell_id, cell_type = [], [], []
+            for cell in self.cell_list_by_type(self.IMMUNECELL):
+                for ptd in self.get_cell_pixel_list(cell):
+                    if ptd.pixel.z == 1:
+                        coords.append((ptd.pixel.x, ptd.pixel.y))
+                        cell_id.append(cell.id)
+                        cell_type.append(cell.type)
+            immune_layer.set_voxels(coords, cell_id, cell_type)
+            immune_layer.step = self.mcs
+        return immune_layer
+
+    def get_immune_occupancy(self, block_size) -> nCoVSpatial.OccupancyGrid:
+        """
+        Gets the occupancy of the immune cell layer (z = 1) for the current step
+        Occupancy is rebuilt from the sparse immune cell layer on the first request of each step, so that it reflects
+        immune cells that moved or shrank; steppables that add immune cells should mark their blocks with set_block
+        :param block_size: side length of blocks of free space queries (e.g., cell diameter)
+        :return: occupancy grid of the immune cell layer
+        """
+        occupancy = self.shared_steppable_vars.get(ViralInfectionVTMLib.immune_occupancy_key, None)
+        if occupancy is None or occupancy.block_size != block_size:
+            occupancy = nCoVSpatial.OccupancyGrid(self.dim.x, self.dim.y, block_size)
+            self.shared_steppable_vars[ViralInfectionVTMLib.immune_occupancy_key] = occupancy
+        if occupancy.step != self.mcs:
+            immune_layer = self.get_immune_layer()
+            occupancy.clear()
+            occupancy.set_occupied(immune_layer.coords[:, 0], immune_layer.coords[:, 1])
+            occupancy.step = self.mcs
+        return occupancy
+
+    def get_immune_hash(self, bin_size) -> nCoVSpatial.SpatialHash:
+        """
+        Gets a spatial hash of the centers of mass of immune cells for the current step
+        The hash is rebuilt from immune cells that are not being removed on the first request of each step, and is
+        periodic along dimensions with periodic lattice boundary conditions; points are identified by cell id
+        :param bin_size: minimum side length of hash bins (e.g., typical query radius)
+        :return: spatial hash of immune cell centers of mass
+        """
+        immune_hash = self.shared_steppable_vars.get(ViralInfectionVTMLib.immune_hash_key, None)
+        if immune_hash is None or immune_hash.bin_size != float(bin_size):
+            immune_hash = nCoVSpatial.SpatialHash(self.dim.x, self.dim.y, bin_size,
+                                                  periodic_x=self.potts.getBoundaryXName().lower() == 'periodic',
+                                                  periodic_y=self.potts.getBoundaryYName().lower() == 'periodic')
+            self.shared_steppable_vars[ViralInfectionVTMLib.immune_hash_key] = immune_hash
+        if immune_hash.step != self.mcs:
+            cells = self.immune_cell_list()
+            immune_hash.set_points([(cell.xCOM, cell.yCOM) for cell in cells], [cell.id for cell in cells])
+            immune_hash.step = self.mcs
+        return immune_hash
+
+    def immune_cells_in_radius(self, x, y, radius, bin_size) -> list:
+        """
+        Gets immune cells with a center of mass within a radius of a location, sorted by distance; see get_immune_hash
+        :param x: x-coordinate of location
+        :param y: y-coordinate of location
+        :param radius: query radius
+        :param bin_size: minimum side length of hash bins
+        :return: list of immune cells
+        """
+        return [self.fetch_cell_by_id(int(cell_id))
+                for cell_id in self.get_immune_hash(bin_size).query_radius(x, y, radius)]
+
+    def immune_cells_nearest(self, x, y, k, bin_size) -> list:
+        """
+        Gets the k immune cells with centers of mass nearest to a location, sorted by distance; see get_immune_hash
+        :param x: x-coordinate of location
+        :param y: y-coordinate of location
+        :param k: number of cells
+        :param bin_size: minimum side length of hash bins
+        :return: list of immune cells; fewer than k if there are fewer immune cells
+        """
+        return [self.fetch_cell_by_id(int(cell_id))
+                for cell_id in self.get_immune_hash(bin_size).query_nearest(x, y, k)]
+
+    def get_lattice_cell_arrays(self):
+        """
+        Gets the cell type and cell id of every voxel of the lattice
+        Voxels of immune cells are taken from the sparse immune cell layer, and voxels of all other cells from their
+        cached pixel coordinates (see get_cell_pixel_index), so that no voxel of the lattice is visited; immune cells
+        are assumed to occupy only the immune cell layer, since the epithelial sheet fills the layer below
+        :return: arrays of cell type and cell id shaped like the lattice; zero for medium
+        """
+        cell_type = np.zeros(shape=(self.dim.x, self.dim.y, self.dim.z), dtype=np.uint8)
+        cell_id = np.zeros(shape=(self.dim.x, self.dim.y, self.dim.z), dtype=np.int64)
+
+        cells = [cell for cell in self.cell_list if cell.type != self.IMMUNECELL]
+        if cells:
+            pixels = [self.get_cell_pixel_index(cell) for cell in cells]
+            num_pixels = [p.shape[0] for p in pixels]
+            pixels = np.concatenate(pixels, axis=0)
+            cell_type[pixels[:, 0], pixels[:, 1], pixels[:, 2]] = np.repeat([cell.type for cell in cells], num_pixels)
+            cell_id[pixels[:, 0], pixels[:, 1], pixels[:, 2]] = np.repeat([cell.id for cell in cells], num_pixels)
+
+        immune_layer = self.get_immune_layer(refresh=True)
+        immune_layer.fill_layer(cell_type[:, :, 1], immune_layer.cell_type)
+        immune_layer.fill_layer(cell_id[:, :, 1], immune_layer.cell_id)
+
+        return cell_type, cell_id
+
+    def get_immune_contacts(self) -> list:
+        """
+        Gets the contacts of immune cells with epithelial cells for the current step
+        Contacts are collected from the neighbors of immune cells on the first request of each step, so that their cost
+        scales with the number of immune cells, and are shared by all steppables of the step; cell types may change
+        after contacts are collected
+        :return: list of (immune cell, epithelial cell, common surface area)
+        """
+        immune_contacts = self.shared_steppable_vars.get(ViralInfectionVTMLib.immune_contacts_key, None)
+        if immune_contacts is None or immune_contacts['step'] != self.mcs:
+            contacts = []
+            for cell in self.immune_cell_list():
+                for neighbor, common_surface_area in self.get_cell_neighbor_data_list(cell):
+                    if neighbor and neighbor.type != self.IMMUNECELL:
+                        contacts.append((cell, neighbor, common_surface_area))
+            immune_contacts = {'step': self.mcs, 'contacts': contacts}
+            self.shared_steppable_vars[ViralInfectionVTMLib.immune_contacts_key] = immune_contacts
+        return immune_contacts['contacts']
+
+    @staticmethod
+    def get_rng(name: str):
+        """
+        Gets the random number generator of a subsystem; all stochastic model logic should draw from a subsystem
+        generator so that runs are reproducible from the callable simulation input *rng_seed*
+        :param name: name of subsystem stream (e.g., ViralInfectionVTMLib.rng_internalization)
+        :return: numpy random number generator
+        """
+        return ViralInfectionVTMLib.get_rng(name)
+
+    def get_cell_pixel_index(self, cell):
+        """
+        Gets the coordinates of the pixels of a cell
+        Coordinates are cached by cell id. Coordinates of immune cells, which move, are collected once per step, since
+        pixels of a cell can change without changing its volume or center of mass. Coordinates of all other cells,
+        which are frozen, are only collected again when the volume or center of mass of the cell changes (e.g., when
+        set on the lattice by a steppable)
+        :param cell: the cell
+        :return: array of pixel coordinates shaped (pixel, 3)
+        """
+        pixel_index = self.shared_steppable_vars.get(ViralInfectionVTMLib.pixel_index_key, None)
+        if pixel_index is None:
+            pixel_index = dict()
+            self.shared_steppable_vars[ViralInfectionVTMLib.pixel_index_key] = pixel_index
+        signature = (cell.volume, cell.xCOM, cell.yCOM, cell.zCOM)
+        if cell.type == self.IMMUNECELL:
+            signature += (self.mcs,)
+        entry = pixel_index.get(cell.id, None)
+        if entry is None or entry[0] != signature:
+            pixels = np.array([(ptd.pixel.x, ptd.pixel.y, ptd.pixel.z) for ptd in self.get_cell_pixel_list(cell)],
+                              dtype=int).reshape((-1, 3))
+            entry = (signature, pixels)
+            pixel_index[cell.id] = entry
+        return entry[1]
+
+    def total_seen_field(self, field, cell, estimate=True, field_array=None):
         """
         Calculates total value of field in the cell.
         :param field: the field to be looked
         :param cell: the cell
         :param estimate: when true assumes homogeneous field. false is slower
+        :param field_array: values of the field as an array shaped like the lattice, if available; see
+            total_seen_field_cells
         :return: calculated total field value
         """
         if estimate:
             tot_field = field[cell.xCOM, cell.yCOM, cell.zCOM] * cell.volume
         else:
-            tot_field = 0
-            for ptd in self.get_cell_pixel_list(cell):
-                tot_field += field[ptd.pixel.x, ptd.pixel.y, ptd.pixel.z]
+            tot_field = float(self.total_seen_field_cells(field, [cell], estimate, field_array)[0])
 
         return tot_field
 
+    def total_seen_field_cells(self, field, cells, estimate=True, field_array=None):
+        """
+        Calculates total value of field in each of a list of cells
+        Exact totals gather the field at the cached pixels of all cells and sum them per cell with one bincount
+        :param field: the field to be looked
+        :param cells: list of cells
+        :param estimate: when true assumes homogeneous field
+        :param field_array: values of the field as an array shaped like the lattice, if available; the field is read
+            at each pixel otherwise
+        :return: array of calculated total field values
+        """
+        if not cells:
+            return np.zeros(shape=(0,))
+        if estimate:
+            if field_array is not None:
+                com = np.array([(cell.xCOM, cell.yCOM, cell.zCOM) for cell in cells]).astype(int)
+                val = field_array[com[:, 0], com[:, 1], com[:, 2]]
+            else:
+                val = np.array([field[cell.xCOM, cell.yCOM, cell.zCOM] for cell in cells])
+            return val * np.array([cell.volume for cell in cells], dtype=float)
+
+        pixels = [self.get_cell_pixel_index(cell) for cell in cells]
+        cell_idx = np.repeat(np.arange(len(cells)), [p.shape[0] for p in pixels])
+        pixels = np.concatenate(pixels, axis=0)
+        if field_array is not None:
+            val = field_array[pixels[:, 0], pixels[:, 1], pixels[:, 2]]
+        else:
+            val = np.array([field[x, y, z] for x, y, z in pixels.tolist()], dtype=float)
+        return np.bincount(cell_idx, weights=val, minlength=len(cells))
+
     def kill_cell(self, cell):
         """
         Model-specific cell death routines
@@ -16,17 +16,18 @@ import math
 from cc3d.core.PySteppables import *
 import numpy as np
 
-rng = np.random  # alias for random number generators (rng)
-
 # Import project libraries and classes
 sys.path.append(os.path.dirname(__file__))
 from ViralInfectionVTMSteppableBasePy import *
 import ViralInfectionVTMLib
+import ViralInfectionVTMCheckpoint
 from ViralInfectionVTMModelInputs import *
 
 # Import toolkit
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from nCoVToolkit import nCoVUtils
+from nCoVToolkit import nCoVSnapshot
+from nCoVToolkit import nCoVSpatial
 
 
 class CellsInitializerSteppable(ViralInfectionVTMSteppableBasePy):
@@ -41,10 +42,19 @@ class CellsInitializerSteppable(ViralInfectionVTMSteppableBasePy):
         self.get_xml_element('virus_dc').cdata = virus_dc
         self.get_xml_element('virus_decay').cdata = virus_decay
 
+        # Seed Potts with the random number streams of this run, if seeded
+        potts_seed = ViralInfectionVTMLib.get_potts_seed()
+        if potts_seed is not None:
+            self.get_xml_element('potts_seed').cdata = potts_seed
+
         # Enforce compatible lattice dimensions with epithelial cell size
         assert self.dim.x % cell_diameter == 0 and self.dim.y % cell_diameter == 0, \
             f'Lattice dimensions must be multiples of the unitless cell diameter (currently cell_diameter = {cell_diameter})'
 
+        # Initial configuration is loaded by CheckpointSteppable when starting from a checkpoint
+        if ViralInfectionVTMLib.get_sim_input(ViralInfectionVTMLib.checkpoint_load_key) is not None:
+            return
+
         for x in range(0, self.dim.x, int(cell_diameter)):
             for y in range(0, self.dim.y, int(cell_diameter)):
                 cell = self.new_uninfected_cell_in_time()
@@ -78,18 +88,17 @@ class CellsInitializerSteppable(ViralInfectionVTMSteppableBasePy):
 
         cell.dict['ck_production'] = max_ck_secrete_infect
 
+        rng = self.get_rng(ViralInfectionVTMLib.rng_seeding)
+        occupancy = self.get_immune_occupancy(int(cell_diameter))
         for iteration in range(int(initial_immune_seeding)):
-            cell = True
-            while cell:
-                xi = np.random.randint(0, self.dim.x - 2 * cell_diameter)
-                yi = np.random.randint(0, self.dim.y - 2 * cell_diameter)
-                for x in range(xi, xi + int(cell_diameter)):
-                    for y in range(yi, yi + int(cell_diameter)):
-                        cell = self.cell_field[x, y, 1]
-                        break
-                cell = False
+            free_blocks = occupancy.get_free_blocks(self.dim.x - 2 * int(cell_diameter),
+                                                    self.dim.y - 2 * int(cell_diameter))
+            if free_blocks.shape[0] == 0:
+                break
+            x, y = [int(v) for v in free_blocks[rng.integers(0, free_blocks.shape[0])]]
             cell = self.new_immune_cell_in_time(ck_production=max_ck_secrete_im, ck_consumption=max_ck_consume)
             self.cell_field[x:x + int(cell_diameter), y:y + int(cell_diameter), 1] = cell
+            occupancy.set_block(x, y)
             cell.targetVolume = cell_volume
             cell.lambdaVolume = volume_lm
             cell.dict['activated'] = False  # flag for immune cell being naive or activated
@@ -128,6 +137,8 @@ class ViralReplicationSteppable(ViralInfectionVTMSteppableBasePy):
         cell = self.cellField[self.dim.x / 2, self.dim.y / 2, 0]
         self.simdata_steppable.set_vrm_tracked_cell(cell=cell)
 
+        rng = self.get_rng(ViralInfectionVTMLib.rng_death)
+
         # Do viral model
         for cell in self.cell_list_by_type(self.INFECTED, self.VIRUSRELEASING):
             # Step the model for this cell
@@ -145,9 +156,9 @@ class ViralReplicationSteppable(ViralInfectionVTMSteppableBasePy):
 
             # Test for cell death
             if cell.type == self.VIRUSRELEASING and \
-                    np.random.random() < nCoVUtils.hill_equation(cell.dict['Assembled'],
-                                                                 diss_coeff_uptake_apo,
-                                                                 hill_coeff_uptake_apo):
+                    rng.random() < nCoVUtils.hill_equation(cell.dict['Assembled'],
+                                                           diss_coeff_uptake_apo,
+                                                           hill_coeff_uptake_apo):
                 self.kill_cell(cell=cell)
                 self.simdata_steppable.track_death_viral()
 
@@ -177,7 +188,7 @@ class ViralInternalizationSteppable(ViralInfectionVTMSteppableBasePy):
                                                      diss_coeff_uptake_pr,
                                                      hill_coeff_uptake_pr)
 
-        cell_does_uptake = np.random.rand() < uptake_probability
+        cell_does_uptake = self.get_rng(ViralInfectionVTMLib.rng_internalization).random() < uptake_probability
         uptake_amount = s_to_mcs / rate_coeff_uptake_pr * uptake_probability
 
         if cell_does_uptake and cell.type == self.UNINFECTED:
@@ -223,11 +234,15 @@ class ViralSecretionSteppable(ViralInfectionVTMSteppableBasePy):
                 self.shared_steppable_vars[ViralInfectionVTMLib.vim_steppable_key]
 
         secretor = self.get_field_secretor("Virus")
-        for cell in self.cell_list_by_type(self.UNINFECTED, self.INFECTED, self.VIRUSRELEASING):
+        cells = list(self.cell_list_by_type(self.UNINFECTED, self.INFECTED, self.VIRUSRELEASING))
+
+        # Uptake and secretion only change the field inside of each cell, so seen amounts can be calculated up front
+        viral_amounts = self.total_seen_field_cells(self.field.Virus, cells, not exact_seen_field)
+
+        for cell, viral_amount_com in zip(cells, viral_amounts):
 
             # Evaluate probability of cell uptake of viral particles from environment
             # If cell isn't infected, it changes type to infected here if uptake occurs
-            viral_amount_com = self.field.Virus[cell.xCOM, cell.yCOM, cell.zCOM] * cell.volume
             cell_does_uptake, uptake_amount = self.vim_steppable.do_cell_internalization(cell, viral_amount_com)
             if cell_does_uptake:
                 uptake = secretor.uptakeInsideCellTotalCount(cell, 1E12, uptake_amount / cell.volume)
@@ -243,6 +258,7 @@ class ViralSecretionSteppable(ViralInfectionVTMSteppableBasePy):
 class ImmuneCellKillingSteppable(ViralInfectionVTMSteppableBasePy):
     """
     Implements immune cell direct cytotoxicity and bystander effect module
+    Killing starts from the contacts of immune cells, so that its cost scales with the number of immune cells
     """
     def __init__(self, frequency=1):
         ViralInfectionVTMSteppableBasePy.__init__(self, frequency)
@@ -255,35 +271,52 @@ class ImmuneCellKillingSteppable(ViralInfectionVTMSteppableBasePy):
             self.simdata_steppable: SimDataSteppable = \
                 self.shared_steppable_vars[ViralInfectionVTMLib.simdata_steppable_key]
 
-        killed_cells = []
-        for cell in self.cell_list_by_type(self.INFECTED, self.VIRUSRELEASING):
-            for neighbor, common_surface_area in self.get_cell_neighbor_data_list(cell):
-                if neighbor:
-                    if neighbor.type == self.IMMUNECELL:
-                        self.kill_cell(cell=cell)
-                        killed_cells.append(cell)
-                        self.simdata_steppable.track_death_contact()
-
-        # Bystander Effect
-        for cell in killed_cells:
+        # Direct cytotoxicity: infected cells in contact with an immune cell are killed once
+        killed_cells = dict()
+        for immune_cell, cell, common_surface_area in self.get_immune_contacts():
+            if cell.id not in killed_cells.keys() and cell.type in [self.INFECTED, self.VIRUSRELEASING]:
+                self.kill_cell(cell=cell)
+                killed_cells[cell.id] = cell
+                self.simdata_steppable.track_death_contact()
+
+        # Bystander Effect: each contact of a killed cell with a living epithelial cell is a trial
+        bystander_candidates = []
+        for cell in killed_cells.values():
             for neighbor, common_surface_area in self.get_cell_neighbor_data_list(cell):
-                if neighbor:
-                    if neighbor.type in [self.INFECTED, self.VIRUSRELEASING, self.UNINFECTED]:
-                        p_bystander_effect = np.random.random()
-                        if p_bystander_effect < bystander_effect:
-                            self.kill_cell(cell=neighbor)
-                            self.simdata_steppable.track_death_bystander()
+                if neighbor and neighbor.type in [self.INFECTED, self.VIRUSRELEASING, self.UNINFECTED]:
+                    bystander_candidates.append(neighbor)
+        if not bystander_candidates:
+            return
+
+        rng = self.get_rng(ViralInfectionVTMLib.rng_bystander)
+        p_bystander_effect = rng.random(len(bystander_candidates))
+        bystander_killed = set()
+        for neighbor in [c for c, p in zip(bystander_candidates, p_bystander_effect) if p < bystander_effect]:
+            if neighbor.id not in bystander_killed:
+                self.kill_cell(cell=neighbor)
+                bystander_killed.add(neighbor.id)
+                self.simdata_steppable.track_death_bystander()
 
 
 class ChemotaxisSteppable(ViralInfectionVTMSteppableBasePy):
     """
     Implements immune cell chemotaxis module
+    Chemotaxis lambdas are only updated when the activation of an immune cell changes, or when the local concentration
+    of an activated immune cell changes by more than a tolerance since its last update; see chemotaxis_lambda_tol
     """
 
     def __init__(self, frequency=1):
         ViralInfectionVTMSteppableBasePy.__init__(self, frequency)
 
+        # Activation and local concentration of the last lambda update of each immune cell, by cell id
+        self.__applied = dict()
+        # Number of applied and skipped lambda updates
+        self.num_updates_applied = 0
+        self.num_updates_skipped = 0
+
     def start(self):
+        self.shared_steppable_vars[ViralInfectionVTMLib.chemotaxis_steppable_key] = self
+
         for cell in self.cell_list_by_type(self.IMMUNECELL):
 
             cd = self.chemotaxisPlugin.addChemotaxisData(cell, "cytokine")
@@ -295,21 +328,52 @@ class ChemotaxisSteppable(ViralInfectionVTMSteppableBasePy):
 
     def step(self, mcs):
         field = self.field.Virus
-        for cell in self.cell_list_by_type(self.IMMUNECELL):
-
+        cells = self.immune_cell_list()
+        if not cells:
+            self.__applied.clear()
+            return
+
+        concentration = np.array([field[cell.xCOM, cell.yCOM, 1] for cell in cells])
+        activated = np.array([bool(cell.dict['activated']) for cell in cells])
+        applied = [self.__applied.get(cell.id, None) for cell in cells]
+        applied_known = np.array([x is not None for x in applied])
+        applied_activated = np.array([x is not None and x[0] for x in applied])
+        applied_concentration = np.array([x[1] if x is not None else 0.0 for x in applied])
+
+        update = ~applied_known | (activated != applied_activated)
+        update |= activated & (np.abs(concentration - applied_concentration) >
+                               chemotaxis_lambda_tol * (1.0 + applied_concentration))
+        lambdas = np.where(activated, lamda_chemotaxis / (1.0 + concentration), 0.0)
+
+        for idx in np.flatnonzero(update):
+            cell = cells[idx]
             cd = self.chemotaxisPlugin.getChemotaxisData(cell, "cytokine")
-            concentration = field[cell.xCOM, cell.yCOM, 1]
-            constant = lamda_chemotaxis
-            l = constant / (1.0 + concentration)
-            if cell.dict['activated']:
-                cd.setLambda(l)
-            else:
-                cd.setLambda(0)
+            cd.setLambda(float(lambdas[idx]))
+            self.__applied[cell.id] = (bool(activated[idx]), float(concentration[idx]))
+
+        num_updates = int(np.sum(update))
+        self.num_updates_applied += num_updates
+        self.num_updates_skipped += len(cells) - num_updates
+
+        # Forget removed cells
+        if len(self.__applied) > len(cells):
+            cell_ids = set([cell.id for cell in cells])
+            self.__applied = {k: v for k, v in self.__applied.items() if k in cell_ids}
+
+    def get_update_counts(self) -> dict:
+        """
+        Get the numbers of applied and skipped chemotaxis lambda updates
+        :return: dictionary of numbers of applied ('applied') and skipped ('skipped') updates
+        """
+        return {'applied': self.num_updates_applied, 'skipped': self.num_updates_skipped}
 
 
 class ImmuneCellSeedingSteppable(ViralInfectionVTMSteppableBasePy):
     """
     Implements immune cell seeding and removal of immune cell recruitment module
+    Removed immune cells shrink and are excluded from model logic until their volume falls below
+    immune_removal_volume, when they are deleted from the lattice; the number of steps that removed cells linger on the
+    lattice is recorded and returned to callable simulation callers; see ViralInfectionVTMLib.immune_removal_return_key
     """
 
     def __init__(self, frequency=1):
@@ -318,40 +382,28 @@ class ImmuneCellSeedingSteppable(ViralInfectionVTMSteppableBasePy):
         # Reference to ImmuneResponseSteppable
         self.ir_steppable = None
 
+        # Number of steps between beginning of removal and deletion of each deleted immune cell
+        self.removal_linger_times = []
+
     def step(self, mcs):
         if self.ir_steppable is None:
             self.ir_steppable: ImmuneRecruitmentSteppable = \
                 self.shared_steppable_vars[ViralInfectionVTMLib.ir_steppable_key]
 
-        for cell in self.cell_list_by_type(self.IMMUNECELL):
-            p_immune_dying = np.random.random()
+        rng = self.get_rng(ViralInfectionVTMLib.rng_seeding)
+
+        self.delete_removed_immune_cells(mcs)
+
+        for cell in self.immune_cell_list():
+            p_immune_dying = rng.random()
             if p_immune_dying < self.ir_steppable.get_immune_removal_prob():
-                cell.targetVolume = 0.0
-
-        p_immune_seeding = np.random.random()
-        if p_immune_seeding < self.ir_steppable.get_immune_seeding_prob():
-            open_space = True
-            viral_concentration = 0
-            for iteration in range(10):
-                radius = 10
-                length = 0
-                while length <= radius:
-                    xi = np.random.randint(0, self.dim.x - 2 * cell_diameter)
-                    yi = np.random.randint(0, self.dim.y - 2 * cell_diameter)
-                    length = np.sqrt((self.dim.x // 2 - xi) ** 2 + (self.dim.y // 2 - yi) ** 2)
-                for x in range(xi, xi + int(cell_diameter)):
-                    for y in range(yi, yi + int(cell_diameter)):
-                        cell = self.cellField[x, y, 1]
-                        if cell:
-                            open_space = False
-                            break
-                if open_space:
-                    concentration_iteration = self.field.Virus[xi, yi, 1]
-                    if concentration_iteration >= viral_concentration:
-                        viral_concentration = concentration_iteration
-                        x_seed = xi
-                        y_seed = yi
-            if open_space:
+                self.remove_immune_cell(cell, mcs)
+
+        # Each seeding trial seeds an immune cell with the seeding probability
+        p_immune_seeding = rng.random(int(ir_seeding_max_per_step))
+        num_seeding = int(np.sum(p_immune_seeding < self.ir_steppable.get_immune_seeding_prob()))
+        if num_seeding > 0:
+            for x_seed, y_seed in self.select_immune_seeding_sites(num_seeding, rng):
                 cell = self.new_immune_cell_in_time(ck_production=max_ck_secrete_im, ck_consumption=max_ck_consume)
 
                 self.cellField[x_seed:x_seed + int(cell_diameter), y_seed:y_seed + int(cell_diameter), 1] = cell
@@ -365,10 +417,72 @@ class ImmuneCellSeedingSteppable(ViralInfectionVTMSteppableBasePy):
                 cell.targetVolume = cell_volume
                 cell.lambdaVolume = volume_lm
 
+    def finish(self):
+        ViralInfectionVTMLib.set_sim_output(ViralInfectionVTMLib.immune_removal_return_key, self.get_removal_stats())
+
+    def delete_removed_immune_cells(self, mcs):
+        """
+        Deletes immune cells that are being removed and whose volume is below immune_removal_volume
+        :param mcs: current simulation step
+        :return: None
+        """
+        for cell in [c for c in self.cell_list_by_type(self.IMMUNECELL)
+                     if ViralInfectionVTMLib.immune_removal_mcs_key in c.dict.keys()]:
+            if cell.volume < immune_removal_volume:
+                self.removal_linger_times.append(mcs - cell.dict[ViralInfectionVTMLib.immune_removal_mcs_key])
+                self.shared_steppable_vars.get(ViralInfectionVTMLib.pixel_index_key, dict()).pop(cell.id, None)
+                self.delete_cell(cell)
+
+    def get_removal_stats(self) -> dict:
+        """
+        Get statistics of deleted immune cells
+        :return: dictionary of number of deleted cells ('num_deleted'), and mean ('mean_linger') and maximum
+            ('max_linger') number of steps between beginning of removal and deletion
+        """
+        if not self.removal_linger_times:
+            return {'num_deleted': 0, 'mean_linger': 0.0, 'max_linger': 0}
+        return {'num_deleted': len(self.removal_linger_times),
+                'mean_linger': float(np.mean(self.removal_linger_times)),
+                'max_linger': int(max(self.removal_linger_times))}
+
+    def select_immune_seeding_sites(self, num_sites, rng):
+        """
+        Select sites of immune cell seeding in the immune cell layer
+        Candidate sites are drawn from all free sites away from the center of the domain, scored by the seeding field
+        and selected without overlap; see nCoVSpatial.select_block_sites
+        Selected sites are marked as occupied in the immune cell layer occupancy
+        :param num_sites: number of sites to select
+        :param rng: random number generator
+        :return: list of (x, y) of block origins of selected sites; fewer than requested if free space runs out
+        """
+        occupancy = self.get_immune_occupancy(int(cell_diameter))
+        free_blocks = occupancy.get_free_blocks(self.dim.x - 2 * int(cell_diameter),
+                                                self.dim.y - 2 * int(cell_diameter))
+        free_blocks = free_blocks[np.sqrt((self.dim.x // 2 - free_blocks[:, 0]) ** 2 +
+                                          (self.dim.y // 2 - free_blocks[:, 1]) ** 2) > ir_seeding_min_center_dist]
+        if free_blocks.shape[0] == 0:
+            return []
+
+        if ir_seeding_num_candidates > 0:
+            candidates = free_blocks[rng.integers(0, free_blocks.shape[0], int(ir_seeding_num_candidates))]
+        else:
+            candidates = free_blocks
+        field = getattr(self.field, ir_seeding_field)
+        scores = np.array([field[int(x), int(y), 1] for x, y in candidates])
+        sites = nCoVSpatial.select_block_sites(candidates, scores, num_sites, int(cell_diameter), rng,
+                                               ir_seeding_weighted)
+
+        sites = [(int(x), int(y)) for x, y in sites]
+        for x, y in sites:
+            occupancy.set_block(x, y)
+        return sites
+
 
 class SimDataSteppable(SteppableBasePy):
     """
     Plots/writes simulation data of interest
+    Recorded data is returned to callable simulation callers as arrays; see ViralInfectionVTMLib.sim_data_return_key
+    Writing recorded data to files is optional; see write_data_files in ViralInfectionVTMModelInputs
     """
 
     def __init__(self, frequency=1):
@@ -428,6 +542,9 @@ class SimDataSteppable(SteppableBasePy):
         self.plot_death_data = plot_death_data_freq > 0
         self.write_death_data = write_death_data_freq > 0
 
+        # All recorded data by data description and step, for returning to callable simulation callers
+        self.__data_record = {k: dict() for k in self.__data_tables().keys()}
+
         # Origin of infection point; if more than one cell is first detected, then measure the mean COM
         # If first infection is far from center of domain, then measurements of infection front probably won't
         # be very useful
@@ -538,44 +655,39 @@ class SimDataSteppable(SteppableBasePy):
             self.death_data_win.add_plot("Bystander", style='Dots', color='yellow', size=5)
 
         # Check that output directory is available
-        if self.output_dir is not None:
+        if self.output_dir is not None and write_data_files:
             from pathlib import Path
             if self.write_vrm_data:
                 self.vrm_data_path = Path(self.output_dir).joinpath('vrm_data.dat')
-                with open(self.vrm_data_path, 'w'):
-                    pass
+                self.init_data_file(self.vrm_data_path)
 
             if self.write_vim_data:
                 self.vim_data_path = Path(self.output_dir).joinpath('vim_data.dat')
-                with open(self.vim_data_path, 'w'):
-                    pass
+                self.init_data_file(self.vim_data_path)
 
             if self.write_pop_data:
                 self.pop_data_path = Path(self.output_dir).joinpath('pop_data.dat')
-                with open(self.pop_data_path, 'w'):
-                    pass
+                self.init_data_file(self.pop_data_path)
 
             if self.write_med_diff_data:
                 self.med_diff_data_path = Path(self.output_dir).joinpath('med_diff_data.dat')
-                with open(self.med_diff_data_path, 'w'):
-                    pass
+                self.init_data_file(self.med_diff_data_path)
 
             if self.write_ir_data:
                 self.ir_data_path = Path(self.output_dir).joinpath('ir_data.dat')
-                with open(self.ir_data_path, 'w'):
-                    pass
+                self.init_data_file(self.ir_data_path)
 
             if self.write_spat_data:
                 self.spat_data_path = Path(self.output_dir).joinpath('spat_data.dat')
-                with open(self.spat_data_path, 'w'):
-                    pass
+                self.init_data_file(self.spat_data_path)
 
             if self.write_death_data:
                 self.death_data_path = Path(self.output_dir).joinpath('death_data.dat')
-                with open(self.death_data_path, 'w'):
-                    pass
+                self.init_data_file(self.death_data_path)
 
     def step(self, mcs):
+        # Report steps w.r.t. the beginning of the simulation when started from a checkpoint
+        mcs += ViralInfectionVTMLib.get_mcs_offset()
 
         plot_pop_data = self.plot_pop_data and mcs % plot_pop_data_freq == 0
         plot_med_diff_data = self.plot_med_diff_data and mcs % plot_med_diff_data_freq == 0
@@ -584,22 +696,14 @@ class SimDataSteppable(SteppableBasePy):
         plot_vim_data = self.plot_vim_data and mcs % plot_vim_data_freq == 0
         plot_spat_data = self.plot_spat_data and mcs % plot_spat_data_freq == 0
         plot_death_data = self.plot_death_data and mcs % plot_death_data_freq == 0
-        if self.output_dir is not None:
-            write_pop_data = self.write_pop_data and mcs % write_pop_data_freq == 0
-            write_med_diff_data = self.write_med_diff_data and mcs % write_med_diff_data_freq == 0
-            write_ir_data = self.write_ir_data and mcs % write_ir_data_freq == 0
-            write_vrm_data = self.write_vrm_data and mcs % write_vrm_data_freq == 0
-            write_vim_data = self.write_vim_data and mcs % write_vim_data_freq == 0
-            write_spat_data = self.write_spat_data and mcs % write_spat_data_freq == 0
-            write_death_data = self.write_death_data and mcs % write_death_data_freq == 0
-        else:
-            write_pop_data = False
-            write_med_diff_data = False
-            write_ir_data = False
-            write_vrm_data = False
-            write_vim_data = False
-            write_spat_data = False
-            write_death_data = False
+        # Data is recorded at write steps, whether or not it is written to file
+        write_pop_data = self.write_pop_data and mcs % write_pop_data_freq == 0
+        write_med_diff_data = self.write_med_diff_data and mcs % write_med_diff_data_freq == 0
+        write_ir_data = self.write_ir_data and mcs % write_ir_data_freq == 0
+        write_vrm_data = self.write_vrm_data and mcs % write_vrm_data_freq == 0
+        write_vim_data = self.write_vim_data and mcs % write_vim_data_freq == 0
+        write_spat_data = self.write_spat_data and mcs % write_spat_data_freq == 0
+        write_death_data = self.write_death_data and mcs % write_death_data_freq == 0
 
         if self.vrm_tracked_cell is not None and (plot_vrm_data or write_vrm_data):
             if plot_vrm_data:
@@ -634,8 +738,11 @@ class SimDataSteppable(SteppableBasePy):
             num_cells_infected = len(self.cell_list_by_type(self.INFECTED))
             num_cells_virusreleasing = len(self.cell_list_by_type(self.VIRUSRELEASING))
             num_cells_dying = len(self.cell_list_by_type(self.DYING))
-            num_cells_immune = len(self.cell_list_by_type(self.IMMUNECELL))
-            num_cells_immune_act = len([c for c in self.cell_list_by_type(self.IMMUNECELL) if c.dict['activated']])
+            # Immune cells that are being removed are not counted
+            immune_cells = [c for c in self.cell_list_by_type(self.IMMUNECELL)
+                            if ViralInfectionVTMLib.immune_removal_mcs_key not in c.dict.keys()]
+            num_cells_immune = len(immune_cells)
+            num_cells_immune_act = len([c for c in immune_cells if c.dict['activated']])
 
             # Plot population data plot if requested
             if plot_pop_data:
@@ -795,6 +902,24 @@ class SimDataSteppable(SteppableBasePy):
 
     def finish(self):
         self.flush_stored_outputs()
+        ViralInfectionVTMLib.set_sim_output(ViralInfectionVTMLib.sim_data_return_key, self.get_data_arrays())
+
+    @staticmethod
+    def init_data_file(data_path):
+        """
+        Initialize a data output file
+        When started from a checkpoint, data of steps before the checkpoint is kept and data of later steps is removed;
+        otherwise the file is emptied
+        :param data_path: path to data output file
+        :return: None
+        """
+        mcs_offset = ViralInfectionVTMLib.get_mcs_offset()
+        lines = []
+        if mcs_offset > 0 and os.path.isfile(data_path):
+            with open(data_path, 'r') as fin:
+                lines = [line for line in fin.readlines() if line.strip() and int(line.split(',')[0]) < mcs_offset]
+        with open(data_path, 'w') as fout:
+            fout.writelines(lines)
 
     def data_output_string(self, _data: dict):
         """
@@ -812,26 +937,43 @@ class SimDataSteppable(SteppableBasePy):
             f_str += '\n'
         return f_str
 
+    def __data_tables(self) -> dict:
+        # Each tuple contains the necessary information for recording a set of data, by data description
+        #   1. Boolean for whether we're recording the data at all
+        #   2. The path to write the data to; None if not writing to file
+        #   3. The stored data
+        return {'vrm_data': (self.write_vrm_data, self.vrm_data_path, self.vrm_data),
+                'vim_data': (self.write_vim_data, self.vim_data_path, self.vim_data),
+                'pop_data': (self.write_pop_data, self.pop_data_path, self.pop_data),
+                'med_diff_data': (self.write_med_diff_data, self.med_diff_data_path, self.med_diff_data),
+                'ir_data': (self.write_ir_data, self.ir_data_path, self.ir_data),
+                'spat_data': (self.write_spat_data, self.spat_data_path, self.spat_data),
+                'death_data': (self.write_death_data, self.death_data_path, self.death_data)}
+
     def flush_stored_outputs(self):
         """
-        Write stored outputs to file and clear output storage
+        Record stored outputs, write them to file if requested and clear output storage
         :return: None
         """
-        # Each tuple contains the necessary information for writing a set of data to file
-        #   1. Boolean for whether we're writing to file at all
-        #   2. The path to write the data to
-        #   3. The data to write
-        output_info = [(self.write_vrm_data, self.vrm_data_path, self.vrm_data),
-                       (self.write_vim_data, self.vim_data_path, self.vim_data),
-                       (self.write_pop_data, self.pop_data_path, self.pop_data),
-                       (self.write_med_diff_data, self.med_diff_data_path, self.med_diff_data),
-                       (self.write_ir_data, self.ir_data_path, self.ir_data),
-                       (self.write_death_data, self.death_data_path, self.death_data)]
-        for write_data, data_path, data in output_info:
+        for data_desc, (write_data, data_path, data) in self.__data_tables().items():
             if write_data:
-                with open(data_path, 'a') as fout:
-                    fout.write(self.data_output_string(data))
-                    data.clear()
+                self.__data_record[data_desc].update(data)
+                if data_path is not None:
+                    with open(data_path, 'a') as fout:
+                        fout.write(self.data_output_string(data))
+                data.clear()
+
+    def get_data_arrays(self) -> dict:
+        """
+        Get all recorded data as arrays
+        :return: dictionary of arrays by data description; rows are steps, the first column is the step
+        """
+        data_arrays = dict()
+        for data_desc, data in self.__data_record.items():
+            if data:
+                data_arrays[data_desc] = np.array([[mcs] + list(data[mcs]) for mcs in sorted(data.keys())],
+                                                  dtype=float)
+        return data_arrays
 
     def set_vrm_tracked_cell(self, cell):
         self.vrm_tracked_cell = cell
@@ -848,6 +990,17 @@ class SimDataSteppable(SteppableBasePy):
     def track_death_bystander(self):
         self.__death_mech['bystander'] += 1
 
+    def get_checkpoint_state(self):
+        return {'death_mech': dict(self.__death_mech),
+                'init_infect_pt': self.init_infect_pt,
+                'data_record': {k: dict(v) for k, v in self.__data_record.items()}}
+
+    def set_checkpoint_state(self, _state):
+        self.__death_mech.update(_state['death_mech'])
+        self.init_infect_pt = _state['init_infect_pt']
+        for k, v in _state.get('data_record', dict()).items():
+            self.__data_record[k].update(v)
+
 
 class CytokineProductionAbsorptionSteppable(ViralInfectionVTMSteppableBasePy):
     """
@@ -886,16 +1039,40 @@ class CytokineProductionAbsorptionSteppable(ViralInfectionVTMSteppableBasePy):
             self.ir_steppable: ImmuneRecruitmentSteppable = \
                 self.shared_steppable_vars[ViralInfectionVTMLib.ir_steppable_key]
 
+        self.ir_steppable.increment_total_cytokine_count(self.secrete_uptake_cytokine(mcs))
+
+    def secrete_uptake_cytokine(self, mcs):
+        """
+        Performs cytokine production of infected and immune cells, uptake of immune cells and immune cell activation
+        Production of infected cells is calculated for all cells at once, and random draws of immune cell activation
+        are drawn for all immune cells at once; each immune cell then performs uptake, activation and production in
+        order of the cell list, as each reads the cytokine field after the previous cell
+        :param mcs: current simulation step
+        :return: net amount of cytokine added to the cytokine field
+        """
+        rng = self.get_rng(ViralInfectionVTMLib.rng_activation)
+
         # Track the total amount added and subtracted to the cytokine field
         total_ck_inc = 0.0
 
-        for cell in self.cell_list_by_type(self.INFECTED, self.VIRUSRELEASING):
-            viral_load = ViralInfectionVTMLib.get_assembled_viral_load_inside_cell(cell, vr_step_size)
-            produced = cell.dict['ck_production'] * nCoVUtils.hill_equation(viral_load, ec50_infecte_ck_prod, 2)
-            res = self.ck_secretor.secreteInsideCellTotalCount(cell, produced / cell.volume)
-            total_ck_inc += res.tot_amount
-
-        for cell in self.cell_list_by_type(self.IMMUNECELL):
+        cells = list(self.cell_list_by_type(self.INFECTED, self.VIRUSRELEASING))
+        if cells:
+            viral_load = np.array([ViralInfectionVTMLib.get_assembled_viral_load_inside_cell(cell, vr_step_size)
+                                   for cell in cells])
+            ck_production = np.array([cell.dict['ck_production'] for cell in cells])
+            volume = np.array([cell.volume for cell in cells], dtype=float)
+            produced = ck_production * nCoVUtils.hill_equation_array(viral_load, ec50_infecte_ck_prod, 2)
+            for cell, amount in zip(cells, produced / volume):
+                total_ck_inc += self.ck_secretor.secreteInsideCellTotalCount(cell, float(amount)).tot_amount
+
+        cells = self.immune_cell_list()
+        if not cells:
+            return total_ck_inc
+
+        # Immune cells are updated in order, since uptake and production of each cell depend on the cytokine field
+        # after uptake and production of previous cells
+        random_draws = rng.random(len(cells))
+        for cell, random_draw in zip(cells, random_draws):
 
             self.virus_secretor.uptakeInsideCellTotalCount(cell, cell.dict['ck_consumption'] / cell.volume, 0.1)
 
@@ -910,7 +1087,7 @@ class CytokineProductionAbsorptionSteppable(ViralInfectionVTMSteppableBasePy):
             total_ck_inc += up_res.tot_amount
             p_activate = nCoVUtils.hill_equation(cell.dict['tot_ck_upt'], EC50_ck_immune, 2)
 
-            if rng.uniform() < p_activate and not cell.dict['activated']:
+            if random_draw < p_activate and not cell.dict['activated']:
 
                 cell.dict['activated'] = True
                 cell.dict['time_activation'] = mcs
@@ -920,13 +1097,13 @@ class CytokineProductionAbsorptionSteppable(ViralInfectionVTMSteppableBasePy):
                 cell.dict['time_activation'] = - 99
 
             if cell.dict['activated']:
-                seen_field = self.total_seen_field(self.field.cytokine, cell)
+                seen_field = self.total_seen_field(self.field.cytokine, cell, not exact_seen_field)
                 produced = cell.dict['ck_production'] * nCoVUtils.hill_equation(seen_field, ec50_immune_ck_prod, 1)
                 sec_res = self.ck_secretor.secreteInsideCellTotalCount(cell, produced / cell.volume)
 
                 total_ck_inc += sec_res.tot_amount
 
-        self.ir_steppable.increment_total_cytokine_count(total_ck_inc)
+        return total_ck_inc
 
 
 class ImmuneRecruitmentSteppable(ViralInfectionVTMSteppableBasePy):
@@ -960,7 +1137,7 @@ class ImmuneRecruitmentSteppable(ViralInfectionVTMSteppableBasePy):
     def step(self, mcs):
 
         # Update total count of immune cells
-        num_immune_cells = len(self.cell_list_by_type(self.IMMUNECELL))
+        num_immune_cells = len(self.immune_cell_list())
 
         # Apply consumption / transmission decay to running total
         total_cytokine_decayed = self.__total_cytokine * self.__ck_decay
@@ -1031,10 +1208,22 @@ class ImmuneRecruitmentSteppable(ViralInfectionVTMSteppableBasePy):
         """
         self.__total_cytokine = max(0.0, self.__total_cytokine + _inc_amount)
 
+    def get_checkpoint_state(self):
+        return {'S': self.get_state_variable_val(),
+                'total_cytokine': self.__total_cytokine}
+
+    def set_checkpoint_state(self, _state):
+        self.__rr['S'] = _state['S']
+        self.__total_cytokine = _state['total_cytokine']
+
 
 class oxidationAgentModelSteppable(ViralInfectionVTMSteppableBasePy):
     """
     Implements immune cell oxidizing agent cytotoxicity module
+    Since the epithelial sheet is frozen, the centers of mass and volumes of epithelial cells are cached, and the
+    oxidizing agent is sampled at all of them at once; the check is skipped when the total amount of oxidizing agent
+    is too small for any cell to reach the death threshold, which requires totalFieldIntegral (v4.2.1+ CC3D); with
+    earlier versions, every cell is checked
     """
     def __init__(self, frequency=1):
         SteppableBasePy.__init__(self, frequency)
@@ -1045,31 +1234,336 @@ class oxidationAgentModelSteppable(ViralInfectionVTMSteppableBasePy):
         # Reference to SimDataSteppable
         self.simdata_steppable = None
 
+        # Epithelial cells, and their centers of mass and volumes
+        self.epithelial_cells = None
+        self.epithelial_com = None
+        self.epithelial_volume = None
+
+        # Whether the total amount of oxidizing agent is available to skip the check
+        self.has_field_integral = False
+
     def start(self):
         self.get_xml_element('oxi_dc').cdata = oxi_dc
         self.get_xml_element('oxi_decay').cdata = oxi_decay
 
         self.oxi_secretor = self.get_field_secretor("oxidator")
+        self.has_field_integral = hasattr(self.oxi_secretor, 'totalFieldIntegral')  # v4.2.1+ CC3D
 
     def step(self, mcs):
         if self.simdata_steppable is None:
             self.simdata_steppable: SimDataSteppable = \
                 self.shared_steppable_vars[ViralInfectionVTMLib.simdata_steppable_key]
 
-        for cell in self.cell_list_by_type(self.IMMUNECELL):
-            if cell.dict['activated']:
-                seen_field = self.total_seen_field(self.field.cytokine, cell)
-                if seen_field > oxi_sec_thr:
-                    oxi_sec = self.oxi_secretor.secreteInsideCellTotalCount(cell, max_oxi_secrete / cell.volume)
+        cells = [cell for cell in self.immune_cell_list() if cell.dict['activated']]
+        seen_field = self.total_seen_field_cells(self.field.cytokine, cells, not exact_seen_field)
+        for cell, seen in zip(cells, seen_field):
+            if seen > oxi_sec_thr:
+                oxi_sec = self.oxi_secretor.secreteInsideCellTotalCount(cell, max_oxi_secrete / cell.volume)
 
-        for cell in self.cell_list_by_type(self.UNINFECTED, self.INFECTED, self.VIRUSRELEASING):
+        self.kill_oxidized_cells()
 
-            seen_field = self.total_seen_field(self.field.oxidator, cell)
-            if seen_field >= oxi_death_thr:
-                self.kill_cell(cell=cell)
-                cell.dict['oxi_killed'] = True
-                self.simdata_steppable.track_death_oxi_field()
+    def kill_oxidized_cells(self):
+        """
+        Kills living epithelial cells that see at least the oxidizing agent death threshold
+        The seen amount is estimated from the field at the center of mass of a cell, or is exact when exact_seen_field is
+        set; see total_seen_field
+        :return: None
+        """
+        if self.epithelial_cells is None:
+            self.epithelial_cells = list(self.cell_list_by_type(self.UNINFECTED, self.INFECTED, self.VIRUSRELEASING,
+                                                                self.DYING))
+            self.epithelial_com = [(cell.xCOM, cell.yCOM, cell.zCOM) for cell in self.epithelial_cells]
+            self.epithelial_volume = np.array([cell.volume for cell in self.epithelial_cells], dtype=float)
+        if not self.epithelial_cells:
+            return
+
+        # The field is non-negative, so neither a value nor the total of a cell exceeds the total
+        if self.has_field_integral and \
+                self.oxi_secretor.totalFieldIntegral() * self.epithelial_volume.max() < oxi_death_thr:
+            return
+
+        field = self.field.oxidator
+        living_types = [self.UNINFECTED, self.INFECTED, self.VIRUSRELEASING]
+        idx_living = [idx for idx, cell in enumerate(self.epithelial_cells) if cell.type in living_types]
+        if not idx_living:
+            return
+        if exact_seen_field:
+            seen_field = self.total_seen_field_cells(field, [self.epithelial_cells[idx] for idx in idx_living],
+                                                     estimate=False)
+        else:
+            seen_field = np.array([field[self.epithelial_com[idx]] for idx in idx_living]) * \
+                self.epithelial_volume[idx_living]
+        for idx in np.flatnonzero(seen_field >= oxi_death_thr):
+            cell = self.epithelial_cells[idx_living[idx]]
+            self.kill_cell(cell=cell)
+            cell.dict['oxi_killed'] = True
+            self.simdata_steppable.track_death_oxi_field()
 
     def finish(self):
         # this function may be called at the end of simulation - used very infrequently though
         return
+
+
+class SnapshotSteppable(ViralInfectionVTMSteppableBasePy):
+    """
+    Writes compact lattice snapshots of cell types, cell ids and diffusive fields to the simulation directory
+    Snapshots can be rendered without CompuCell3D; see nCoVToolkit.nCoVSnapshot
+    With keyframes, snapshots between keyframes only store the cell types and cell ids that changed, and field data can
+    be written every few snapshots
+    """
+
+    def __init__(self, frequency=1):
+        ViralInfectionVTMSteppableBasePy.__init__(self, frequency)
+
+        self.snapshot_writer = None
+
+    def start(self):
+        if write_snapshot_freq <= 0 or self.output_dir is None:
+            return
+
+        cell_type_names = {0: 'Medium',
+                           self.UNINFECTED: 'Uninfected',
+                           self.INFECTED: 'Infected',
+                           self.VIRUSRELEASING: 'VirusReleasing',
+                           self.DYING: 'Dying',
+                           self.IMMUNECELL: 'Immunecell'}
+        self.snapshot_writer = nCoVSnapshot.SnapshotWriter(os.path.join(self.output_dir, 'Snapshots'),
+                                                           (self.dim.x, self.dim.y, self.dim.z),
+                                                           ViralInfectionVTMLib.field_names,
+                                                           cell_type_names,
+                                                           keyframe_interval=write_snapshot_keyframe_freq)
+
+    def step(self, mcs):
+        if self.snapshot_writer is None:
+            return
+
+        mcs += ViralInfectionVTMLib.get_mcs_offset()
+        if mcs % write_snapshot_freq != 0:
+            return
+
+        write_fields = write_snapshot_field_freq > 0 and mcs % (write_snapshot_freq * write_snapshot_field_freq) == 0
+
+        # Cells are read from cached pixel coordinates and the sparse immune cell layer; only fields are read per voxel
+        cell_type, cell_id = self.get_lattice_cell_arrays()
+        fields = dict()
+        if write_fields:
+            # All fields are read in one pass
+            fields = {field_name: np.zeros(shape=(self.dim.x, self.dim.y, self.dim.z), dtype=np.float32)
+                      for field_name in ViralInfectionVTMLib.field_names}
+            field_objs = [(fields[field_name], getattr(self.field, field_name))
+                          for field_name in ViralInfectionVTMLib.field_names]
+            for x, y, z in self.every_pixel():
+                for field_arr, field_obj in field_objs:
+                    field_arr[x, y, z] = field_obj[x, y, z]
+
+        if write_fields:
+            self.snapshot_writer.write_frame(mcs, cell_type, cell_id, fields)
+        else:
+            self.snapshot_writer.write_frame(mcs, cell_type, cell_id)
+
+
+class CheckpointSteppable(ViralInfectionVTMSteppableBasePy):
+    """
+    Writes and loads checkpoints of full simulation state
+    A checkpoint contains the lattice, diffusive fields, cell attributes and dictionaries, the state of each cell's
+    viral replication model, the state of random number streams and the state of steppables that implement
+    get_checkpoint_state and set_checkpoint_state (e.g., the immune recruitment state variable *S*)
+    Checkpoint options are passed as callable simulation inputs; see ViralInfectionVTMLib
+    When starting from a checkpoint, the simulation starts at step zero and ends at the same final step as the
+    simulation that wrote the checkpoint; steppables can retrieve the step after which the checkpoint was written with
+    ViralInfectionVTMLib.get_mcs_offset()
+    Periodic checkpoints are written when requested, so that an interrupted simulation can be resumed from its latest
+    periodic checkpoint; only the latest periodic checkpoint is kept
+    The cost of each checkpoint is logged in the checkpoint directory
+    This steppable should be registered after all other steppables
+    """
+
+    def __init__(self, frequency=1):
+        ViralInfectionVTMSteppableBasePy.__init__(self, frequency)
+
+        self.checkpoint_dir = None
+        self.save_steps = []
+        self.checkpoint_frequency = 0
+
+    def start(self):
+        # Post reference to self
+        self.shared_steppable_vars[ViralInfectionVTMLib.checkpoint_steppable_key] = self
+
+        self.save_steps = sorted(ViralInfectionVTMLib.get_sim_input(ViralInfectionVTMLib.checkpoint_save_steps_key, []))
+        self.checkpoint_dir = ViralInfectionVTMLib.get_sim_input(ViralInfectionVTMLib.checkpoint_dir_key,
+                                                                 self.output_dir)
+        self.checkpoint_frequency = ViralInfectionVTMLib.get_sim_input(ViralInfectionVTMLib.checkpoint_frequency_key,
+                                                                       0)
+        if self.save_steps or self.checkpoint_frequency > 0:
+            assert self.checkpoint_dir is not None, 'Checkpoints require an output directory'
+            if not os.path.isdir(self.checkpoint_dir):
+                os.makedirs(self.checkpoint_dir)
+
+        checkpoint_file = ViralInfectionVTMLib.get_sim_input(ViralInfectionVTMLib.checkpoint_load_key)
+        if checkpoint_file is not None:
+            self.load_checkpoint(checkpoint_file)
+
+    def step(self, mcs):
+        mcs_abs = mcs + ViralInfectionVTMLib.get_mcs_offset()
+        if mcs_abs in self.save_steps:
+            self.save_checkpoint(ViralInfectionVTMCheckpoint.get_checkpoint_file(self.checkpoint_dir, mcs_abs), mcs)
+            if mcs_abs == self.save_steps[-1] and \
+                    ViralInfectionVTMLib.get_sim_input(ViralInfectionVTMLib.checkpoint_stop_key, False):
+                self.stop_simulation()
+
+        if self.checkpoint_frequency > 0 and mcs_abs > 0 and mcs_abs % self.checkpoint_frequency == 0:
+            checkpoints_old = ViralInfectionVTMCheckpoint.list_checkpoints(self.checkpoint_dir,
+                                                                            ViralInfectionVTMCheckpoint.autosave_prefix)
+            self.save_checkpoint(ViralInfectionVTMCheckpoint.get_checkpoint_file(
+                self.checkpoint_dir, mcs_abs, ViralInfectionVTMCheckpoint.autosave_prefix), mcs)
+            for k, f in checkpoints_old.items():
+                if k != mcs_abs:
+                    os.remove(f)
+
+        if mcs_abs >= self.simulator.getNumSteps() - 1:
+            self.stop_simulation()
+
+    def generate_checkpoint_data(self, mcs) -> dict:
+        """
+        Generate checkpoint data of current simulation state
+        :param mcs: current simulation step
+        :return: checkpoint data
+        """
+        # The lattice and fields are read exactly in one pass, rather than from cached or estimated pixel data
+        cell_ids = np.zeros(shape=(self.dim.x, self.dim.y, self.dim.z), dtype=np.int64)
+        field_objs = [(field_name, getattr(self.field, field_name)) for field_name in ViralInfectionVTMLib.field_names]
+        field_data = {field_name: np.zeros(shape=(self.dim.x, self.dim.y, self.dim.z), dtype=float)
+                      for field_name in ViralInfectionVTMLib.field_names}
+        for x, y, z in self.every_pixel():
+            cell = self.cell_field[x, y, z]
+            if cell:
+                cell_ids[x, y, z] = cell.id
+            for field_name, field_obj in field_objs:
+                field_data[field_name][x, y, z] = field_obj[x, y, z]
+
+        vr_syms = list(ViralInfectionVTMLib.vr_cell_dict_to_sym.values()) + ['Uptake', 'Secretion', 'secretion_rate']
+        # Simulation step values of cells are stored in the absolute frame, like the checkpoint step
+        mcs_keys = ViralInfectionVTMLib.checkpoint_mcs_dict_keys
+        mcs_offset = ViralInfectionVTMLib.get_mcs_offset()
+        cell_data = dict()
+        for cell in self.cell_list:
+            cell_dict = ViralInfectionVTMCheckpoint.filter_picklable(cell.dict, exclude=['SBMLSolver'])
+            if cell.dict.get(ViralInfectionVTMLib.vrl_key, False):
+                vr_model = getattr(cell.sbml, ViralInfectionVTMSteppableBasePy.vr_model_name)
+                vr_state = {sym: vr_model[sym] for sym in vr_syms}
+            else:
+                vr_state = None
+            cell_data[cell.id] = {'type': cell.type,
+                                  'targetVolume': cell.targetVolume,
+                                  'lambdaVolume': cell.lambdaVolume,
+                                  'dict': ViralInfectionVTMCheckpoint.shift_mcs_items(cell_dict, mcs_keys, mcs_offset),
+                                  'vr_state': vr_state}
+
+        steppable_data = dict()
+        for k, v in self.shared_steppable_vars.items():
+            if v is not self and hasattr(v, 'get_checkpoint_state'):
+                steppable_data[k] = v.get_checkpoint_state()
+
+        rng_streams = ViralInfectionVTMLib.get_rng_streams()
+
+        return {'mcs': mcs + ViralInfectionVTMLib.get_mcs_offset(),
+                'dim': (self.dim.x, self.dim.y, self.dim.z),
+                'cell_ids': cell_ids,
+                'cells': cell_data,
+                'fields': field_data,
+                'steppables': steppable_data,
+                'rng_seed': rng_streams.seed,
+                'rng_state': rng_streams.get_state()}
+
+    def save_checkpoint(self, file_name, mcs):
+        """
+        Write a checkpoint of current simulation state
+        Stored simulation data is flushed first, so that recorded data and data output files are consistent with the
+        checkpoint
+        :param file_name: path to checkpoint file
+        :param mcs: current simulation step
+        :return: None
+        """
+        simdata_steppable = self.shared_steppable_vars.get(ViralInfectionVTMLib.simdata_steppable_key, None)
+        if simdata_steppable is not None:
+            simdata_steppable.flush_stored_outputs()
+        log_file = os.path.join(self.checkpoint_dir, ViralInfectionVTMCheckpoint.checkpoint_log_name)
+        ViralInfectionVTMCheckpoint.write_checkpoint_timed(file_name, lambda: self.generate_checkpoint_data(mcs),
+                                                           log_file)
+
+    def load_checkpoint(self, file_name):
+        """
+        Load simulation state from a checkpoint; should only be called during start
+        :param file_name: path to checkpoint file
+        :return: None
+        """
+        checkpoint_data = ViralInfectionVTMCheckpoint.read_checkpoint(file_name)
+        mcs_offset = checkpoint_data['mcs'] + 1
+        assert tuple(checkpoint_data['dim']) == (self.dim.x, self.dim.y, self.dim.z), \
+            'Checkpoint lattice dimensions do not match simulation lattice dimensions'
+
+        self.shared_steppable_vars[ViralInfectionVTMLib.mcs_offset_key] = mcs_offset
+
+        # Lattice and cells; simulation step values of cells are stored in the absolute frame
+        mcs_keys = ViralInfectionVTMLib.checkpoint_mcs_dict_keys
+        new_cells = dict()
+        for cell_id, cell_state in checkpoint_data['cells'].items():
+            cell = self.new_cell(cell_state['type'])
+            cell.dict.update(ViralInfectionVTMCheckpoint.shift_mcs_items(cell_state['dict'], mcs_keys, -mcs_offset))
+            new_cells[cell_id] = cell
+
+        # Loaded step values must map back to the stored values, so that checkpoints of this run are in the same frame
+        for cell_id, cell_state in checkpoint_data['cells'].items():
+            cell_dict = {k: new_cells[cell_id].dict[k] for k in mcs_keys if k in cell_state['dict'].keys()}
+            assert ViralInfectionVTMCheckpoint.shift_mcs_items(cell_dict, mcs_keys, mcs_offset) == \
+                {k: cell_state['dict'][k] for k in cell_dict.keys()}, \
+                f'Simulation step values of cell {cell_id} are inconsistent with checkpoint'
+
+        cell_ids = checkpoint_data['cell_ids']
+        for x, y, z in zip(*np.nonzero(cell_ids)):
+            self.cell_field[int(x), int(y), int(z)] = new_cells[cell_ids[x, y, z]]
+
+        for cell_id, cell_state in checkpoint_data['cells'].items():
+            cell = new_cells[cell_id]
+            cell.targetVolume = cell_state['targetVolume']
+            cell.lambdaVolume = cell_state['lambdaVolume']
+
+            # Viral replication model
+            vr_state = cell_state['vr_state']
+            cell.dict[ViralInfectionVTMLib.vrl_key] = False
+            if vr_state is not None:
+                self.load_viral_replication_model(cell=cell, vr_step_size=vr_step_size,
+                                                  unpacking_rate=unpacking_rate,
+                                                  replicating_rate=replicating_rate,
+                                                  r_half=r_half,
+                                                  translating_rate=translating_rate,
+                                                  packing_rate=packing_rate)
+                vr_model = getattr(cell.sbml, ViralInfectionVTMSteppableBasePy.vr_model_name)
+                for sym, val in vr_state.items():
+                    vr_model[sym] = val
+
+            # Chemotaxis
+            if cell.type == self.IMMUNECELL:
+                cd = self.chemotaxisPlugin.addChemotaxisData(cell, "cytokine")
+                if cell.dict['activated']:
+                    cd.setLambda(lamda_chemotaxis)
+                else:
+                    cd.setLambda(0.0)
+                cd.assignChemotactTowardsVectorTypes([self.MEDIUM])
+
+        # Diffusive fields
+        for field_name, field_arr in checkpoint_data['fields'].items():
+            field = getattr(self.field, field_name)
+            for x, y, z in self.every_pixel():
+                field[x, y, z] = field_arr[x, y, z]
+
+        # Steppables
+        for k, v in checkpoint_data['steppables'].items():
+            if k in self.shared_steppable_vars.keys():
+                self.shared_steppable_vars[k].set_checkpoint_state(v)
+
+        # Random number streams
+        if ViralInfectionVTMLib.get_sim_input(ViralInfectionVTMLib.checkpoint_restore_rng_key, True):
+            rng_streams = nCoVUtils.RandomStreams(checkpoint_data['rng_seed'])
+            rng_streams.set_state(checkpoint_data['rng_state'])
+            self.shared_steppable_vars[ViralInfectionVTMLib.rng_streams_key] = rng_streams
@@ -1,2 +1,4 @@
-__all__ = ["nCoVSteppableBase",
+__all__ = ["nCoVSnapshot",
+           "nCoVSpatial",
+           "nCoVSteppableBase",
            "nCoVUtils"]
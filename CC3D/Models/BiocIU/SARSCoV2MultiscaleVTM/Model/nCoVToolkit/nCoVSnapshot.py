@@ -0,0 +1,390 @@
+# This is a library of compact lattice snapshots for the shared coronavirus modeling and simulation project
+# hosted by the Biocomplexity Institute at Indiana University
+# Snapshots store the cell type and cell id of every voxel and the values of diffusive fields as compressed NumPy
+# archives, one per frame, with an index for random access. Snapshots can be rendered with matplotlib without VTK, Qt
+# or CompuCell3D.
+# Cell types and cell ids can be delta-encoded: keyframes store every voxel, and frames between keyframes store only
+# the voxels that changed since the previous frame. Since the epithelial sheet is frozen, only a small fraction of
+# voxels change between frames, which makes frequent snapshots of long simulations affordable. Frames are read by
+# seeking the nearest preceding keyframe and applying the deltas that follow.
+
+import bisect
+import json
+import os
+
+import numpy as np
+
+# Name of snapshot index file
+snapshot_index_name = 'index.json'
+
+# Prefix and suffix of snapshot frame file names
+snapshot_prefix = 'snapshot_'
+snapshot_suffix = '.npz'
+
+# Version of snapshot data layout
+#   1: every frame is a keyframe, and index frame entries are file names
+#   2: frames are keyframes or deltas, and index frame entries are dictionaries of file name ('file'), whether the
+#       frame is a keyframe ('keyframe') and whether the frame stores field data ('fields')
+snapshot_version = 2
+snapshot_versions_readable = [1, 2]
+
+# Key prefix of field data in snapshot frames
+snapshot_field_prefix = 'field_'
+
+# Default colors of cell types by name
+default_cell_type_colors = {'Medium': '#000000',
+                            'Uninfected': '#1f77b4',
+                            'Infected': '#d62728',
+                            'VirusReleasing': '#2ca02c',
+                            'Dying': '#ffdf00',
+                            'Immunecell': '#ffffff'}
+
+# Standard snapshot renderings
+#   name: name of rendering
+#   data: 'cell_type', or name of field
+#   z: layer to render; for cell types, None renders the top non-medium voxel of every column
+#   cell_borders: whether to draw cell borders
+#   log_scale: whether to render field values in log scale
+standard_snapshot_specs = [{'name': 'CellTypes', 'data': 'cell_type', 'z': None, 'cell_borders': True},
+                           {'name': 'Virus', 'data': 'Virus', 'z': 0, 'cell_borders': False, 'log_scale': False},
+                           {'name': 'cytokine', 'data': 'cytokine', 'z': 1, 'cell_borders': False,
+                            'log_scale': False},
+                           {'name': 'oxidator', 'data': 'oxidator', 'z': 1, 'cell_borders': False,
+                            'log_scale': False}]
+
+
+def get_snapshot_file_name(mcs):
+    return f'{snapshot_prefix}{mcs}{snapshot_suffix}'
+
+
+def _write_json(file_name, _dict):
+    file_name_tmp = file_name + '.tmp'
+    with open(file_name_tmp, 'w') as fout:
+        json.dump(_dict, fout)
+    os.replace(file_name_tmp, file_name)
+
+
+class SnapshotWriter:
+    """
+    Writes compressed snapshot frames and maintains their index
+    """
+    def __init__(self, loc, dim, field_names, cell_type_names: dict, keyframe_interval=0):
+        """
+        :param loc: snapshot directory
+        :param dim: lattice dimensions (x, y, z)
+        :param field_names: names of diffusive fields
+        :param cell_type_names: dictionary of cell type names by cell type id
+        :param keyframe_interval: number of frames from one keyframe to the next; every frame is a keyframe when 0
+        """
+        self.loc = loc
+        self.keyframe_interval = keyframe_interval
+
+        # Cell types and cell ids of the last written frame, and number of frames written since the last keyframe
+        self._last_cell_type = None
+        self._last_cell_id = None
+        self._num_since_keyframe = 0
+
+        if not os.path.isdir(loc):
+            os.makedirs(loc)
+
+        index_file = os.path.join(loc, snapshot_index_name)
+        if os.path.isfile(index_file):
+            # Continue an existing series, e.g., when resuming from a checkpoint
+            # The first frame written is a keyframe, since the previous frame is not in memory
+            with open(index_file, 'r') as fin:
+                self.index = json.load(fin)
+            assert self.index['version'] == snapshot_version, f'Incompatible snapshot version in {loc}'
+            assert tuple(self.index['dim']) == tuple(dim), 'Snapshot dimensions do not match lattice dimensions'
+        else:
+            self.index = {'version': snapshot_version,
+                          'dim': [int(x) for x in dim],
+                          'field_names': list(field_names),
+                          'cell_type_names': {str(k): v for k, v in cell_type_names.items()},
+                          'frames': dict()}
+
+    def write_frame(self, mcs, cell_type, cell_id, fields: dict = None) -> None:
+        """
+        Write a snapshot frame
+        :param mcs: simulation step
+        :param cell_type: cell type id of every voxel
+        :param cell_id: cell id of every voxel; 0 for medium
+        :param fields: dictionary of field values of every voxel by field name; field data is not stored when None
+        :return: None
+        """
+        cell_type = np.asarray(cell_type, dtype=np.uint8)
+        cell_id = np.asarray(cell_id, dtype=np.int32)
+
+        if self._last_cell_type is None:
+            # Frames of an interrupted run at or after this step would break the chain of deltas
+            self.index['frames'] = {k: v for k, v in self.index['frames'].items() if int(k) < mcs}
+
+        keyframe = self.keyframe_interval <= 0 or self._last_cell_type is None or \
+            self._num_since_keyframe >= self.keyframe_interval
+        if keyframe:
+            frame_data = {'cell_type': cell_type,
+                          'cell_id': cell_id}
+            self._num_since_keyframe = 0
+        else:
+            delta_idx = np.flatnonzero((cell_type != self._last_cell_type) | (cell_id != self._last_cell_id))
+            frame_data = {'delta_idx': delta_idx.astype(np.int32),
+                          'delta_cell_type': cell_type.ravel()[delta_idx],
+                          'delta_cell_id': cell_id.ravel()[delta_idx]}
+        self._num_since_keyframe += 1
+        self._last_cell_type = cell_type.copy()
+        self._last_cell_id = cell_id.copy()
+
+        if fields is not None:
+            for field_name in self.index['field_names']:
+                frame_data[snapshot_field_prefix + field_name] = np.asarray(fields[field_name], dtype=np.float32)
+
+        file_name = get_snapshot_file_name(mcs)
+        file_path = os.path.join(self.loc, file_name)
+        with open(file_path + '.tmp', 'wb') as fout:
+            np.savez_compressed(fout, **frame_data)
+        os.replace(file_path + '.tmp', file_path)
+
+        self.index['frames'][str(mcs)] = {'file': file_name, 'keyframe': keyframe, 'fields': fields is not None}
+        _write_json(os.path.join(self.loc, snapshot_index_name), self.index)
+
+
+class SnapshotReader:
+    """
+    Random access to snapshot frames of a snapshot directory
+    The cell types and cell ids of the last read frame are kept, so that reading frames in order applies one delta per
+    frame
+    """
+    def __init__(self, loc):
+        """
+        :param loc: snapshot directory
+        """
+        self.loc = loc
+        with open(os.path.join(loc, snapshot_index_name), 'r') as fin:
+            self.index = json.load(fin)
+        assert self.index['version'] in snapshot_versions_readable, f'Incompatible snapshot version in {loc}'
+        if self.index['version'] == 1:
+            self.index['frames'] = {k: {'file': v, 'keyframe': True, 'fields': True}
+                                    for k, v in self.index['frames'].items()}
+
+        self._mcs_list = sorted([int(x) for x in self.index['frames'].keys()])
+        self._last_frame = None
+
+    @property
+    def dim(self):
+        return tuple(self.index['dim'])
+
+    @property
+    def field_names(self):
+        return list(self.index['field_names'])
+
+    @property
+    def cell_type_names(self) -> dict:
+        return {int(k): v for k, v in self.index['cell_type_names'].items()}
+
+    @property
+    def mcs_list(self) -> list:
+        return list(self._mcs_list)
+
+    def has_fields(self, mcs) -> bool:
+        """
+        Test whether a snapshot frame stores field data
+        :param mcs: simulation step of frame
+        :return: True if the frame stores field data
+        """
+        return self.index['frames'][str(mcs)]['fields']
+
+    def get_keyframe_mcs(self, mcs) -> int:
+        """
+        Get the simulation step of the keyframe from which a snapshot frame is reconstructed
+        :param mcs: simulation step of frame
+        :return: simulation step of nearest keyframe at or before the frame
+        """
+        i = bisect.bisect_left(self._mcs_list, mcs)
+        assert i < len(self._mcs_list) and self._mcs_list[i] == mcs, f'No snapshot frame at step {mcs}'
+        while not self.index['frames'][str(self._mcs_list[i])]['keyframe']:
+            i -= 1
+            assert i >= 0, f'No keyframe for snapshot frame at step {mcs}'
+        return self._mcs_list[i]
+
+    def read_frame(self, mcs) -> dict:
+        """
+        Read a snapshot frame
+        :param mcs: simulation step of frame
+        :return: dictionary with cell type ('cell_type'), cell id ('cell_id') and field ('fields') data; field data is
+            None if not stored by the frame
+        """
+        mcs = int(mcs)
+        keyframe_mcs = self.get_keyframe_mcs(mcs)
+
+        # Continue from the last read frame when it is in the chain of deltas to the requested frame
+        i_end = bisect.bisect_right(self._mcs_list, mcs)
+        if self._last_frame is not None and keyframe_mcs <= self._last_frame[0] < mcs:
+            mcs_start, cell_type, cell_id = self._last_frame
+            chain = self._mcs_list[bisect.bisect_right(self._mcs_list, mcs_start):i_end]
+        else:
+            cell_type, cell_id = None, None
+            chain = self._mcs_list[bisect.bisect_left(self._mcs_list, keyframe_mcs):i_end]
+
+        fields = None
+        for chain_mcs in chain:
+            frame_entry = self.index['frames'][str(chain_mcs)]
+            with np.load(os.path.join(self.loc, frame_entry['file'])) as frame_data:
+                if frame_entry['keyframe']:
+                    cell_type = frame_data['cell_type']
+                    cell_id = frame_data['cell_id']
+                else:
+                    cell_type = cell_type.copy()
+                    cell_id = cell_id.copy()
+                    delta_idx = frame_data['delta_idx']
+                    cell_type.ravel()[delta_idx] = frame_data['delta_cell_type']
+                    cell_id.ravel()[delta_idx] = frame_data['delta_cell_id']
+                if chain_mcs == mcs and frame_entry['fields']:
+                    fields = {k: frame_data[snapshot_field_prefix + k] for k in self.field_names}
+
+        self._last_frame = (mcs, cell_type, cell_id)
+        return {'cell_type': cell_type,
+                'cell_id': cell_id,
+                'fields': fields}
+
+
+def get_occupied_voxels(cell_type, z):
+    """
+    Get the occupied voxels of a layer as coordinate lists, e.g., of the mostly empty immune cell layer
+    :param cell_type: cell type id of every voxel
+    :param z: layer
+    :return: x- and y-coordinates of non-medium voxels of the layer
+    """
+    return np.nonzero(cell_type[:, :, z])
+
+
+def get_cell_type_layer(cell_type, z=None):
+    """
+    Get cell types of a layer
+    :param cell_type: cell type id of every voxel
+    :param z: layer; None selects the top non-medium voxel of every column
+    :return: cell type id of every column
+    """
+    if z is not None:
+        return cell_type[:, :, z]
+    layer = cell_type[:, :, 0].copy()
+    for zi in range(1, cell_type.shape[2]):
+        xi, yi = get_occupied_voxels(cell_type, zi)
+        layer[xi, yi] = cell_type[xi, yi, zi]
+    return layer
+
+
+def get_cell_id_layer(cell_type, cell_id, z=None):
+    """
+    Get cell ids of a layer
+    :param cell_type: cell type id of every voxel
+    :param cell_id: cell id of every voxel
+    :param z: layer; None selects the top non-medium voxel of every column
+    :return: cell id of every column
+    """
+    if z is not None:
+        return cell_id[:, :, z]
+    layer = cell_id[:, :, 0].copy()
+    for zi in range(1, cell_id.shape[2]):
+        xi, yi = get_occupied_voxels(cell_type, zi)
+        layer[xi, yi] = cell_id[xi, yi, zi]
+    return layer
+
+
+def get_cell_border_segments(cell_id_layer):
+    """
+    Get line segments of borders between different cells of a layer, in voxel coordinates
+    :param cell_id_layer: cell id of every voxel of a layer
+    :return: array of segments shaped (segment, 2, 2)
+    """
+    xi, yi = np.nonzero(cell_id_layer[1:, :] != cell_id_layer[:-1, :])
+    seg_x = np.stack([np.stack([xi + 0.5, yi - 0.5], axis=1), np.stack([xi + 0.5, yi + 0.5], axis=1)], axis=1)
+    xi, yi = np.nonzero(cell_id_layer[:, 1:] != cell_id_layer[:, :-1])
+    seg_y = np.stack([np.stack([xi - 0.5, yi + 0.5], axis=1), np.stack([xi + 0.5, yi + 0.5], axis=1)], axis=1)
+    return np.concatenate([seg_x, seg_y], axis=0)
+
+
+def render_snapshot_frame(frame, spec: dict, cell_type_names: dict, ax=None, cell_type_colors=None):
+    """
+    Render a snapshot frame with matplotlib
+    :param frame: snapshot frame; see *SnapshotReader.read_frame*
+    :param spec: rendering specification; see *standard_snapshot_specs*
+    :param cell_type_names: dictionary of cell type names by cell type id
+    :param ax: matplotlib axes to render to; a new figure is created if None
+    :param cell_type_colors: dictionary of colors by cell type name; default is *default_cell_type_colors*
+    :return: matplotlib figure and axes
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import ListedColormap, LogNorm
+
+    if ax is None:
+        fig = plt.figure()
+        ax = fig.add_subplot(111)
+    else:
+        fig = ax.figure
+    if cell_type_colors is None:
+        cell_type_colors = default_cell_type_colors
+
+    z = spec.get('z', None)
+    if spec['data'] == 'cell_type':
+        num_types = max(cell_type_names.keys()) + 1
+        colors = [cell_type_colors.get(cell_type_names.get(i, ''), '#7f7f7f') for i in range(num_types)]
+        img = get_cell_type_layer(frame['cell_type'], z)
+        ax.imshow(img.T, origin='lower', cmap=ListedColormap(colors), vmin=-0.5, vmax=num_types - 0.5,
+                  interpolation='nearest')
+    else:
+        img = frame['fields'][spec['data']][:, :, 0 if z is None else z]
+        if spec.get('log_scale', False):
+            norm = LogNorm(vmin=max(float(img[img > 0].min()) if np.any(img > 0) else 1.0, 1E-12),
+                           vmax=max(float(img.max()), 1E-12))
+            img_plot = ax.imshow(np.where(img > 0, img, np.nan).T, origin='lower', norm=norm, interpolation='nearest')
+        else:
+            img_plot = ax.imshow(img.T, origin='lower', interpolation='nearest')
+        fig.colorbar(img_plot, ax=ax)
+
+    if spec.get('cell_borders', False):
+        segments = get_cell_border_segments(get_cell_id_layer(frame['cell_type'], frame['cell_id'], z))
+        ax.add_collection(LineCollection(segments, colors='#7f7f7f', linewidths=0.5))
+
+    ax.set_title(spec['name'])
+    ax.set_xticks([])
+    ax.set_yticks([])
+    fig.tight_layout()
+
+    return fig, ax
+
+
+def render_snapshots(loc, out_dir, specs=None, mcs_list=None, fig_suffix='.png', cell_type_colors=None) -> None:
+    """
+    Render snapshot frames of a snapshot directory to files
+    Figures of each specification are written to a subdirectory of the output directory named after the specification
+    Field specifications are skipped for frames that do not store field data
+    :param loc: snapshot directory
+    :param out_dir: output directory
+    :param specs: rendering specifications; default is *standard_snapshot_specs*
+    :param mcs_list: simulation steps of frames to render; default is all frames
+    :param fig_suffix: figure file suffix
+    :param cell_type_colors: dictionary of colors by cell type name; default is *default_cell_type_colors*
+    :return: None
+    """
+    import matplotlib.pyplot as plt
+
+    if specs is None:
+        specs = standard_snapshot_specs
+    reader = SnapshotReader(loc)
+    if mcs_list is None:
+        mcs_list = reader.mcs_list
+
+    for spec in specs:
+        spec_dir = os.path.join(out_dir, spec['name'])
+        if not os.path.isdir(spec_dir):
+            os.makedirs(spec_dir)
+
+    cell_type_names = reader.cell_type_names
+    for mcs in mcs_list:
+        frame = reader.read_frame(mcs)
+        for spec in specs:
+            if spec['data'] != 'cell_type' and frame['fields'] is None:
+                continue
+            fig, _ = render_snapshot_frame(frame, spec, cell_type_names, cell_type_colors=cell_type_colors)
+            fig.savefig(os.path.join(out_dir, spec['name'], f"{spec['name']}_{mcs}{fig_suffix}"))
+            plt.close(fig)
@@ -0,0 +1,334 @@
+# This is a library of spatial data structures for the shared coronavirus modeling and simulation project
+# hosted by the Biocomplexity Institute at Indiana University
+# Data structures are plain NumPy and have no dependency on CompuCell3D
+
+import numpy as np
+
+
+class OccupancyGrid:
+    """
+    Occupancy bitmap of a lattice layer with constant-time queries of free square blocks
+    Free blocks are found with an integral image of the bitmap, which is recomputed on the first query after the bitmap
+    changes
+    """
+    def __init__(self, dim_x, dim_y, block_size=1):
+        """
+        :param dim_x: layer dimension along x
+        :param dim_y: layer dimension along y
+        :param block_size: side length of blocks
+        """
+        self.dim_x = int(dim_x)
+        self.dim_y = int(dim_y)
+        self.block_size = int(block_size)
+        self.occupied = np.zeros(shape=(self.dim_x, self.dim_y), dtype=bool)
+        # Simulation step when the bitmap was last rebuilt; maintained by the owner
+        self.step = None
+
+        self._integral = None
+
+    def clear(self) -> None:
+        """
+        Mark all voxels as free
+        :return: None
+        """
+        self.occupied.fill(False)
+        self._integral = None
+
+    def set_occupied(self, x, y, occupied=True) -> None:
+        """
+        Mark voxels as occupied or free
+        :param x: x-coordinates of voxels; scalar or array
+        :param y: y-coordinates of voxels; scalar or array
+        :param occupied: occupancy to set
+        :return: None
+        """
+        self.occupied[x, y] = occupied
+        self._integral = None
+
+    def set_block(self, x, y, occupied=True) -> None:
+        """
+        Mark a block as occupied or free
+        :param x: x-coordinate of block origin
+        :param y: y-coordinate of block origin
+        :param occupied: occupancy to set
+        :return: None
+        """
+        self.occupied[x:x + self.block_size, y:y + self.block_size] = occupied
+        self._integral = None
+
+    def _get_integral(self):
+        if self._integral is None:
+            self._integral = np.zeros(shape=(self.dim_x + 1, self.dim_y + 1), dtype=np.int32)
+            self._integral[1:, 1:] = np.cumsum(np.cumsum(self.occupied, axis=0, dtype=np.int32), axis=1)
+        return self._integral
+
+    def get_block_counts(self):
+        """
+        Get the number of occupied voxels of every block that fits in the layer
+        :return: array of counts shaped (dim_x - block_size + 1, dim_y - block_size + 1), by block origin
+        """
+        s = self._get_integral()
+        b = self.block_size
+        return s[b:, b:] - s[:-b, b:] - s[b:, :-b] + s[:-b, :-b]
+
+    def is_block_free(self, x, y) -> bool:
+        """
+        Test whether a block is free
+        :param x: x-coordinate of block origin
+        :param y: y-coordinate of block origin
+        :return: True if no voxel of the block is occupied
+        """
+        s = self._get_integral()
+        b = self.block_size
+        return s[x + b, y + b] - s[x, y + b] - s[x + b, y] + s[x, y] == 0
+
+    def get_free_blocks(self, x_max=None, y_max=None):
+        """
+        Get the origins of all free blocks
+        :param x_max: exclusive upper bound of x-coordinates of origins; default includes all blocks that fit
+        :param y_max: exclusive upper bound of y-coordinates of origins; default includes all blocks that fit
+        :return: array of origins shaped (block, 2)
+        """
+        free = self.get_block_counts() == 0
+        if x_max is not None:
+            free = free[:max(x_max, 0), :]
+        if y_max is not None:
+            free = free[:, :max(y_max, 0)]
+        return np.argwhere(free)
+
+
+def select_block_sites(candidates, scores, num_sites, block_size, rng=None, weighted=False):
+    """
+    Select sites of non-overlapping blocks from scored candidate sites
+    Sites are selected one at a time, and candidates with blocks that overlap the block of a selected site are removed
+    :param candidates: block origins of candidate sites shaped (candidate, 2)
+    :param scores: score of each candidate (e.g., field value)
+    :param num_sites: number of sites to select
+    :param block_size: side length of blocks
+    :param rng: numpy random number generator; required for weighted selection
+    :param weighted: select randomly with probability proportional to score when True, and with the highest score
+        otherwise; non-positive scores have zero weight, and selection is uniform when no score is positive
+    :return: block origins of selected sites shaped (site, 2); fewer than requested if candidates run out
+    """
+    candidates = np.asarray(candidates).reshape((-1, 2))
+    scores = np.asarray(scores, dtype=float)
+    available = np.ones(shape=(candidates.shape[0],), dtype=bool)
+    selected = []
+    while len(selected) < num_sites and np.any(available):
+        idx_available = np.flatnonzero(available)
+        if weighted:
+            weights = np.clip(scores[idx_available], 0.0, None)
+            if weights.sum() > 0:
+                idx = idx_available[rng.choice(idx_available.shape[0], p=weights / weights.sum())]
+            else:
+                idx = idx_available[rng.integers(0, idx_available.shape[0])]
+        else:
+            idx = idx_available[np.argmax(scores[idx_available])]
+        site = candidates[idx]
+        selected.append(site)
+        available &= np.any(np.abs(candidates - site) >= block_size, axis=1)
+    return np.array(selected, dtype=int).reshape((-1, 2))
+
+
+class SparseLayer:
+    """
+    Coordinate list of the occupied voxels of a mostly empty lattice layer, with the cell id and cell type of each
+    occupied voxel
+    """
+    def __init__(self, dim_x, dim_y):
+        """
+        :param dim_x: layer dimension along x
+        :param dim_y: layer dimension along y
+        """
+        self.dim_x = int(dim_x)
+        self.dim_y = int(dim_y)
+        self.coords = np.zeros(shape=(0, 2), dtype=int)
+        self.cell_id = np.zeros(shape=(0,), dtype=np.int32)
+        self.cell_type = np.zeros(shape=(0,), dtype=np.uint8)
+        # Simulation step when the layer was last rebuilt; maintained by the owner
+        self.step = None
+
+    @property
+    def num_voxels(self) -> int:
+        return self.coords.shape[0]
+
+    def set_voxels(self, coords, cell_id, cell_type) -> None:
+        """
+        Set the occupied voxels of the layer
+        :param coords: coordinates of occupied voxels shaped (voxel, 2)
+        :param cell_id: cell id of each occupied voxel
+        :param cell_type: cell type of each occupied voxel
+        :return: None
+        """
+        self.coords = np.asarray(coords, dtype=int).reshape((-1, 2))
+        self.cell_id = np.asarray(cell_id, dtype=np.int32)
+        self.cell_type = np.asarray(cell_type, dtype=np.uint8)
+
+    def get_bitmap(self):
+        """
+        Get the occupancy bitmap of the layer
+        :return: boolean array shaped (dim_x, dim_y)
+        """
+        bitmap = np.zeros(shape=(self.dim_x, self.dim_y), dtype=bool)
+        bitmap[self.coords[:, 0], self.coords[:, 1]] = True
+        return bitmap
+
+    def fill_layer(self, layer, values) -> None:
+        """
+        Write values of occupied voxels to a dense layer array; unoccupied voxels are not modified
+        :param layer: dense layer array shaped (dim_x, dim_y)
+        :param values: value of each occupied voxel (e.g., cell_id)
+        :return: None
+        """
+        layer[self.coords[:, 0], self.coords[:, 1]] = values
+
+
+class SpatialHash:
+    """
+    Uniform grid of points in a layer for neighborhood queries (e.g., of cell centers of mass)
+    Points are binned into square bins of at least a given size and stored sorted by bin, so that queries only visit
+    bins that intersect the query radius; the hash is rebuilt with set_points whenever points move
+    Distances use the minimum image convention along periodic dimensions
+    """
+    def __init__(self, dim_x, dim_y, bin_size, periodic_x=False, periodic_y=False):
+        """
+        :param dim_x: layer dimension along x
+        :param dim_y: layer dimension along y
+        :param bin_size: minimum side length of bins (e.g., typical query radius)
+        :param periodic_x: layer is periodic along x
+        :param periodic_y: layer is periodic along y
+        """
+        self.dim_x = float(dim_x)
+        self.dim_y = float(dim_y)
+        self.bin_size = float(bin_size)
+        self.periodic_x = bool(periodic_x)
+        self.periodic_y = bool(periodic_y)
+        self.num_bins_x = max(int(self.dim_x // self.bin_size), 1)
+        self.num_bins_y = max(int(self.dim_y // self.bin_size), 1)
+        self.bin_size_x = self.dim_x / self.num_bins_x
+        self.bin_size_y = self.dim_y / self.num_bins_y
+        # Simulation step when the hash was last rebuilt; maintained by the owner
+        self.step = None
+
+        self.points = np.zeros(shape=(0, 2), dtype=float)
+        self.ids = np.zeros(shape=(0,), dtype=np.int64)
+        self._bin_start = np.zeros(shape=(self.num_bins_x * self.num_bins_y + 1,), dtype=np.int64)
+
+    @property
+    def num_points(self) -> int:
+        return self.points.shape[0]
+
+    def _get_bin_coords(self, x, y):
+        bx = np.clip(np.floor(np.asarray(x) / self.bin_size_x).astype(int), 0, self.num_bins_x - 1)
+        by = np.clip(np.floor(np.asarray(y) / self.bin_size_y).astype(int), 0, self.num_bins_y - 1)
+        return bx, by
+
+    def set_points(self, points, ids) -> None:
+        """
+        Set the points of the hash
+        :param points: coordinates of points shaped (point, 2)
+        :param ids: id of each point (e.g., cell id)
+        :return: None
+        """
+        points = np.asarray(points, dtype=float).reshape((-1, 2))
+        ids = np.asarray(ids, dtype=np.int64).reshape((-1,))
+        bx, by = self._get_bin_coords(points[:, 0], points[:, 1])
+        bins = bx * self.num_bins_y + by
+        order = np.argsort(bins, kind='stable')
+        self.points = points[order]
+        self.ids = ids[order]
+        counts = np.bincount(bins, minlength=self.num_bins_x * self.num_bins_y)
+        self._bin_start = np.zeros(shape=(counts.shape[0] + 1,), dtype=np.int64)
+        np.cumsum(counts, out=self._bin_start[1:])
+
+    def _get_bin_range(self, b, num_bins, n, periodic):
+        if periodic:
+            if 2 * n + 1 >= num_bins:
+                return np.arange(num_bins)
+            return np.arange(b - n, b + n + 1) % num_bins
+        return np.arange(max(b - n, 0), min(b + n, num_bins - 1) + 1)
+
+    def _get_candidates(self, x, y, radius):
+        bx, by = self._get_bin_coords(x, y)
+        nx = int(np.ceil(radius / self.bin_size_x))
+        ny = int(np.ceil(radius / self.bin_size_y))
+        range_x = self._get_bin_range(int(bx), self.num_bins_x, nx, self.periodic_x)
+        range_y = self._get_bin_range(int(by), self.num_bins_y, ny, self.periodic_y)
+        bins = (range_x[:, None] * self.num_bins_y + range_y[None, :]).ravel()
+        starts = self._bin_start[bins]
+        stops = self._bin_start[bins + 1]
+        if not np.any(stops > starts):
+            return np.zeros(shape=(0,), dtype=np.int64)
+        return np.concatenate([np.arange(s0, s1) for s0, s1 in zip(starts, stops) if s1 > s0])
+
+    def get_distances(self, x, y, idx=None):
+        """
+        Get the distances from a location to points of the hash
+        :param x: x-coordinate of location
+        :param y: y-coordinate of location
+        :param idx: indices of points in *points*; default is all points
+        :return: array of distances
+        """
+        points = self.points if idx is None else self.points[idx]
+        dx = points[:, 0] - x
+        dy = points[:, 1] - y
+        if self.periodic_x:
+            dx -= self.dim_x * np.round(dx / self.dim_x)
+        if self.periodic_y:
+            dy -= self.dim_y * np.round(dy / self.dim_y)
+        return np.sqrt(dx * dx + dy * dy)
+
+    def query_radius(self, x, y, radius, return_distances=False):
+        """
+        Find the points within a radius of a location
+        :param x: x-coordinate of location
+        :param y: y-coordinate of location
+        :param radius: query radius; points at the radius are included
+        :param return_distances: also return distances
+        :return: ids of points, sorted by distance; and distances, if requested
+        """
+        idx = self._get_candidates(x, y, radius)
+        dist = self.get_distances(x, y, idx)
+        in_radius = dist <= radius
+        idx, dist = idx[in_radius], dist[in_radius]
+        order = np.argsort(dist, kind='stable')
+        if return_distances:
+            return self.ids[idx[order]], dist[order]
+        return self.ids[idx[order]]
+
+    def count_radius(self, x, y, radius) -> int:
+        """
+        Count the points within a radius of a location
+        :param x: x-coordinate of location
+        :param y: y-coordinate of location
+        :param radius: query radius; points at the radius are included
+        :return: number of points
+        """
+        idx = self._get_candidates(x, y, radius)
+        return int(np.sum(self.get_distances(x, y, idx) <= radius))
+
+    def query_nearest(self, x, y, k, max_radius=None, return_distances=False):
+        """
+        Find the k nearest points of a location
+        The search radius starts at one bin and doubles until k points are found within it
+        :param x: x-coordinate of location
+        :param y: y-coordinate of location
+        :param k: number of points
+        :param max_radius: maximum distance of points; default is unbounded
+        :param return_distances: also return distances
+        :return: ids of points, sorted by distance; and distances, if requested; fewer than k if points run out
+        """
+        radius = max(self.bin_size_x, self.bin_size_y)
+        radius_all = np.sqrt(self.dim_x ** 2 + self.dim_y ** 2)
+        if max_radius is not None:
+            radius_all = min(radius_all, max_radius)
+        while True:
+            radius = min(radius, radius_all)
+            ids, dist = self.query_radius(x, y, radius, return_distances=True)
+            if ids.shape[0] >= k or radius >= radius_all:
+                break
+            radius *= 2
+        ids, dist = ids[:k], dist[:k]
+        if return_distances:
+            return ids, dist
+        return ids
@@ -50,3 +50,103 @@ def hill_equation(val, diss_cf, hill_cf):
         return 0
     else:
         return 1 / (1 + (diss_cf / val) ** hill_cf)
+
+
+def hill_equation_array(val, diss_cf, hill_cf):
+    """
+    Hill equation of an array of values; see *hill_equation*
+    :param val: array of input values
+    :param diss_cf: dissociation coefficient
+    :param hill_cf: Hill coefficient
+    :return: array of Hill equation for each input value
+    """
+    import numpy as np
+    val = np.asarray(val, dtype=float)
+    res = np.zeros(shape=val.shape)
+    mask = val != 0
+    res[mask] = 1 / (1 + (diss_cf / val[mask]) ** hill_cf)
+    return res
+
+
+class RandomStreams:
+    """
+    Collection of independent, reproducible random number generators derived from a single seed
+    Each subsystem of a model draws from its own stream, so that changes in the number of draws of one subsystem do
+    not perturb the draws of another; this keeps runs with equal seeds comparable between parameter sets (common
+    random numbers)
+    """
+    def __init__(self, seed=None):
+        """
+        :param seed: seed of all streams; if None, fresh entropy is drawn and can be retrieved with *seed*
+        """
+        import numpy as np
+        self.__seed_seq = np.random.SeedSequence(seed)
+        self.__streams = dict()
+
+    @property
+    def seed(self):
+        """
+        Seed from which all streams are derived; passing this to a new instance reproduces all streams
+        """
+        return self.__seed_seq.entropy
+
+    @staticmethod
+    def stream_key(name: str) -> int:
+        """
+        Stable integer key of a named stream
+        :param name: name of stream
+        :return: integer key of stream
+        """
+        import zlib
+        return zlib.crc32(name.encode())
+
+    def get_stream(self, name: str):
+        """
+        Get the random number generator of a named stream; generators are created on first request
+        :param name: name of stream (e.g., name of a subsystem)
+        :return: numpy random number generator of the stream
+        """
+        if name not in self.__streams.keys():
+            import numpy as np
+            seed_seq = np.random.SeedSequence(self.__seed_seq.entropy,
+                                              spawn_key=(self.stream_key(name),))
+            self.__streams[name] = np.random.default_rng(seed_seq)
+        return self.__streams[name]
+
+    def get_seed(self, name: str, key: int = 0) -> int:
+        """
+        Get an integer seed of a named stream for seeding an external generator (e.g., of a simulation engine)
+        :param name: name of stream
+        :param key: integer key of seed within the stream (e.g., a restart count)
+        :return: positive 31-bit integer seed
+        """
+        import numpy as np
+        seed_seq = np.random.SeedSequence(self.__seed_seq.entropy, spawn_key=(self.stream_key(name), key))
+        return int(seed_seq.generate_state(1, np.uint32)[0] % (2 ** 31 - 1)) + 1
+
+    def get_state(self) -> dict:
+        """
+        Get the state of all streams
+        :return: dictionary of bit generator states by stream name
+        """
+        return {k: v.bit_generator.state for k, v in self.__streams.items()}
+
+    def set_state(self, state: dict):
+        """
+        Set the state of streams
+        :param state: dictionary of bit generator states by stream name, as returned by *get_state*
+        :return: None
+        """
+        for name, bg_state in state.items():
+            self.get_stream(name).bit_generator.state = bg_state
+
+
+def derive_seed(seed, key: int) -> int:
+    """
+    Derive an integer seed from a seed and an integer key, e.g., for seeding a run of a batch
+    :param seed: base seed
+    :param key: integer key (e.g., a run or replicate index)
+    :return: derived integer seed
+    """
+    import numpy as np
+    return int(np.random.SeedSequence(seed, spawn_key=(key,)).generate_state(1, np.uint64)[0])